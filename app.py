@@ -1,13 +1,14 @@
 import tkinter as tk
 from tkinter import messagebox, filedialog
 import torch
-import os
-import soundfile as sf
-from kokoro import KPipeline
 import time
 import platform
 from pygame import mixer  # Replaces playsound for cross-platform audio
 import logging
+from bsbp_tts_cache import SegmentCache, SegmentMemo
+from bsbp_tts_pipelines import PipelineRegistry
+from bsbp_tts_audio import OutputFormat, StreamingEncoder, WavReader
+from bsbp_tts_backends import KokoroBackend, SynthesisStats
 
 class KokoroTTSApp:
     def __init__(self, root):
@@ -27,6 +28,16 @@ class KokoroTTSApp:
         self.current_audio = None
         self.voice = "af_heart"
         self.lang_code = "a"
+        self.repo_id = "hexgrad/Kokoro-82M"
+        self.memo = SegmentMemo()
+        self.output_format = OutputFormat()
+        self.registry = PipelineRegistry(repo_id=self.repo_id)
+        try:
+            self.cache = SegmentCache()
+        except OSError as e:
+            self.cache = None
+            logging.warning(f'Segment cache disabled: {str(e)}')
+        self.backend = KokoroBackend(self.repo_id, self.cache, self.registry)
 
         # Color scheme
         self.bg_color = "#1A1A2E"
@@ -98,6 +109,22 @@ class KokoroTTSApp:
                                     length=250, highlightthickness=0)
         self.speed_scale.pack(side=tk.LEFT)
 
+        self.cache_frame = tk.Frame(root, bg=self.accent_color, padx=10, pady=5)
+        self.cache_frame.pack(fill="x", padx=20, pady=5)
+
+        self.cache_var = tk.BooleanVar(value=self.cache is not None)
+        self.cache_check = tk.Checkbutton(self.cache_frame, text="Use segment cache", variable=self.cache_var,
+                                          fg=self.fg_color, bg=self.accent_color, selectcolor="#2A2A3E",
+                                          activebackground=self.accent_color, activeforeground=self.fg_color,
+                                          font=("Arial", 12), state="normal" if self.cache is not None else "disabled")
+        self.cache_check.pack(side=tk.LEFT, padx=5)
+
+        self.clear_cache_button = tk.Button(self.cache_frame, text="Clear Cache", fg=self.fg_color, bg=self.button_color,
+                                           font=("Arial", 10, "bold"), command=self.clear_cache,
+                                           activebackground=self.button_hover, activeforeground=self.fg_color,
+                                           highlightthickness=0, highlightbackground=self.button_color, relief="flat", borderwidth=0)
+        self.clear_cache_button.pack(side=tk.RIGHT, padx=5)
+
         self.generate_button = tk.Button(root, text="Generate Audio", fg=self.fg_color, bg=self.button_color,
                                         font=("Arial", 12, "bold"), command=self.generate_audio,
                                         activebackground=self.button_hover, activeforeground=self.fg_color,
@@ -173,7 +200,7 @@ class KokoroTTSApp:
             start_time = time.time()
             self.lang_code = self.lang_var.get()
             self.log_message(f"Initializing pipeline with language: {self.lang_options.get(self.lang_code, self.lang_code)}")
-            self.pipeline = KPipeline(lang_code=self.lang_code)
+            self.pipeline = self.registry.get(self.lang_code)
             init_time = time.time() - start_time
             self.log_message(f"Pipeline initialized successfully! Time taken: {init_time:.2f} seconds")
         except Exception as e:
@@ -206,22 +233,23 @@ class KokoroTTSApp:
 
             # Generation phase
             generation_start = time.time()
-            generator = self.pipeline(text, voice=self.voice, speed=speed, split_pattern=r'\n+')
-            all_audio = []
-            for i, (gs, ps, audio) in enumerate(generator):
-                self.log_message(f"Generated segment {i+1}")
-                all_audio.append(audio)
+            stats = SynthesisStats(self.backend.sample_rate)
+            self.release_audio()
+            buffer = self.backend.render(text, self.voice, speed, stats=stats, lang_code=self.lang_code, memo=self.memo,
+                                         use_cache=self.cache_var.get())
             generation_time = time.time() - generation_start
+            self.log_message(f"Synthesis: {stats.describe()}")
+            if self.cache is not None and self.cache_var.get():
+                self.log_message(self.cache.stats())
 
             # Compilation phase
             compilation_start = time.time()
-            if all_audio:
-                combined_audio = torch.cat(all_audio, dim=0).numpy()
-                audio_file = os.path.join(os.getcwd(), "output.wav")  # Cross-platform path
-                sf.write(audio_file, combined_audio, 24000)
-                self.log_message(f"Audio generated and saved as: {audio_file}")
-                self.current_audio = audio_file
+            if len(buffer):
+                # The buffer is kept for playback and saving, which read from its view; nothing is copied
+                self.current_audio = buffer
+                self.log_message(f"Audio generated: {len(buffer) / self.backend.sample_rate:.2f} seconds")
             else:
+                buffer.close()
                 self.log_message("No audio segments were generated.")
             compilation_time = time.time() - compilation_start
 
@@ -235,19 +263,25 @@ class KokoroTTSApp:
         finally:
             self.hide_loading()
 
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+            logging.info('Segment cache cleared.')
+            self.log_message("Segment cache cleared.")
+
     def play_audio(self):
-        if hasattr(self, "current_audio") and self.current_audio and os.path.exists(self.current_audio):
+        if self.current_audio:
             self.stop_audio()  # Ensure any previous playback is stopped
-            logging.info(f'Playing audio: {self.current_audio}')
-            self.log_message(f"Playing audio: {self.current_audio}")
+            logging.info('Playing audio.')
+            self.log_message("Playing audio.")
             try:
-                mixer.music.load(self.current_audio)
+                mixer.music.load(WavReader(self.current_audio.view(), self.backend.sample_rate), "wav")
                 mixer.music.play()
             except Exception as e:
                 self.log_message(f"Error playing audio: {str(e)}")
                 messagebox.showerror("Error", "Failed to play audio. Check log.")
         else:
-            self.log_message("No audio to play or file not found.")
+            self.log_message("No audio to play.")
             messagebox.showwarning("Warning", "Generate audio first.")
 
     def pause_audio(self):
@@ -265,27 +299,30 @@ class KokoroTTSApp:
             self.log_message("Audio playback stopped.")
 
     def save_audio(self):
-        if hasattr(self, "current_audio") and self.current_audio and os.path.exists(self.current_audio):
+        if self.current_audio:
             save_path = filedialog.asksaveasfilename(defaultextension=".wav", filetypes=[("WAV files", "*.wav")], title="Save Audio As")
             if save_path:
-                import shutil
-                shutil.copy(self.current_audio, save_path)
+                with StreamingEncoder(save_path, self.backend.sample_rate, self.output_format, "wav") as encoder:
+                    for chunk in self.current_audio.chunks():
+                        encoder.write(chunk)
                 logging.info(f'Audio saved to: {save_path}')
                 self.log_message(f"Audio saved to: {save_path}")
         else:
-            self.log_message("No audio to save or file not found.")
+            self.log_message("No audio to save.")
             messagebox.showwarning("Warning", "Generate audio first.")
 
+    def release_audio(self):
+        if self.current_audio is not None:
+            self.stop_audio()
+            mixer.music.unload()  # pygame keeps reading from the WavReader until it is unloaded
+            self.current_audio.close()
+            self.current_audio = None
+
     def on_closing(self):
         logging.info('Application closed.')
         self.stop_audio()  # Stop any playing audio
+        self.release_audio()
         mixer.quit()  # Properly dispose of pygame mixer
-        if self.current_audio and os.path.exists(self.current_audio):
-            try:
-                os.remove(self.current_audio)  # Clean up temporary audio file
-                logging.info(f'Temporary audio file {self.current_audio} removed.')
-            except Exception as e:
-                logging.warning(f'Failed to remove temporary audio file: {str(e)}')
         self.root.destroy()
 
 def main():
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bsbp_tts_audio import resample, resample_polyphase
+
+SOURCE_RATE = 24000
+
+
+def run(name, function, audio, target_rate):
+    start = time.perf_counter()
+    out = function(audio, target_rate)
+    seconds = time.perf_counter() - start
+    audio_seconds = len(audio) / SOURCE_RATE
+    print(f"{name:>8} 24000 -> {target_rate:>5}: {seconds:7.2f}s for {audio_seconds / 3600:.2f} h "
+          f"({audio_seconds / seconds:8.0f}x real time, {len(audio) / seconds / 1e6:6.1f} Msamples/s, {len(out)} samples out)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resampler throughput on long Kokoro-rate input.")
+    parser.add_argument("--seconds", type=float, default=3600, help="Input length in seconds (default one hour)")
+    parser.add_argument("--rates", default="22050,44100,48000,16000", help="Comma-separated target rates")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(int(args.seconds * SOURCE_RATE), dtype=np.float32) * 0.1)
+
+    start = time.perf_counter()
+    same = resample(audio, SOURCE_RATE, SOURCE_RATE)
+    print(f"passthrough: {(time.perf_counter() - start) * 1e6:.1f} us, copied: {same is not audio}")
+
+    try:
+        from scipy.signal import resample_poly
+    except ImportError:
+        resample_poly = None
+        print("scipy not installed; only the numpy resampler is measured")
+
+    for target_rate in (int(rate) for rate in args.rates.split(",")):
+        divisor = np.gcd(SOURCE_RATE, target_rate)
+        up, down = target_rate // divisor, SOURCE_RATE // divisor
+        run("numpy", lambda x, rate: resample_polyphase(x, up, down), audio, target_rate)
+        if resample_poly is not None:
+            run("scipy", lambda x, rate: resample_poly(x, up, down), audio, target_rate)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bsbp_tts_segmenter import pack_segments, estimate_tokens
+from bench_tts import (CHAPTER_PARAGRAPHS, DEFAULT_RESULTS_DIR, LANG_VOICES, CaseMemory, environment, make_backend,
+                       percentile, run_once)
+
+# The chapter three ways: as written, one sentence per line (subtitles, chat logs) and as a single
+# paragraph with no line breaks at all (pasted PDFs)
+CASES = ("chapter", "lines", "wall")
+DEFAULT_TARGETS = "0,50,100,150,200,300,400"
+
+
+def corpus(case, chapter_repeats):
+    paragraphs = CHAPTER_PARAGRAPHS * chapter_repeats
+    if case == "chapter":
+        return "\n\n".join(paragraphs)
+    if case == "lines":
+        return "\n".join(sentence for paragraph in paragraphs for sentence in pack_segments(paragraph, 1))
+    return " ".join(paragraphs)
+
+
+def bench_target(backend, engine, case, text, target_tokens, repeats, warmup):
+    start = time.perf_counter()
+    segments = pack_segments(text, target_tokens)
+    split_ms = (time.perf_counter() - start) * 1000
+    options = {"target_tokens": target_tokens}
+    with CaseMemory() as memory:
+        for _ in range(warmup):
+            run_once(backend, text, LANG_VOICES['a'], 'a', options)
+        runs = [run_once(backend, text, LANG_VOICES['a'], 'a', options) for _ in range(repeats)]
+    latencies = [latency for stats, run_latencies in runs for latency in run_latencies]
+    audio_seconds = sum(stats.audio_seconds for stats, _ in runs)
+    wall_seconds = sum(stats.elapsed for stats, _ in runs)
+    ttfa = [stats.first_chunk_seconds for stats, _ in runs if stats.first_chunk_seconds is not None]
+    sizes = [estimate_tokens(segment) for segment in segments]
+    return {
+        "engine": engine,
+        "case": case,
+        "target_tokens": target_tokens,
+        "segments": len(segments),
+        "segment_tokens": {"mean": float(np.mean(sizes)) if sizes else None, "max": max(sizes, default=None)},
+        "split_ms": split_ms,
+        "audio_seconds": audio_seconds / repeats,
+        "rtf": wall_seconds / audio_seconds if audio_seconds else None,
+        "throughput": audio_seconds / wall_seconds if wall_seconds else None,
+        "ttfa_seconds": float(np.mean(ttfa)) if ttfa else None,
+        "segment_latency_seconds": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95)},
+        **memory.report(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput and latency versus segment size (bsbp_tts_segmenter target tokens).")
+    parser.add_argument("--engine", choices=("kokoro", "fake"), default="kokoro", help="fake checks the harness without a model")
+    parser.add_argument("--targets", default=DEFAULT_TARGETS, help="Comma-separated target tokens; 0 is one segment per line")
+    parser.add_argument("--cases", default=",".join(CASES), help="Comma-separated: chapter, lines, wall")
+    parser.add_argument("--chapter-repeats", type=int, default=2, help="Times the chapter paragraphs are repeated")
+    parser.add_argument("--repeats", type=int, default=2, help="Measured runs per target")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured runs per target first")
+    parser.add_argument("--output", default=None, help="JSON results path (default benchmarks/results/bench_segmenter_<commit>_<time>.json)")
+    args = parser.parse_args(argv)
+
+    targets = [int(target) for target in args.targets.split(",") if target]
+    cases = [case for case in args.cases.split(",") if case]
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"unknown case: {', '.join(unknown)}")
+
+    info = environment()
+    backend = make_backend(args.engine)
+    results = []
+    print(f"{'case':<8} {'target':>6} {'segs':>5} {'tokens':>6} {'split ms':>8} {'RTF':>7} {'x RT':>7} {'TTFA s':>7} {'p50 s':>7} {'p95 s':>7}")
+    for case in cases:
+        text = corpus(case, args.chapter_repeats)
+        case_results = []
+        for target_tokens in targets:
+            result = bench_target(backend, args.engine, case, text, target_tokens, args.repeats, args.warmup)
+            case_results.append(result)
+            latency = result["segment_latency_seconds"]
+            print(f"{case:<8} {target_tokens:>6} {result['segments']:>5} {result['segment_tokens']['mean'] or 0:>6.0f} "
+                  f"{result['split_ms']:>8.2f} {result['rtf']:>7.3f} {result['throughput']:>7.2f} {result['ttfa_seconds']:>7.3f} "
+                  f"{latency['p50']:>7.3f} {latency['p95']:>7.3f}")
+        fastest = max(case_results, key=lambda result: result["throughput"] or 0)
+        soonest = min(case_results, key=lambda result: result["ttfa_seconds"] or float("inf"))
+        print(f"{case}: best throughput at {fastest['target_tokens']} tokens, first audio soonest at {soonest['target_tokens']}")
+        results += case_results
+
+    output = args.output
+    if output is None:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"bench_segmenter_{(info['commit'] or 'unknown')[:10]}_{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"environment": info, "arguments": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
+    print(f"\nResults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
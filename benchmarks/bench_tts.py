@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bsbp_tts_backends import FakeBackend, KokoroBackend, OrpheusBackend, SynthesisStats
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# Every lang_code of the Kokoro language combo, with the voice used for it
+LANG_VOICES = {
+    'a': "af_heart", 'b': "bf_emma", 'e': "ef_dora", 'f': "ff_siwis", 'h': "hf_alpha",
+    'i': "if_sara", 'j': "jf_alpha", 'p': "pf_dora", 'z': "zf_xiaobei",
+}
+ORPHEUS_VOICE = "tara"
+
+# Fixed corpus; never edit existing entries, or results stop being comparable across commits
+SHORT = {
+    'a': "The quick brown fox jumps over the lazy dog.",
+    'b': "The weather in London is rather grey today.",
+    'e': "El rápido zorro marrón salta sobre el perro perezoso.",
+    'f': "Le rapide renard brun saute par-dessus le chien paresseux.",
+    'h': "तेज़ भूरी लोमड़ी आलसी कुत्ते के ऊपर कूदती है।",
+    'i': "La veloce volpe marrone salta sopra il cane pigro.",
+    'j': "素早い茶色の狐が怠け者の犬を飛び越える。",
+    'p': "A rápida raposa marrom pula sobre o cão preguiçoso.",
+    'z': "敏捷的棕色狐狸跳过了懒惰的狗。",
+}
+PARAGRAPH = {
+    'a': ("Speech synthesis has come a long way in the last few years. Modern models produce voices that are "
+          "hard to tell apart from a human reader, and they run on an ordinary laptop. The remaining challenge "
+          "is speed: long documents still take minutes, and every second of waiting is noticed."),
+    'b': ("The train left the station a few minutes late, as it so often does. Passengers settled into their "
+          "seats with newspapers and cups of tea, while the countryside rolled past the windows in shades of "
+          "green and brown."),
+    'e': ("La síntesis de voz ha avanzado mucho en los últimos años. Los modelos modernos producen voces muy "
+          "naturales y funcionan en un ordenador portátil normal. El reto que queda es la velocidad en "
+          "documentos largos."),
+    'f': ("La synthèse vocale a beaucoup progressé ces dernières années. Les modèles modernes produisent des "
+          "voix très naturelles et fonctionnent sur un ordinateur portable ordinaire. Le défi restant est la "
+          "vitesse sur les longs documents."),
+    'h': ("पिछले कुछ वर्षों में वाक् संश्लेषण ने बहुत प्रगति की है। आधुनिक मॉडल बहुत स्वाभाविक आवाज़ें बनाते हैं और "
+          "साधारण लैपटॉप पर चलते हैं। लंबे दस्तावेज़ों पर गति अब भी एक चुनौती है।"),
+    'i': ("La sintesi vocale ha fatto molti progressi negli ultimi anni. I modelli moderni producono voci molto "
+          "naturali e funzionano su un normale computer portatile. La sfida rimasta è la velocità sui "
+          "documenti lunghi."),
+    'j': ("音声合成はここ数年で大きく進歩しました。最新のモデルはとても自然な声を作り、普通のノートパソコンで"
+          "動きます。長い文書での速度はまだ課題です。"),
+    'p': ("A síntese de voz avançou muito nos últimos anos. Os modelos modernos produzem vozes muito naturais e "
+          "funcionam num computador portátil comum. O desafio que resta é a velocidade em documentos longos."),
+    'z': "语音合成在过去几年里取得了很大进步。现代模型能生成非常自然的声音，并且可以在普通笔记本电脑上运行。长文档的速度仍然是一个挑战。",
+}
+# An English chapter: CHAPTER_PARAGRAPHS fixed paragraphs, separated like a real document
+CHAPTER_PARAGRAPHS = [
+    PARAGRAPH['a'],
+    ("It was late in the evening when the last visitors left the library. The reading room, usually full of "
+     "quiet murmurs and turning pages, fell completely silent. Only the old clock above the door kept time."),
+    ("Margaret gathered the returned books onto a trolley and began the slow walk between the shelves. She knew "
+     "every aisle by heart, and she liked this hour best, when the building seemed to breathe on its own."),
+    ("Near the back wall she found a volume that did not belong to the collection. Its cover was plain, its "
+     "spine unmarked, and when she opened it, the first page held a single line written by hand."),
+    ("She read the line twice, then a third time, and felt the hair on her arms rise. It was her own name, "
+     "followed by a date that was still three days away."),
+]
+CASES = ("short", "paragraph", "chapter")
+ENGINES = ("kokoro", "orpheus", "fake")
+
+
+def corpus(case, lang_code, chapter_repeats):
+    if case == "short":
+        return SHORT[lang_code]
+    if case == "paragraph":
+        return PARAGRAPH[lang_code]
+    return "\n\n".join(CHAPTER_PARAGRAPHS * chapter_repeats)
+
+
+def peak_rss_mb():
+    # Peak over the whole process so far: the model and every earlier case included
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    # Resident memory right now, from /proc or psutil; None where neither is available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+# Memory of one case (warm-up and measured runs). Current RSS is sampled on a thread, so the peak is this
+# case's own rather than the process' lifetime peak. Without /proc or psutil only the growth of the
+# lifetime peak is known, which is 0 for a case that stays below an earlier one.
+class CaseMemory:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.start = None
+        self.peak = None
+        self.start_peak = None
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __enter__(self):
+        self.start_peak = peak_rss_mb()
+        self.start = self.peak = current_rss_mb()
+        if self.start is not None:
+            self.thread = threading.Thread(target=self.sample, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.peak = max(self.peak, current_rss_mb())
+
+    def report(self):
+        process_peak = peak_rss_mb()
+        if self.start is not None:
+            growth = self.peak - self.start
+        else:
+            growth = process_peak - self.start_peak if process_peak is not None else None
+        return {"peak_rss_mb": self.peak, "rss_growth_mb": growth, "process_peak_rss_mb": process_peak}
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def run_once(backend, text, voice, lang_code, options):
+    # One synthesis; segment latency is the wait for each chunk since the previous one (or the request)
+    stats = SynthesisStats(backend.sample_rate)
+    latencies = []
+    last = time.perf_counter()
+    for audio in backend.stream(text, voice, 1.0, stats=stats, lang_code=lang_code, **options):
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+    return stats, latencies
+
+
+def bench_case(backend, engine, case, lang_code, voice, text, repeats, warmup, options):
+    with CaseMemory() as memory:
+        for _ in range(warmup):
+            run_once(backend, text, voice, lang_code, options)
+        runs = [run_once(backend, text, voice, lang_code, options) for _ in range(repeats)]
+    latencies = [latency for stats, run_latencies in runs for latency in run_latencies]
+    audio_seconds = sum(stats.audio_seconds for stats, _ in runs)
+    wall_seconds = sum(stats.elapsed for stats, _ in runs)
+    ttfa = [stats.first_chunk_seconds for stats, _ in runs if stats.first_chunk_seconds is not None]
+    return {
+        "engine": engine,
+        "case": case,
+        "lang": lang_code,
+        "voice": voice,
+        "chars": len(text),
+        "repeats": repeats,
+        "audio_seconds": audio_seconds / repeats,
+        "wall_seconds": wall_seconds / repeats,
+        "rtf": wall_seconds / audio_seconds if audio_seconds else None,
+        "throughput": audio_seconds / wall_seconds if wall_seconds else None,  # Audio seconds per wall second
+        "ttfa_seconds": {"mean": float(np.mean(ttfa)) if ttfa else None, "min": min(ttfa, default=None)},
+        "segment_latency_seconds": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                                    "p99": percentile(latencies, 99), "max": max(latencies, default=None)},
+        "segments": len(latencies) // repeats,
+        **memory.report(),
+    }
+
+
+def make_backend(engine):
+    if engine == "kokoro":
+        return KokoroBackend(cache=None)  # Measure synthesis, not the segment cache
+    if engine == "orpheus":
+        backend = OrpheusBackend()
+        backend.load()
+        return backend
+    return FakeBackend(real_time_factor=0.01, first_chunk_seconds=0.01)
+
+
+def plan(engine, langs, cases):
+    # (case, lang_code, voice); Orpheus is English-only
+    for case in cases:
+        for lang_code in (langs if case != "chapter" else ['a']):
+            if engine == "orpheus":
+                if lang_code == 'a':
+                    yield case, lang_code, ORPHEUS_VOICE
+            else:
+                yield case, lang_code, LANG_VOICES[lang_code]
+
+
+def environment():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+    info = {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+        info["cuda"] = torch.cuda.is_available()
+    except ImportError:
+        pass
+    return info
+
+
+def key(result):
+    return f"{result['engine']}/{result['case']}/{result['lang']}"
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {key(result): result for result in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (ratio new/old, below 1 is better):")
+    for result in results:
+        old = baseline.get(key(result))
+        if old is None:
+            continue
+        ratios = []
+        for name, new_value, old_value in (("RTF", result["rtf"], old["rtf"]),
+                                           ("TTFA", result["ttfa_seconds"]["mean"], old["ttfa_seconds"]["mean"]),
+                                           ("p95", result["segment_latency_seconds"]["p95"], old["segment_latency_seconds"]["p95"])):
+            if new_value is not None and old_value:
+                ratios.append(f"{name} {new_value / old_value:.2f}x")
+        print(f"  {key(result):<24} {', '.join(ratios)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Real-time factor, latency and memory of the TTS backends on a fixed corpus.")
+    parser.add_argument("--engines", default="kokoro", help="Comma-separated: kokoro, orpheus, fake (model-free harness check)")
+    parser.add_argument("--langs", default=",".join(LANG_VOICES), help="Comma-separated Kokoro lang_codes (default all)")
+    parser.add_argument("--cases", default=",".join(CASES), help="Comma-separated: short, paragraph, chapter")
+    parser.add_argument("--chapter-repeats", type=int, default=4, help="Times the chapter paragraphs are repeated")
+    parser.add_argument("--repeats", type=int, default=3, help="Measured runs per case")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Unmeasured runs per case first, so pipeline creation and voice loading are not measured")
+    parser.add_argument("--no-batch", action="store_true", help="Orpheus: one request at a time instead of batched sentences")
+    parser.add_argument("--output", default=None, help="JSON results path (default benchmarks/results/<commit>_<time>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    engines = [engine for engine in args.engines.split(",") if engine]
+    langs = [lang for lang in args.langs.split(",") if lang]
+    cases = [case for case in args.cases.split(",") if case]
+    unknown = ([engine for engine in engines if engine not in ENGINES] + [lang for lang in langs if lang not in LANG_VOICES]
+               + [case for case in cases if case not in CASES])
+    if unknown:
+        parser.error(f"unknown engine, lang_code or case: {', '.join(unknown)}")
+
+    info = environment()
+    results = []
+    print(f"{'engine/case/lang':<24} {'audio s':>8} {'RTF':>7} {'TTFA s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'x RT':>7} {'RSS MB':>8} {'+MB':>6}")
+    for engine in engines:
+        load_start = time.perf_counter()
+        backend = make_backend(engine)
+        options = {"batch": not args.no_batch} if engine == "orpheus" else {}
+        load_seconds = time.perf_counter() - load_start
+        info.setdefault("load_seconds", {})[engine] = load_seconds
+        info.setdefault("capabilities", {})[engine] = backend.capabilities.describe()
+        for case, lang_code, voice in plan(engine, langs, cases):
+            text = corpus(case, lang_code, args.chapter_repeats)
+            result = bench_case(backend, engine, case, lang_code, voice, text, args.repeats, args.warmup, options)
+            results.append(result)
+            latency = result["segment_latency_seconds"]
+            print(f"{key(result):<24} {result['audio_seconds']:8.2f} {result['rtf']:7.3f} {result['ttfa_seconds']['mean']:7.3f} "
+                  f"{latency['p50']:7.3f} {latency['p95']:7.3f} {latency['p99']:7.3f} {result['throughput']:7.2f} "
+                  f"{result['peak_rss_mb'] or 0:8.0f} {result['rss_growth_mb'] or 0:6.0f}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"bench_tts_{(info['commit'] or 'unknown')[:10]}_{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"environment": info, "arguments": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
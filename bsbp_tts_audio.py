@@ -0,0 +1,386 @@
+import io
+import os
+import math
+import wave
+import struct
+import tempfile
+import numpy as np
+from bsbp_tts_profile import stage
+
+SUBTYPES = ("PCM_16", "PCM_24", "PCM_32", "FLOAT")
+# encoding: (extension, soundfile container, usable subtypes, the first being the fallback)
+ENCODINGS = {
+    "wav": (".wav", "WAV", SUBTYPES),
+    "flac": (".flac", "FLAC", ("PCM_24", "PCM_16")),
+    "opus": (".opus", "OGG", ("OPUS",)),
+}
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+DEFAULT_SPILL_MB = float(os.environ.get("BSBP_TTS_SPILL_MB", "256"))
+# Growth step once the buffer lives in a file: one minute of 24 kHz audio
+SPILL_CHUNK_SAMPLES = 60 * 24000
+
+
+def float_to_pcm16(audio):
+    # Backends yield float32 in [-1, 1]; sinks and WAV files get 16-bit little-endian PCM. Rounding
+    # (not truncation) makes pcm16_to_float -> float_to_pcm16 lossless for Orpheus output.
+    audio = np.asarray(audio, dtype=np.float32)
+    return np.rint(np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def wav_bytes(pcm, sample_rate, channels=1, sample_width=2):
+    # Wraps raw PCM bytes in an in-memory WAV container
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def wav_header(frames, sample_rate, channels=1, sample_width=2):
+    # The 44-byte header wav_bytes writes, for streaming the PCM after it from elsewhere
+    data_size = frames * channels * sample_width
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1, channels, sample_rate,
+                       sample_rate * channels * sample_width, channels * sample_width, 8 * sample_width, b"data", data_size)
+
+
+def wav_range(header, audio, start, end):
+    # Bytes [start, end) of the WAV file made of `header` and float32 `audio` as 16-bit PCM; only the
+    # samples that range covers are converted
+    parts = []
+    if start < len(header):
+        parts.append(header[start:end])
+        start = min(end, len(header))
+    if start < end:
+        offset = start - len(header)
+        first = offset // 2
+        pcm = float_to_pcm16(audio[first:(end - len(header) + 1) // 2])
+        parts.append(pcm[offset - 2 * first:offset - 2 * first + end - start])
+    return b"".join(parts)
+
+
+def pcm16_to_float(pcm):
+    # Inverse of float_to_pcm16, for Orpheus output that arrives as 16-bit PCM bytes
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32767
+
+
+def resample_filter(up, down, half_width=10, beta=5.0):
+    # Kaiser-windowed sinc low-pass at the lower of the two Nyquist rates, scaled by `up` to keep unity gain
+    max_rate = max(up, down)
+    half_len = half_width * max_rate
+    t = np.arange(-half_len, half_len + 1)
+    h = np.sinc(t / max_rate) * np.kaiser(len(t), beta)
+    return (h * (up / h.sum())).astype(np.float32)
+
+
+def resample_polyphase(audio, up, down, h=None):
+    # Pure numpy polyphase resampler: for each of the `up` output phases the input is viewed (without copying)
+    # as a strided (outputs x taps) matrix and filtered with one matrix-vector product
+    h = resample_filter(up, down) if h is None else h
+    half_len = (len(h) - 1) // 2
+    taps = -(-len(h) // up)
+    h = np.concatenate([h, np.zeros(taps * up - len(h), dtype=np.float32)])
+    n_out = -(-len(audio) * up // down)
+    starts = [(r * down + half_len) // up - taps + 1 for r in range(up)]
+    counts = [max(0, -(-(n_out - r) // up)) for r in range(up)]
+    offset = taps
+    needed = max(start + down * (count - 1) + taps for start, count in zip(starts, counts) if count) + offset
+    padded = np.zeros(max(needed, len(audio) + offset), dtype=np.float32)
+    padded[offset:offset + len(audio)] = audio
+    out = np.empty(n_out, dtype=np.float32)
+    itemsize = padded.itemsize
+    for r in range(up):
+        if not counts[r]:
+            continue
+        phase = (r * down + half_len) % up
+        coefficients = np.ascontiguousarray(h[phase::up][::-1])
+        windows = np.lib.stride_tricks.as_strided(padded[starts[r] + offset:], shape=(counts[r], taps),
+                                                  strides=(down * itemsize, itemsize), writeable=False)
+        out[r::up] = windows @ coefficients
+    return out
+
+
+# Chunk-by-chunk counterpart of resample_polyphase: filter history and output phase carry over from
+# one process() call to the next, so a stream resampled in arbitrary pieces (Orpheus' 2048-sample
+# chunks, job segments) matches the whole signal resampled at once, without clicks at the seams
+# or drift in length. flush() emits the filter's tail once the input has ended.
+class StreamingResampler:
+    def __init__(self, source_rate, target_rate):
+        divisor = math.gcd(source_rate, target_rate)
+        self.up, self.down = target_rate // divisor, source_rate // divisor
+        h = resample_filter(self.up, self.down)
+        self.half_len = (len(h) - 1) // 2
+        self.taps = -(-len(h) // self.up)
+        self.h = np.concatenate([h, np.zeros(self.taps * self.up - len(h), dtype=np.float32)])
+        self.history = np.zeros(self.taps, dtype=np.float32)  # Input from global index self.base on
+        self.base = -self.taps
+        self.received = 0
+        self.produced = 0
+
+    def newest_input(self, n):
+        # Global index of the newest input sample output n depends on
+        return (n * self.down + self.half_len) // self.up
+
+    def filter(self, stop):
+        # Outputs self.produced .. stop-1 from the history held so far
+        count = stop - self.produced
+        out = np.empty(max(count, 0), dtype=np.float32)
+        itemsize = self.history.itemsize
+        for r in range(min(self.up, max(count, 0))):
+            n = self.produced + r
+            rows = -(-(count - r) // self.up)
+            start = self.newest_input(n) - self.taps + 1 - self.base
+            phase = (n * self.down + self.half_len) % self.up
+            coefficients = np.ascontiguousarray(self.h[phase::self.up][::-1])
+            windows = np.lib.stride_tricks.as_strided(self.history[start:], shape=(rows, self.taps),
+                                                      strides=(self.down * itemsize, itemsize), writeable=False)
+            out[r::self.up] = windows @ coefficients
+        self.produced = max(stop, self.produced)
+        # Drop input no later output needs
+        keep_from = self.newest_input(self.produced) - self.taps + 1
+        if keep_from > self.base:
+            self.history = self.history[keep_from - self.base:].copy()
+            self.base = keep_from
+        return out
+
+    def process(self, audio):
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        self.history = np.concatenate([self.history, audio])
+        self.received += len(audio)
+        available = self.base + len(self.history)
+        # Output n is ready once its newest input sample has arrived
+        ready = max(-(-(available * self.up - self.half_len) // self.down), 0)
+        return self.filter(min(ready, self.total()))
+
+    def total(self):
+        return -(-self.received * self.up // self.down)
+
+    def flush(self):
+        padding = self.newest_input(self.total()) + 1 - (self.base + len(self.history))
+        if padding > 0:
+            self.history = np.concatenate([self.history, np.zeros(padding, dtype=np.float32)])
+        return self.filter(self.total())
+
+
+def resample(audio, source_rate, target_rate):
+    # Returns `audio` itself when the rates match; otherwise scipy's resample_poly when available,
+    # falling back to the numpy polyphase implementation above
+    if source_rate == target_rate:
+        return audio
+    divisor = math.gcd(source_rate, target_rate)
+    up, down = target_rate // divisor, source_rate // divisor
+    with stage("resample"):
+        try:
+            from scipy.signal import resample_poly
+        except ImportError:
+            return resample_polyphase(audio, up, down)
+        return resample_poly(audio, up, down).astype(np.float32, copy=False)
+
+
+# Target rate, channel count and soundfile subtype for everything the app writes or plays back.
+# Defaults come from the environment and match the models' native 24 kHz mono 16-bit output.
+class OutputFormat:
+    def __init__(self, sample_rate=None, channels=None, subtype=None):
+        self.sample_rate = sample_rate or int(os.environ.get("BSBP_TTS_OUTPUT_RATE", "24000"))
+        self.channels = channels or int(os.environ.get("BSBP_TTS_OUTPUT_CHANNELS", "1"))
+        self.subtype = (subtype or os.environ.get("BSBP_TTS_OUTPUT_SUBTYPE", "PCM_16")).upper()
+        if self.subtype not in SUBTYPES:
+            raise ValueError(f"Unsupported sample format '{self.subtype}' (expected one of {', '.join(SUBTYPES)})")
+
+    def passthrough(self, source_rate):
+        return self.sample_rate == source_rate and self.channels == 1
+
+    def apply(self, audio, source_rate):
+        # float32 (frames,) for mono, (frames, channels) otherwise; no copy in the passthrough case
+        return self.layout(resample(np.asarray(audio, dtype=np.float32), source_rate, self.sample_rate))
+
+    def layout(self, audio):
+        if self.channels > 1:
+            audio = np.broadcast_to(audio[:, None], (len(audio), self.channels))
+        return audio
+
+    def wav_bytes(self, audio, source_rate):
+        if self.passthrough(source_rate) and self.subtype == "PCM_16":
+            return wav_bytes(float_to_pcm16(audio), source_rate)
+        import soundfile as sf
+        buffer = io.BytesIO()
+        sf.write(buffer, self.apply(audio, source_rate), self.sample_rate, subtype=self.subtype, format="WAV")
+        return buffer.getvalue()
+
+    def pcm16_wav_bytes(self, pcm, source_rate):
+        if self.passthrough(source_rate) and self.subtype == "PCM_16":
+            return wav_bytes(pcm, source_rate)
+        return self.wav_bytes(pcm16_to_float(pcm), source_rate)
+
+    def write(self, path, audio, source_rate):
+        import soundfile as sf
+        sf.write(path, self.apply(audio, source_rate), self.sample_rate, subtype=self.subtype)
+
+    def describe(self):
+        return f"{self.sample_rate} Hz, {self.channels} channel(s), {self.subtype}"
+
+
+# Growable float32 buffer that segments are copied into exactly once. Below spill_mb it is an in-memory
+# array that doubles its capacity; past that it moves to a memory-mapped temp file that grows in
+# SPILL_CHUNK_SAMPLES steps, so hour-long renders are paged by the OS instead of held twice in RAM.
+# view() and chunks() return views of the backing storage, never copies.
+class AudioBuffer:
+    def __init__(self, spill_mb=DEFAULT_SPILL_MB, directory=None, initial_samples=24000 * 30):
+        self.spill_samples = int(spill_mb * 1024 * 1024 // 4)
+        self.directory = directory
+        self.data = np.empty(min(initial_samples, max(self.spill_samples, 1)), dtype=np.float32)
+        self.length = 0
+        self.path = None
+        self.file = None
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def append(self, audio):
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        end = self.length + len(audio)
+        if end > len(self.data):
+            self.reserve(end)
+        self.data[self.length:end] = audio
+        self.length = end
+
+    def reserve(self, samples):
+        if not self.spilled and samples <= self.spill_samples:
+            capacity = min(max(samples, 2 * len(self.data)), self.spill_samples)
+            data = np.empty(capacity, dtype=np.float32)
+            data[:self.length] = self.data[:self.length]
+            self.data = data
+            return
+        capacity = -(-samples // SPILL_CHUNK_SAMPLES) * SPILL_CHUNK_SAMPLES
+        if not self.spilled:
+            fd, self.path = tempfile.mkstemp(prefix="bsbp_tts_", suffix=".f32", dir=self.directory)
+            self.file = os.fdopen(fd, "r+b")
+            self.file.write(memoryview(self.data[:self.length]).cast("B"))
+        self.file.truncate(capacity * 4)
+        self.file.flush()
+        self.data = np.memmap(self.file, dtype=np.float32, mode="r+", shape=(capacity,))
+
+    def view(self, start=0, stop=None):
+        stop = self.length if stop is None else min(stop, self.length)
+        return self.data[start:stop]
+
+    def chunks(self, chunk_samples=SPILL_CHUNK_SAMPLES):
+        for start in range(0, self.length, chunk_samples):
+            yield self.view(start, start + chunk_samples)
+
+    def describe(self):
+        where = f"file {self.path}" if self.spilled else "memory"
+        return f"Audio buffer: {self.length / 24000:.1f} s ({self.length * 4 / 1024 ** 2:.1f} MB) in {where}"
+
+    def close(self):
+        # Views handed out earlier stay readable until they are dropped; the file is removed either way
+        self.data = np.empty(0, dtype=np.float32)
+        self.length = 0
+        if self.file is not None:
+            self.file.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.file = None
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Read-only, seekable WAV file object over float32 samples (an AudioBuffer view) for players that load
+# from a file object (pygame), so playback never holds a second copy of the audio
+class WavReader(io.RawIOBase):
+    def __init__(self, audio, sample_rate):
+        super().__init__()
+        self.audio = audio
+        self.header = wav_header(len(audio), sample_rate)
+        self.size = len(self.header) + 2 * len(audio)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, b):
+        data = wav_range(self.header, self.audio, self.position, min(self.position + len(b), self.size))
+        b[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def encoding_for(path):
+    extension = os.path.splitext(path)[1].lower()
+    for encoding, (encoding_extension, container, subtypes) in ENCODINGS.items():
+        if extension == encoding_extension:
+            return encoding
+    raise ValueError(f"Unsupported output file type '{extension}' (expected .wav, .flac or .opus)")
+
+
+# Encodes audio to WAV, FLAC or Ogg/Opus as it is produced, so memory stays constant however long the
+# document is. libsndfile patches the container header with the final length when the file is closed.
+class StreamingEncoder:
+    def __init__(self, path, source_rate, output_format=None, encoding=None):
+        import soundfile as sf
+        self.path = path
+        self.source_rate = source_rate
+        self.output_format = output_format or OutputFormat()
+        self.encoding = encoding or encoding_for(path)
+        extension, container, subtypes = ENCODINGS[self.encoding]
+        if self.encoding == "opus" and self.output_format.sample_rate not in OPUS_RATES:
+            raise ValueError(f"Opus needs one of {', '.join(map(str, OPUS_RATES))} Hz, not {self.output_format.sample_rate}")
+        subtype = self.output_format.subtype if self.output_format.subtype in subtypes else subtypes[0]
+        self.file = sf.SoundFile(path, "w", samplerate=self.output_format.sample_rate,
+                                 channels=self.output_format.channels, format=container, subtype=subtype)
+        self.frames = 0
+        # One resampler for the whole file, so chunk boundaries leave no seams
+        self.resampler = (StreamingResampler(source_rate, self.output_format.sample_rate)
+                          if source_rate != self.output_format.sample_rate else None)
+
+    def write(self, audio):
+        audio = np.asarray(audio, dtype=np.float32)
+        if self.resampler is not None:
+            with stage("resample"):
+                audio = self.resampler.process(audio)
+        self.encode(audio)
+
+    def encode(self, audio):
+        audio = self.output_format.layout(audio)
+        with stage("encode", encoding=self.encoding, frames=len(audio)):
+            self.file.write(audio)
+        self.frames += len(audio)
+
+    @property
+    def duration(self):
+        return self.frames / self.output_format.sample_rate
+
+    def close(self):
+        if not self.file.closed:
+            if self.resampler is not None:
+                self.encode(self.resampler.flush())
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
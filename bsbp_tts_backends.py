@@ -0,0 +1,625 @@
+import os
+import math
+import time
+import uuid
+import queue
+import asyncio
+import threading
+from contextlib import closing, contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+import bsbp_tts_metrics as metrics
+from bsbp_tts_audio import AudioBuffer, pcm16_to_float
+from bsbp_tts_cache import cached_segments
+from bsbp_tts_profile import current_profiler, instrument_kokoro, snac_profiling
+from bsbp_tts_segmenter import DEFAULT_TARGET_TOKENS, pack, sentences, split_long
+
+KOKORO_REPO_ID = 'hexgrad/Kokoro-82M'
+ORPHEUS_MODEL_NAME = "canopylabs/orpheus-3b-0.1-ft"
+SAMPLE_RATE = 24000
+ORPHEUS_STOP_TOKEN_IDS = [49158]
+MIN_SENTENCE_CHARS = 40
+
+# Orpheus 3B is a Llama-3.2-3B: 28 layers with 8 KV heads of 128 dims, K and V in fp16
+ORPHEUS_KV_BYTES_PER_TOKEN = 2 * 28 * 8 * 128 * 2
+# Start token, end-of-text/start-of-audio markers and the "voice: " prefix around each prompt
+ORPHEUS_PROMPT_OVERHEAD_TOKENS = 8
+# SNAC emits 7 tokens per 2048-sample frame at 24 kHz
+ORPHEUS_AUDIO_TOKENS_PER_SECOND = 7 * SAMPLE_RATE / 2048
+# Characters of text spoken per second, used to estimate a chunk's audio length before generating it.
+# Conversational speech is ~15; erring slow keeps chunks short enough not to hit max_audio_tokens.
+ORPHEUS_CHARS_PER_SECOND = 12
+KOKORO_VOICES = [
+    "af_alloy", "af_aoede", "af_bella", "af_heart", "af_jessica", "af_kore", "af_nicole", "af_nova", "af_river", "af_sarah", "af_sky",
+    "am_adam", "am_echo", "am_eric", "am_fenrir", "am_liam", "am_michael", "am_onyx", "am_puck", "am_santa",
+    "bf_alice", "bf_emma", "bf_isabella", "bf_lily", "bm_daniel", "bm_fable", "bm_george", "bm_lewis",
+    "ef_dora", "em_alex", "em_santa", "ff_siwis", "hf_alpha", "hf_beta", "hm_omega", "hm_psi",
+    "if_sara", "im_nicola", "jf_alpha", "jf_gongitsune", "jf_nezumi", "jf_tebukuro", "jm_kumo",
+    "pf_dora", "pm_alex", "pm_santa", "zf_xiaobei", "zf_xiaoni", "zf_xiaoxiao", "zf_xiaoyi",
+    "zm_yunjian", "zm_yunxi", "zm_yunxia", "zm_yunyang"
+]
+ORPHEUS_VOICES = ["tara", "leah", "jess", "leo", "dan", "mia", "zac", "zoe"]
+ORPHEUS_WARMUP_TEXT = "Hello, this is a warm-up."
+# About two seconds of audio; enough to exercise the decode loop and SNAC without a full utterance
+ORPHEUS_WARMUP_MAX_TOKENS = 168
+
+
+class Cancelled(Exception):
+    pass
+
+
+# Cooperative cancellation shared between the GUI (or a server request) and a running generation.
+# Generators check it between segments; backends can register callbacks that run on cancel().
+class CancellationToken:
+    def __init__(self):
+        self.cancelled_at = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.cancelled_at is not None
+
+    def cancel(self):
+        with self.lock:
+            if self.cancelled_at is not None:
+                return
+            self.cancelled_at = time.time()
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            callback()
+
+    def raise_if_cancelled(self):
+        if self.cancelled_at is not None:
+            raise Cancelled()
+
+    @contextmanager
+    def on_cancel(self, callback):
+        with self.lock:
+            self.callbacks.append(callback)
+            already = self.cancelled_at is not None
+        if already:
+            callback()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.callbacks.remove(callback)
+
+    @contextmanager
+    def child(self):
+        # A token that is cancelled along with this one but can also be cancelled on its own, so a call
+        # can stop its own work after an error without cancelling everything else the caller runs
+        child = CancellationToken()
+        with self.on_cancel(child.cancel):
+            yield child
+
+
+def split_sentences(text, min_chars=MIN_SENTENCE_CHARS):
+    # Sentence-level chunks for Orpheus; fragments shorter than min_chars are merged into the next
+    # sentence so every request still has enough context for natural prosody
+    chunks = []
+    pending = ""
+    for sentence in sentences(text):
+        pending = f"{pending} {sentence}".strip()
+        if len(pending) >= min_chars:
+            chunks.append(pending)
+            pending = ""
+    if pending:
+        if chunks:
+            chunks[-1] = f"{chunks[-1]} {pending}"
+        else:
+            chunks.append(pending)
+    return chunks
+
+
+# Context and KV-cache budget for the Orpheus engine, derived from the expected prompt and audio
+# lengths instead of the model's full context. Every value can be overridden from the environment.
+class OrpheusLimits:
+    def __init__(self, max_prompt_tokens=None, max_audio_tokens=None, max_num_seqs=None):
+        self.max_prompt_tokens = max_prompt_tokens or int(os.environ.get("BSBP_ORPHEUS_MAX_PROMPT_TOKENS", "256"))
+        self.max_audio_tokens = max_audio_tokens or int(os.environ.get("BSBP_ORPHEUS_MAX_AUDIO_TOKENS", "1200"))
+        self.max_num_seqs = max_num_seqs or int(os.environ.get("BSBP_ORPHEUS_MAX_NUM_SEQS", "8"))
+        # vLLM allocates KV blocks of 16 tokens; keep the context a multiple of 256 for headroom
+        self.max_model_len = math.ceil((self.max_prompt_tokens + self.max_audio_tokens) / 256) * 256
+
+    @property
+    def kv_cache_bytes(self):
+        return self.max_model_len * self.max_num_seqs * ORPHEUS_KV_BYTES_PER_TOKEN
+
+    @property
+    def kv_cache_gib(self):
+        # VLLM_CPU_KVCACHE_SPACE takes whole GiB
+        return max(1, math.ceil(self.kv_cache_bytes / 1024 ** 3))
+
+    @property
+    def max_audio_seconds(self):
+        return self.max_audio_tokens / ORPHEUS_AUDIO_TOKENS_PER_SECOND
+
+    def describe(self):
+        return (f"max_model_len {self.max_model_len} ({self.max_prompt_tokens} prompt + {self.max_audio_tokens} audio tokens, "
+                f"~{self.max_audio_seconds:.0f}s audio per request), {self.max_num_seqs} sequences, "
+                f"KV cache {self.kv_cache_bytes / 1024 ** 2:.0f} MiB needed, {self.kv_cache_gib} GiB reserved")
+
+
+# State of one Orpheus synthesis call: the vLLM requests it has in flight (so cancelling its token
+# aborts only those), its peak KV-cache use and how long the abort took to free the cache. Pass one
+# as the `run` option to read it afterwards; concurrent calls on a shared backend never share one.
+class OrpheusRun:
+    def __init__(self):
+        self.requests = {}  # request id -> event loop that owns it
+        self.peak_kv_tokens = 0
+        self.release_seconds = None
+        self.lock = threading.Lock()
+
+    def started(self, request_id, loop):
+        with self.lock:
+            self.requests[request_id] = loop
+
+    def finished(self, request_id):
+        with self.lock:
+            self.requests.pop(request_id, None)
+
+    def use(self, kv_tokens):
+        self.peak_kv_tokens = max(self.peak_kv_tokens, kv_tokens)
+
+    def abort(self, engine):
+        # Called from whichever thread cancels; each abort runs on the event loop that owns the request
+        with self.lock:
+            requests = list(self.requests.items())
+        for request_id, loop in requests:
+            asyncio.run_coroutine_threadsafe(engine.abort(request_id), loop)
+
+    def released(self, token):
+        # All requests are gone and their KV blocks are back in the pool
+        if token.cancelled and self.release_seconds is None:
+            self.release_seconds = time.time() - token.cancelled_at
+
+
+def aborted_error(error):
+    # An abort this call's token did not cause surfaces as asyncio.CancelledError, a BaseException
+    # that front-ends catching Exception would miss
+    return error if isinstance(error, Exception) else RuntimeError("Orpheus request was aborted by the engine")
+
+
+# What an engine can do, so callers pick code paths from these instead of checking engine names
+class Capabilities:
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=1, streaming=True, batching=False, caching=False,
+                 cancellable=True, concurrent=False, voices=()):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.streaming = streaming  # Chunks arrive while later ones are still being generated
+        self.batching = batching  # Several chunks of one request are generated concurrently
+        self.caching = caching  # Repeated segments come from the segment cache
+        self.cancellable = cancellable
+        self.concurrent = concurrent  # Several calls may run on one instance at the same time
+        self.voices = tuple(voices)
+
+    def describe(self):
+        flags = [name for name in ("streaming", "batching", "caching", "cancellable", "concurrent") if getattr(self, name)]
+        return f"{self.sample_rate} Hz, {self.channels} channel(s), {', '.join(flags) or 'no extras'}, {len(self.voices)} voices"
+
+
+# Timing of one synthesis, shared by every front-end: time to first chunk, total time, audio produced
+class SynthesisStats:
+    # With an `engine`, every chunk also feeds the process-wide metrics (bsbp_tts_metrics)
+    def __init__(self, sample_rate=SAMPLE_RATE, engine=None):
+        self.sample_rate = sample_rate
+        self.engine = engine
+        self.started = time.perf_counter()
+        self.last_chunk = self.started
+        self.first_chunk_seconds = None
+        self.total_seconds = None
+        self.samples = 0
+        self.chunks = 0
+
+    def record(self, audio):
+        now = time.perf_counter()
+        if self.first_chunk_seconds is None:
+            self.first_chunk_seconds = now - self.started
+            if self.engine is not None:
+                metrics.TIME_TO_FIRST_AUDIO.observe(self.first_chunk_seconds, engine=self.engine)
+        if self.engine is not None:
+            metrics.CHUNK_LATENCY.observe(now - self.last_chunk, engine=self.engine)
+            metrics.SEGMENTS.inc(engine=self.engine)
+            metrics.AUDIO_SECONDS.inc(len(audio) / self.sample_rate, engine=self.engine)
+        self.last_chunk = now
+        self.samples += len(audio)
+        self.chunks += 1
+
+    def finish(self, outcome="ok"):
+        # outcome: "ok", "cancelled", "abandoned" (the consumer stopped reading) or "error"
+        if self.total_seconds is not None:
+            return
+        self.total_seconds = time.perf_counter() - self.started
+        if self.engine is not None:
+            metrics.REQUESTS.inc(engine=self.engine, outcome=outcome)
+            metrics.SYNTHESIS_SECONDS.inc(self.total_seconds, engine=self.engine)
+
+    @property
+    def elapsed(self):
+        return self.total_seconds if self.total_seconds is not None else time.perf_counter() - self.started
+
+    @property
+    def audio_seconds(self):
+        return self.samples / self.sample_rate
+
+    @property
+    def real_time_factor(self):
+        # Synthesis seconds per second of audio; below 1 is faster than real time
+        return self.elapsed / self.audio_seconds if self.samples else float("inf")
+
+    def describe(self):
+        first = f"{self.first_chunk_seconds:.2f}s" if self.first_chunk_seconds is not None else "n/a"
+        return (f"{self.audio_seconds:.2f}s audio in {self.elapsed:.2f}s (RTF {self.real_time_factor:.3f}), "
+                f"first chunk after {first}, {self.chunks} chunk(s)")
+
+
+# Common interface of every engine. synthesize() is the streaming contract: it yields mono float32 PCM
+# chunks in [-1, 1] at `sample_rate`, in order, each as soon as it is ready, and raises Cancelled between
+# chunks once `token` is cancelled. Engine-specific keyword options (lang_code, batch, ...) are ignored
+# by engines that do not know them, so callers never branch on the engine.
+class TTSBackend:
+    name = None
+    sample_rate = SAMPLE_RATE
+    capabilities = Capabilities()
+
+    def __init__(self):
+        # One user of the model at a time: the GUI's interactive generation, warm-up and job queue take
+        # it around each model call. The server takes it per request for engines that are not concurrent.
+        self.lock = threading.Lock()
+
+    def load(self):
+        pass
+
+    def synthesize(self, text, voice, speed=1.0, token=None, **options):
+        raise NotImplementedError
+
+    def stream(self, text, voice, speed=1.0, token=None, stats=None, **options):
+        # synthesize() plus the shared instrumentation (timings and metrics); pass a SynthesisStats to read them
+        stats = stats if stats is not None else SynthesisStats(self.sample_rate)
+        if stats.engine is None:
+            stats.engine = self.name
+        try:
+            with closing(self.synthesize(text, voice, speed, token=token, **options)) as chunks:
+                for audio in chunks:
+                    stats.record(audio)
+                    yield audio
+        except Cancelled:
+            stats.finish("cancelled")
+            raise
+        except GeneratorExit:
+            stats.finish("abandoned")
+            raise
+        except Exception:
+            stats.finish("error")
+            raise
+        stats.finish()
+
+    def render(self, text, voice, speed=1.0, token=None, stats=None, buffer=None, **options):
+        # Whole-utterance convenience: every chunk is copied once into an AudioBuffer, which is returned
+        buffer = buffer if buffer is not None else AudioBuffer()
+        for audio in self.stream(text, voice, speed, token=token, stats=stats, **options):
+            buffer.append(audio)
+        return buffer
+
+
+# Kokoro generation without any GUI: one shared KModel, per-language pipelines from the registry
+class KokoroBackend(TTSBackend):
+    name = "kokoro"
+    sample_rate = SAMPLE_RATE
+    capabilities = Capabilities(SAMPLE_RATE, caching=True, voices=KOKORO_VOICES)
+
+    def __init__(self, repo_id=KOKORO_REPO_ID, cache=None, registry=None):
+        if registry is None:
+            from bsbp_tts_pipelines import PipelineRegistry
+            registry = PipelineRegistry(repo_id=repo_id)
+        super().__init__()
+        self.repo_id = repo_id
+        self.registry = registry
+        self.cache = cache
+
+    def load(self, lang_code="a"):
+        return self.registry.get(lang_code)
+
+    def warm_up(self, voices, lang_code=None):
+        # Returns [(voice, cold seconds, warm seconds)]; the segment cache is bypassed on purpose
+        lang_code = lang_code or voices[0][0]
+        return self.registry.warm_up(lang_code, voices)
+
+    def segments(self, text, voice, speed=1.0, lang_code=None, memo=None, token=None, use_cache=True,
+                 target_tokens=DEFAULT_TARGET_TOKENS):
+        # Yields (graphemes, float32 audio, source) per segment, source being "reused", "cached" or "generated".
+        # Sentences are packed to about target_tokens phonemes per model call; 0 keeps one segment per line.
+        lang_code = lang_code or voice[0]
+        pipeline = self.registry.get(lang_code)
+        if current_profiler() is not None:
+            instrument_kokoro(pipeline)  # G2P and per-submodule model timings for the stage profiler
+        cache = self.cache if use_cache else None
+        return cached_segments(pipeline, text, voice, speed, lang_code, self.repo_id, cache, memo=memo, token=token,
+                               target_tokens=target_tokens)
+
+    def synthesize(self, text, voice, speed=1.0, token=None, lang_code=None, memo=None, use_cache=True,
+                   target_tokens=DEFAULT_TARGET_TOKENS, **options):
+        for gs, audio, source in self.segments(text, voice, speed, lang_code, memo, token, use_cache, target_tokens):
+            yield audio
+
+
+# Orpheus generation without any GUI; vllm/orpheus_tts are only imported when the model is loaded
+class OrpheusBackend(TTSBackend):
+    name = "orpheus"
+    sample_rate = SAMPLE_RATE
+    sample_width = 2
+    # Not concurrent: every call drives the shared AsyncLLMEngine from its own short-lived event loop, and
+    # the engine's output streams belong to the loop that started its background loop
+    capabilities = Capabilities(SAMPLE_RATE, batching=True, voices=ORPHEUS_VOICES)
+
+    def __init__(self, model_name=ORPHEUS_MODEL_NAME, limits=None, decode_workers=4):
+        import torch
+        super().__init__()
+        self.model_name = model_name
+        self.limits = limits or OrpheusLimits()
+        self.decode_workers = decode_workers
+        self.device = "mps" if torch.backends.mps.is_available() else "cpu"
+        self.model = None
+
+    def load(self):
+        if self.model is None:
+            os.environ.setdefault("VLLM_CPU_KVCACHE_SPACE", str(self.limits.kv_cache_gib))
+            import torch
+            from orpheus_tts import OrpheusModel
+            self.model = OrpheusModel(
+                model_name=self.model_name,
+                max_model_len=self.limits.max_model_len,
+                max_num_seqs=self.limits.max_num_seqs,
+                dtype=torch.float16,  # Use FP16 for MPS compatibility
+                device=self.device
+            )
+        return self.model
+
+    def prompt_tokens(self, text, voice):
+        return len(self.model.tokeniser(f"{voice}: {text}").input_ids) + ORPHEUS_PROMPT_OVERHEAD_TOKENS
+
+    def audio_tokens(self, text):
+        # Estimated from the text length; the real count is only known once the model stops
+        return math.ceil(len(text) / ORPHEUS_CHARS_PER_SECOND * ORPHEUS_AUDIO_TOKENS_PER_SECOND)
+
+    def chunk_load(self, text, voice):
+        # Share of the tighter of the prompt and audio budgets a chunk needs; above 1 it does not fit
+        return max(self.prompt_tokens(text, voice) / self.limits.max_prompt_tokens,
+                   self.audio_tokens(text) / self.limits.max_audio_tokens)
+
+    def fit_chunks(self, chunks, voice):
+        # Splits any chunk whose prompt would not fit max_prompt_tokens, or whose speech would run past
+        # max_audio_tokens and be cut off mid-sentence, at sentences, then clauses, then words
+        measure = lambda text: self.chunk_load(text, voice)
+        fitted = []
+        for chunk in chunks:
+            if measure(chunk) <= 1:
+                fitted.append(chunk)
+                continue
+            pieces = [piece for sentence in sentences(chunk) for piece in split_long(sentence, 1, measure)]
+            if any(measure(piece) > 1 for piece in pieces):
+                raise ValueError(f"Input cannot be split to fit {self.limits.max_prompt_tokens} prompt tokens "
+                                 f"and {self.limits.max_audio_tokens} audio tokens")
+            fitted.extend(pack(pieces, 1, 1, measure))
+        return fitted
+
+    def warm_up(self, voices=ORPHEUS_VOICES, max_tokens=ORPHEUS_WARMUP_MAX_TOKENS):
+        # Two short requests per voice; returns [(voice, cold seconds, warm seconds)]. The first one
+        # compiles/captures the engine's kernels and loads SNAC, so later voices are mostly warm.
+        self.load()
+        timings = []
+        for voice in voices:
+            runs = []
+            for _ in range(2):
+                start = time.time()
+                for audio_chunk in self.model.generate_speech(
+                    prompt=f"{voice}: {ORPHEUS_WARMUP_TEXT}",
+                    voice=voice,
+                    request_id=f"bsbp-warmup-{uuid.uuid4().hex}",
+                    max_tokens=max_tokens
+                ):
+                    pass
+                runs.append(time.time() - start)
+            timings.append((voice, runs[0], runs[1]))
+        return timings
+
+    def memory_report(self, run):
+        used = run.peak_kv_tokens * ORPHEUS_KV_BYTES_PER_TOKEN
+        reserved = self.limits.kv_cache_gib * 1024 ** 3
+        return (f"KV cache: {reserved / 1024 ** 2:.0f} MiB reserved, peak {used / 1024 ** 2:.1f} MiB used "
+                f"({100 * used / reserved:.1f}%, {run.peak_kv_tokens} tokens)")
+
+    def synthesize(self, text, voice, speed=1.0, token=None, batch=True, run=None, **options):
+        # The engine's native 16-bit chunks, converted for the common float32 contract
+        with closing(self.pcm16_chunks(text, voice, speed, batch, token, run)) as chunks:
+            for pcm in chunks:
+                yield pcm16_to_float(pcm)
+
+    def pcm16_chunks(self, text, voice, speed=1.0, batch=True, token=None, run=None):
+        # Yields 16-bit mono PCM byte chunks; with batch=True each sentence is a separate,
+        # concurrent vLLM request and the chunks come back in sentence order. Input too long for
+        # the prompt or audio budget is always chunked. Cancelling `token` aborts this call's in-flight requests.
+        self.load()
+        run = run if run is not None else OrpheusRun()
+        token = token or CancellationToken()
+        chunks = self.fit_chunks(split_sentences(text) if batch else [text], voice)
+        # The caller's profiler, handed to the engine and decoder threads explicitly
+        profiler = current_profiler()
+        if batch and len(chunks) > 1:
+            return self.synthesize_batched(chunks, voice, speed, token, run, profiler)
+        return self.synthesize_sequential(chunks, voice, speed, token, run, profiler)
+
+    def sampling_params(self, speed):
+        from vllm import SamplingParams
+        return SamplingParams(
+            temperature=0.7 * speed,
+            top_p=0.8,
+            max_tokens=self.limits.max_audio_tokens,
+            stop_token_ids=ORPHEUS_STOP_TOKEN_IDS,
+            repetition_penalty=max(1.1, speed),
+        )
+
+    def synthesize_sequential(self, chunks, voice, speed, token, run, profiler=None):
+        # One request at a time; audio is decoded while its tokens stream in
+        from orpheus_tts.decoder import tokens_decoder_sync
+
+        sampling_params = self.sampling_params(speed)
+        finished = False
+        # This call's own token, so cancelling it on an error stops only this call's request
+        with token.child() as token, token.on_cancel(lambda: run.abort(self.model.engine)), snac_profiling(profiler):
+            try:
+                for chunk in chunks:
+                    token.raise_if_cancelled()
+                    prompt_tokens = self.prompt_tokens(chunk, voice)
+                    errors = []
+                    generated = 0
+                    tokens = self.stream_tokens(chunk, voice, sampling_params, token, run, errors, profiler)
+                    for audio_chunk in tokens_decoder_sync(tokens):
+                        # Each 2048-sample chunk stands for 7 generated tokens
+                        generated += 7 * len(audio_chunk) // (2 * 2048)
+                        run.use(prompt_tokens + generated)
+                        token.raise_if_cancelled()
+                        yield audio_chunk
+                    if errors:
+                        raise errors[0]
+                    token.raise_if_cancelled()
+                finished = True
+            finally:
+                if not finished:
+                    token.cancel()  # Error or closed generator: stop the request that may still be running
+
+    def stream_tokens(self, chunk, voice, sampling_params, token, run, errors, profiler=None):
+        # Synchronous view of one vLLM request, driven by its own event loop on a helper thread. It is
+        # consumed on the SNAC decoder's thread, so failures are reported through `errors`, not raised.
+        request_id = f"bsbp-{uuid.uuid4().hex}"
+        prompt = self.model._format_prompt(f"{voice}: {chunk}", voice)
+        tokens = queue.Queue()
+        done = object()
+
+        async def produce():
+            run.started(request_id, asyncio.get_running_loop())
+            start = time.perf_counter()
+            generated = 0
+            try:
+                async for output in self.model.engine.generate(prompt=prompt, sampling_params=sampling_params,
+                                                               request_id=request_id):
+                    text = output.outputs[0].text
+                    tokens.put(text[text.rfind("<custom_token_"):])
+                    generated += 1
+            except (Exception, asyncio.CancelledError) as e:
+                if not token.cancelled:
+                    errors.append(aborted_error(e))
+            finally:
+                run.finished(request_id)
+                tokens.put(done)
+                if profiler is not None:
+                    profiler.add("llm", start, time.perf_counter(), request=request_id, tokens=generated)
+
+        thread = threading.Thread(target=asyncio.run, args=(produce(),), daemon=True)
+        thread.start()
+        while True:
+            item = tokens.get()
+            if item is done:
+                break
+            yield item
+        thread.join()
+        run.released(token)
+
+    def synthesize_batched(self, chunks, voice, speed, token, run, profiler=None):
+        # All chunks are submitted to the engine at once so vLLM batches their decode steps;
+        # each chunk's SNAC decode starts on a worker thread as soon as its tokens are complete
+        from orpheus_tts.decoder import tokens_decoder_sync
+
+        sampling_params = self.sampling_params(speed)
+        batch_id = uuid.uuid4().hex
+        results = [Future() for _ in chunks]
+        live_tokens = [0]
+        executor = ThreadPoolExecutor(max_workers=self.decode_workers)
+
+        def decode(tokens, index):
+            if profiler is None:
+                return b"".join(tokens_decoder_sync(iter(tokens)))
+            with profiler.span("snac", request=index, tokens=len(tokens)):
+                return b"".join(tokens_decoder_sync(iter(tokens)))
+
+        async def generate(index, chunk):
+            request_id = f"bsbp-{batch_id}-{index}"
+            try:
+                prompt = self.model._format_prompt(f"{voice}: {chunk}", voice)
+                prompt_tokens = self.prompt_tokens(chunk, voice)
+                live_tokens[0] += prompt_tokens
+                tokens = []
+                run.started(request_id, asyncio.get_running_loop())
+                start = time.perf_counter()
+                try:
+                    async for output in self.model.engine.generate(prompt=prompt, sampling_params=sampling_params,
+                                                                   request_id=request_id):
+                        text = output.outputs[0].text
+                        # Only the newest audio token matters to the decoder; keep it, not the whole text
+                        tokens.append(text[text.rfind("<custom_token_"):])
+                        live_tokens[0] += 1
+                        run.use(live_tokens[0])
+                finally:
+                    # The sequence's KV blocks are freed as soon as it finishes or is aborted
+                    run.finished(request_id)
+                    live_tokens[0] -= prompt_tokens + len(tokens)
+                    if profiler is not None:
+                        # Requests overlap, so these spans show concurrency rather than adding up
+                        profiler.add("llm", start, time.perf_counter(), request=index, tokens=len(tokens))
+                token.raise_if_cancelled()
+                pcm = await asyncio.get_running_loop().run_in_executor(executor, decode, tokens, index)
+                results[index].set_result(pcm)
+            except (Exception, asyncio.CancelledError) as e:
+                results[index].set_exception(Cancelled() if token.cancelled else aborted_error(e))
+
+        async def generate_all():
+            await asyncio.gather(*(generate(index, chunk) for index, chunk in enumerate(chunks)))
+
+        thread = threading.Thread(target=asyncio.run, args=(generate_all(),), daemon=True)
+        # This call's own token (the closures above read it too), so stopping the rest cancels nothing else
+        with token.child() as token, token.on_cancel(lambda: run.abort(self.model.engine)):
+            thread.start()
+            try:
+                for result in results:
+                    token.raise_if_cancelled()
+                    yield result.result()
+            finally:
+                if thread.is_alive():
+                    token.cancel()  # The consumer went away (closed generator, error); stop the rest too
+                thread.join()
+                executor.shutdown(wait=False)
+                run.released(token)
+
+
+# Model-free stand-in for tests, benchmarks and dry runs: one tone per sentence, its length following the
+# text, produced at a configurable real-time factor. Honors the streaming and cancellation contract.
+class FakeBackend(TTSBackend):
+    name = "fake"
+    sample_rate = SAMPLE_RATE
+    capabilities = Capabilities(SAMPLE_RATE, concurrent=True, voices=KOKORO_VOICES + ORPHEUS_VOICES)
+
+    def __init__(self, real_time_factor=0.0, first_chunk_seconds=0.0, seconds_per_char=0.06, chunk_seconds=0.5):
+        super().__init__()
+        self.real_time_factor = real_time_factor
+        self.first_chunk_seconds = first_chunk_seconds
+        self.seconds_per_char = seconds_per_char
+        self.chunk_samples = max(1, int(chunk_seconds * self.sample_rate))
+
+    def synthesize(self, text, voice, speed=1.0, token=None, **options):
+        # The pitch depends on the voice only, so output is deterministic for a given input
+        frequency = 110 + sum(map(ord, voice)) % 220
+        first = True
+        for sentence in split_sentences(text, min_chars=1):
+            samples = int(len(sentence) * self.seconds_per_char / speed * self.sample_rate)
+            t = np.arange(samples, dtype=np.float32) / self.sample_rate
+            tone = 0.2 * np.sin(2 * np.pi * frequency * t).astype(np.float32)
+            for start in range(0, samples, self.chunk_samples):
+                if token is not None:
+                    token.raise_if_cancelled()
+                chunk = tone[start:start + self.chunk_samples]
+                delay = self.real_time_factor * len(chunk) / self.sample_rate
+                time.sleep(delay + (self.first_chunk_seconds if first else 0.0))
+                first = False
+                yield chunk
@@ -0,0 +1,197 @@
+import os
+import re
+import json
+import hashlib
+import difflib
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from bsbp_tts_profile import stage, timed_iter
+from bsbp_tts_metrics import CACHE_BYTES, CACHE_LOOKUPS
+from bsbp_tts_segmenter import pack_segments
+
+DEFAULT_CACHE_DIR = os.environ.get("BSBP_TTS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "bsbp_tts", "segments"))
+DEFAULT_CACHE_MAX_MB = float(os.environ.get("BSBP_TTS_CACHE_MAX_MB", "512"))
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def split_paragraphs(text, split_pattern=r'\n+'):
+    # Same split KPipeline applies, so cached entries line up with its segments
+    parts = re.split(split_pattern, text.strip()) if split_pattern else [text]
+    return [part for part in parts if part.strip()]
+
+
+# Persistent segment cache: one float32 .npy file per (text, voice, speed, lang, model) key,
+# evicted least-recently-used first once the directory grows past max_mb
+class SegmentCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_mb=DEFAULT_CACHE_MAX_MB):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+        self.total_bytes = sum(self.entries.values())
+        CACHE_BYTES.set(self.total_bytes)
+
+    def key(self, text, voice, speed, lang_code, repo_id):
+        payload = json.dumps([normalize_text(text), voice, round(float(speed), 3), lang_code, repo_id])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            path = self.path(key)
+            try:
+                audio = np.load(path)
+                os.utime(path)  # Keep LRU order across restarts
+            except (OSError, ValueError):
+                self.total_bytes -= self.entries.pop(key)
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(result="hit")
+            return audio
+
+    def put(self, key, audio):
+        audio = np.asarray(audio, dtype=np.float32)
+        path = self.path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, audio)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.total_bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            self.evict()
+            CACHE_BYTES.set(self.total_bytes)
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            for key in self.entries:
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
+            self.entries.clear()
+            self.total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            CACHE_BYTES.set(0)
+
+    def stats(self):
+        return (f"Segment cache: {self.hits} hits, {self.misses} misses, "
+                f"{len(self.entries)} entries, {self.total_bytes / (1024 * 1024):.1f} MB")
+
+
+# Per-paragraph audio of the previous run, so an edited document only re-synthesizes
+# the paragraphs that were inserted or modified
+class SegmentMemo:
+    def __init__(self):
+        self.settings = None
+        self.paragraphs = []
+        self.audio = []
+
+    def plan(self, paragraphs, settings):
+        # Returns, for each new paragraph, the previous run's audio or None if it must be synthesized
+        reuse = [None] * len(paragraphs)
+        if settings != self.settings:
+            return reuse
+        matcher = difflib.SequenceMatcher(a=[normalize_text(p) for p in self.paragraphs],
+                                          b=[normalize_text(p) for p in paragraphs], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                for offset in range(j2 - j1):
+                    reuse[j1 + offset] = self.audio[i1 + offset]
+        return reuse
+
+    def store(self, paragraphs, settings, audio):
+        self.settings = settings
+        self.paragraphs = list(paragraphs)
+        self.audio = list(audio)
+
+    def clear(self):
+        self.store([], None, [])
+
+
+def cached_segments(pipeline, text, voice, speed, lang_code, repo_id, cache=None, split_pattern=r'\n+', memo=None,
+                    token=None, target_tokens=None):
+    # Yields (graphemes, float32 audio, source) per segment, where source is "reused" (previous
+    # run), "cached" (disk cache) or "generated". Segments are paragraphs, or with target_tokens
+    # sentences packed to about that many phonemes (bsbp_tts_segmenter). Without a cache, memo or
+    # target this is the plain pipeline generator. A cancellation token is checked before every model call.
+    check = token.raise_if_cancelled if token is not None else (lambda: None)
+    if cache is None and memo is None and not target_tokens:
+        check()
+        for gs, ps, audio in timed_iter(pipeline(text, voice=voice, speed=speed, split_pattern=split_pattern), "pipeline"):
+            check()
+            if audio is not None:
+                with stage("postprocess"):
+                    audio = np.asarray(audio, dtype=np.float32)
+                yield gs, audio, "generated"
+        return
+
+    with stage("split"):
+        paragraphs = pack_segments(text, target_tokens) if target_tokens else split_paragraphs(text, split_pattern)
+    settings = (voice, round(float(speed), 3), lang_code, repo_id, target_tokens)
+    reuse = memo.plan(paragraphs, settings) if memo is not None else [None] * len(paragraphs)
+    produced = []
+    for paragraph, audio in zip(paragraphs, reuse):
+        if audio is not None:
+            produced.append(audio)
+            CACHE_LOOKUPS.inc(result="reused")
+            yield paragraph, audio, "reused"
+            continue
+        key = cache.key(paragraph, voice, speed, lang_code, repo_id) if cache is not None else None
+        with stage("cache.get"):
+            audio = cache.get(key) if cache is not None else None
+        if audio is not None:
+            produced.append(audio)
+            yield paragraph, audio, "cached"
+            continue
+        parts = []
+        check()
+        for gs, ps, audio in timed_iter(pipeline(paragraph, voice=voice, speed=speed, split_pattern=None), "pipeline"):
+            check()
+            if audio is not None:
+                parts.append(np.asarray(audio, dtype=np.float32))
+        with stage("postprocess"):
+            audio = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+        if cache is not None:
+            with stage("cache.put"):
+                cache.put(key, audio)
+        produced.append(audio)
+        yield paragraph, audio, "generated"
+    if memo is not None:
+        memo.store(paragraphs, settings, produced)
@@ -0,0 +1,315 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+from bsbp_tts_audio import ENCODINGS, OutputFormat, StreamingEncoder, SUBTYPES
+from bsbp_tts_backends import KokoroBackend, OrpheusBackend
+from bsbp_tts_cache import SegmentCache
+from bsbp_tts_jobs import DEFAULT_JOBS_DIR, JobQueue, run_queue
+from bsbp_tts_metrics import REGISTRY, start_http_server
+from bsbp_tts_profile import StageProfiler, profiling
+from bsbp_tts_segmenter import DEFAULT_TARGET_TOKENS
+from bsbp_tts_workers import KokoroWorkerPool
+
+ENGINES = ("kokoro", "orpheus")
+
+
+def load_items(source, defaults):
+    # A directory of .txt files or a JSONL manifest of {"text"|"file", "id", "voice", "speed", "lang", "engine"}
+    items = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".txt"):
+                with open(os.path.join(source, name), encoding="utf-8") as f:
+                    items.append(dict(defaults, id=os.path.splitext(name)[0], text=f.read()))
+        return items
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            item = dict(defaults)
+            item.update({k: v for k, v in entry.items() if v is not None})
+            if "text" not in item:
+                with open(os.path.join(base_dir, item["file"]), encoding="utf-8") as text_file:
+                    item["text"] = text_file.read()
+            item.setdefault("id", os.path.splitext(os.path.basename(item["file"]))[0] if "file" in item else f"item_{line_number:04d}")
+            items.append(item)
+    return items
+
+
+def synthesize_item(backend, item, output_path, output_format, target_tokens=DEFAULT_TARGET_TOKENS):
+    # Encodes one output file as the audio is produced and returns its duration in seconds
+    with StreamingEncoder(output_path, backend.sample_rate, output_format) as encoder:
+        for audio in backend.stream(item["text"], item["voice"], float(item["speed"]), lang_code=item.get("lang"),
+                                    target_tokens=target_tokens):
+            encoder.write(audio)
+    return encoder.duration
+
+
+def write_kokoro(output_path, audio_parts, sample_rate, output_format):
+    with StreamingEncoder(output_path, sample_rate, output_format) as encoder:
+        for audio in audio_parts:
+            encoder.write(audio)
+    return encoder.duration
+
+
+def run_jobs(items, args, output_format):
+    # Renders through the persistent job queue: rerunning the same command after a crash skips items
+    # already rendered and resumes every unfinished one from its last finished segment
+    jobs = JobQueue(args.jobs_dir)
+    recovered = jobs.recover()
+    if recovered:
+        logging.info(f"Resuming {recovered} interrupted job(s)")
+    pending = {job["output_path"] for job in jobs.pending()}
+    rendered_outputs = jobs.finished_outputs()
+    skipped = 0
+    for item in items:
+        if item["engine"] not in ENGINES:
+            logging.error(f"{item['id']}: unknown engine '{item['engine']}'")
+            continue
+        output_path = os.path.abspath(os.path.join(args.output_dir, f"{item['id']}{ENCODINGS[args.format][0]}"))
+        if output_path in rendered_outputs:
+            skipped += 1
+        elif output_path not in pending:
+            jobs.submit(item["engine"], item["text"], item["voice"], float(item["speed"]), item.get("lang"),
+                        int(item.get("priority", 0)), args.format, output_path, args.segment_tokens)
+    if skipped:
+        logging.info(f"Skipping {skipped} item(s) already rendered by an earlier run")
+    logging.info(f"{jobs.describe()}; queue depth {jobs.depth()}")
+
+    backends = {}
+    failures = []
+
+    def backend_for(engine):
+        if engine not in backends:
+            if engine == "kokoro":
+                backends[engine] = KokoroBackend(cache=None if args.no_cache else SegmentCache())
+            else:
+                backends[engine] = OrpheusBackend()
+                backends[engine].load()
+        return backends[engine]
+
+    def progress(job, done, total):
+        logging.info(f"Job {job['id']}: segment {done}/{total}, queue depth {jobs.depth()}")
+
+    def finished(job, output_path, error):
+        dump_metrics(args.metrics_file)
+        if error is None:
+            logging.info(f"Job {job['id']} done -> {output_path}")
+        elif error == "cancelled":
+            logging.info(f"Job {job['id']} cancelled")
+        else:
+            logging.error(f"Job {job['id']} failed: {error}")
+            failures.append(job["id"])
+
+    start = time.time()
+    rendered = run_queue(jobs, backend_for, output_format, progress=progress, finished=finished, engines=ENGINES)
+    logging.info(f"Done: {rendered} job(s) rendered, {len(failures)} failed in {time.time() - start:.2f}s. {jobs.describe()}")
+    jobs.close()
+    return 1 if failures else 0
+
+
+def manage_jobs(args):
+    # --list-jobs, --cancel-job and --job-priority; works while another process is rendering the queue
+    jobs = JobQueue(args.jobs_dir)
+    status = 0
+    for job_id, priority in args.job_priority:
+        if jobs.set_priority(job_id, priority):
+            logging.info(f"Job {job_id}: priority {priority}")
+        else:
+            logging.error(f"Job {job_id} is not queued; only jobs that have not started can be reprioritized")
+            status = 1
+    for job_id in args.cancel_job:
+        if jobs.cancel(job_id):
+            logging.info(f"Job {job_id} cancelled")
+        else:
+            logging.error(f"Job {job_id} is not queued or running")
+            status = 1
+    if args.list_jobs:
+        for job in jobs.pending():
+            done, total = jobs.progress(job["id"])
+            print(f"{job['id']:>6}  {job['status']:<8} priority {job['priority']:>3}  {job['engine']:<8} "
+                  f"{done}/{total} segments  {job['output_path']}")
+        print(jobs.describe())
+    jobs.close()
+    return status
+
+
+def dump_metrics(path):
+    if path:
+        try:
+            REGISTRY.dump(path)
+        except OSError as e:
+            logging.error(f"Could not write metrics to {path}: {str(e)}")
+
+
+def report_profile(profiler, path):
+    if profiler is not None:
+        logging.info(profiler.describe())
+        logging.info(f"Stage trace written to {profiler.export(path)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthesize many documents headlessly with Kokoro or Orpheus.")
+    parser.add_argument("source", nargs="?", help="Directory of .txt files or a JSONL manifest")
+    parser.add_argument("-o", "--output-dir", default="bsbp_tts_output", help="Where to write one file per item")
+    parser.add_argument("--engine", choices=ENGINES, default="kokoro", help="Default engine for items that do not set one")
+    parser.add_argument("--voice", default=None, help="Default voice (af_heart for Kokoro, tara for Orpheus)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Default speed")
+    parser.add_argument("--lang", default=None, help="Default Kokoro lang_code (defaults to the voice prefix)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the segment cache")
+    parser.add_argument("--segment-tokens", type=int, default=DEFAULT_TARGET_TOKENS,
+                        help="Kokoro: pack sentences to about this many phonemes per model call (0 = one segment per line)")
+    parser.add_argument("--workers", type=int, default=1, help="Kokoro worker processes (0 = one per core pair)")
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="torch threads in each Kokoro worker")
+    parser.add_argument("--shard", choices=("documents", "segments"), default="documents",
+                        help="Distribute whole documents or the paragraphs of each document across workers")
+    parser.add_argument("--start-method", choices=("fork", "spawn", "forkserver"), default=None,
+                        help="multiprocessing start method; fork shares the loaded weights copy-on-write")
+    parser.add_argument("--sample-rate", type=int, default=None, help="Output sample rate (default 24000, resampled if different)")
+    parser.add_argument("--channels", type=int, default=None, help="Output channels (mono is duplicated)")
+    parser.add_argument("--format", choices=sorted(ENCODINGS), default="wav", help="Output file type, encoded while synthesizing")
+    parser.add_argument("--subtype", choices=SUBTYPES, default=None, help="Output sample format (default PCM_16)")
+    parser.add_argument("--queue", action="store_true",
+                        help="Render through the persistent job queue (highest manifest `priority` first); rerun to resume")
+    parser.add_argument("--jobs-dir", default=DEFAULT_JOBS_DIR, help="Job queue database and segment chunks")
+    parser.add_argument("--list-jobs", action="store_true", help="List queued and running jobs, then exit")
+    parser.add_argument("--cancel-job", type=int, action="append", default=[], metavar="JOB_ID",
+                        help="Cancel a queued or running job (repeatable), then exit")
+    parser.add_argument("--job-priority", type=int, nargs=2, action="append", default=[], metavar=("JOB_ID", "PRIORITY"),
+                        help="Change the priority of a queued job (repeatable), then exit")
+    parser.add_argument("--profile", default=None, metavar="TRACE_JSON",
+                        help="Time G2P, model, vocoder, LLM/SNAC and encoding per segment; write a Chrome trace here")
+    parser.add_argument("--metrics-file", default=os.environ.get("BSBP_TTS_METRICS_FILE"),
+                        help="Rewrite Prometheus text metrics here after every item (e.g. for a textfile collector)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on localhost:PORT/metrics while running")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.list_jobs or args.cancel_job or args.job_priority:
+        return manage_jobs(args)
+    if args.source is None:
+        parser.error("the source argument is required")
+    if args.metrics_port is not None:
+        start_http_server(args.metrics_port)
+        logging.info(f"Metrics at http://127.0.0.1:{args.metrics_port}/metrics")
+
+    defaults = {"engine": args.engine, "speed": args.speed}
+    if args.voice:
+        defaults["voice"] = args.voice
+    if args.lang:
+        defaults["lang"] = args.lang
+    items = load_items(args.source, defaults)
+    if not items:
+        logging.error(f"No items found in {args.source}")
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_format = OutputFormat(args.sample_rate, args.channels, args.subtype)
+    logging.info(f"Output format: {output_format.describe()}")
+
+    for item in items:
+        item.setdefault("voice", "af_heart" if item["engine"] == "kokoro" else "tara")
+    # Worker processes are not profiled; their output is still timed while it is encoded here
+    profiler = StageProfiler() if args.profile else None
+    if args.queue:
+        with profiling(profiler):
+            status = run_jobs(items, args, output_format)
+        report_profile(profiler, args.profile)
+        dump_metrics(args.metrics_file)
+        return status
+
+    backends = {}
+    total_audio = 0.0
+    failures = 0
+    batch_start = time.time()
+
+    def report(index, item, audio_seconds, wall_seconds, output_path):
+        throughput = audio_seconds / wall_seconds if wall_seconds > 0 else 0.0
+        logging.info(f"[{index}/{len(items)}] {item['id']}: {audio_seconds:.2f}s audio in {wall_seconds:.2f}s "
+                     f"({throughput:.2f} audio-s/wall-s) -> {output_path}")
+        dump_metrics(args.metrics_file)
+
+    pool_items = []
+    if args.workers != 1:
+        pool = KokoroWorkerPool(workers=args.workers or None, threads_per_worker=args.threads_per_worker,
+                                start_method=args.start_method, target_tokens=args.segment_tokens)
+        logging.info(f"Started {pool.workers} Kokoro workers x {pool.threads_per_worker} threads ({pool.start_method})")
+        pool_items = [(index, item) for index, item in enumerate(items, 1) if item["engine"] == "kokoro"]
+        written = 0
+        try:
+            if args.shard == "documents":
+                jobs = [(item["text"], item["voice"], float(item["speed"]), item.get("lang")) for index, item in pool_items]
+                results = (([audio], seconds) for audio, seconds in pool.map(jobs))
+            else:
+                results = ((list(pool.synthesize(item["text"], item["voice"], float(item["speed"]), item.get("lang"))), None)
+                           for index, item in pool_items)
+            item_start = time.time()
+            for (index, item), (parts, worker_seconds) in zip(pool_items, results):
+                output_path = os.path.join(args.output_dir, f"{item['id']}{ENCODINGS[args.format][0]}")
+                with profiling(profiler):
+                    audio_seconds = write_kokoro(output_path, parts, KokoroBackend.sample_rate, output_format)
+                # Per-document time is the worker's own synthesis time when documents run side by side
+                wall_seconds = worker_seconds if worker_seconds is not None else time.time() - item_start
+                total_audio += audio_seconds
+                report(index, item, audio_seconds, wall_seconds, output_path)
+                written += 1
+                item_start = time.time()
+            pool.close()
+        except Exception as e:
+            pool.terminate()
+            logging.error(f"Kokoro worker pool failed: {str(e)}")
+            failures += len(pool_items) - written
+    pooled = {index for index, item in pool_items}
+
+    for index, item in enumerate(items, 1):
+        if index in pooled:
+            continue
+        engine = item["engine"]
+        if engine not in ENGINES:
+            logging.error(f"[{index}/{len(items)}] {item['id']}: unknown engine '{engine}'")
+            failures += 1
+            continue
+        try:
+            if engine not in backends:
+                # Each model is loaded once and reused for every item
+                load_start = time.time()
+                if engine == "kokoro":
+                    cache = None if args.no_cache else SegmentCache()
+                    backends[engine] = KokoroBackend(cache=cache)
+                else:
+                    backends[engine] = OrpheusBackend()
+                    backends[engine].load()
+                logging.info(f"Loaded {engine} backend in {time.time() - load_start:.2f} seconds")
+            output_path = os.path.join(args.output_dir, f"{item['id']}{ENCODINGS[args.format][0]}")
+            item_start = time.time()
+            with profiling(profiler):
+                audio_seconds = synthesize_item(backends[engine], item, output_path, output_format, args.segment_tokens)
+            wall_seconds = time.time() - item_start
+        except Exception as e:
+            logging.error(f"[{index}/{len(items)}] {item['id']}: {str(e)}")
+            failures += 1
+            continue
+        total_audio += audio_seconds
+        report(index, item, audio_seconds, wall_seconds, output_path)
+
+    batch_time = time.time() - batch_start
+    throughput = total_audio / batch_time if batch_time > 0 else 0.0
+    logging.info(f"Done: {len(items) - failures}/{len(items)} items, {total_audio:.2f}s audio in {batch_time:.2f}s "
+                 f"({throughput:.2f} audio-s/wall-s)")
+    if "kokoro" in backends and backends["kokoro"].cache is not None:
+        logging.info(backends["kokoro"].cache.stats())
+    if "orpheus" in backends:
+        logging.info(f"Orpheus limits: {backends['orpheus'].limits.describe()}")
+    report_profile(profiler, args.profile)
+    dump_metrics(args.metrics_file)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+import os
+import time
+import sqlite3
+import threading
+import numpy as np
+from bsbp_tts_audio import StreamingEncoder, OutputFormat, ENCODINGS
+from bsbp_tts_cache import split_paragraphs
+from bsbp_tts_backends import Cancelled
+from bsbp_tts_metrics import JOBS, QUEUE_DEPTH
+from bsbp_tts_segmenter import DEFAULT_TARGET_TOKENS, pack_segments
+
+DEFAULT_JOBS_DIR = os.environ.get("BSBP_TTS_JOBS_DIR", os.path.join(os.path.expanduser("~"), ".cache", "bsbp_tts", "jobs"))
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+# A running job whose owner has not recorded progress for this long is taken as abandoned even if a
+# process with the owner's pid exists (the pid may have been reused)
+STALE_SECONDS = float(os.environ.get("BSBP_TTS_JOB_STALE_SECONDS", "600"))
+# How often an owner waiting for the backend lock refreshes its heartbeat; well below STALE_SECONDS
+HEARTBEAT_SECONDS = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    engine TEXT NOT NULL,
+    text TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    speed REAL NOT NULL,
+    lang TEXT,
+    encoding TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    total_segments INTEGER NOT NULL,
+    output_path TEXT,
+    error TEXT,
+    owner INTEGER,
+    segment_tokens INTEGER,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    segment_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    PRIMARY KEY (job_id, segment_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_priority ON jobs (status, priority DESC, id);
+"""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# Columns added after the first release, for queues created by an older version
+MIGRATIONS = {"owner": "INTEGER", "segment_tokens": "INTEGER"}
+
+
+def job_segments(text, segment_tokens):
+    # The units a job renders and persists one at a time: the text packed to segment_tokens, which keeps
+    # paragraphs apart and rejoins hard-wrapped lines. Jobs from before segment_tokens was stored (None)
+    # were split into whole lines.
+    if segment_tokens is None:
+        return split_paragraphs(text)
+    return pack_segments(text, segment_tokens)
+
+
+def process_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows; opening it only checks that it exists
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+
+# Durable render queue in front of the Kokoro and Orpheus backends. A job is split into segments of
+# about segment_tokens (job_segments); every finished segment is written to its own .npy chunk and recorded in SQLite
+# before the next one starts, so a crashed or restarted render resumes after the last finished
+# segment. Jobs are claimed highest priority first, oldest first within a priority. A claimed job
+# records its owner's pid, and `updated` doubles as the owner's heartbeat, so several processes
+# (the GUIs and the CLI) can share one queue without taking over each other's running jobs.
+class JobQueue:
+    def __init__(self, directory=DEFAULT_JOBS_DIR):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(directory, "jobs.db"), timeout=30, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        for name, definition in MIGRATIONS.items():
+            if name not in columns:
+                self.db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+        self.update_depth()
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def submit(self, engine, text, voice, speed=1.0, lang_code=None, priority=0, encoding="wav", output_path=None,
+               segment_tokens=DEFAULT_TARGET_TOKENS):
+        segments = job_segments(text, segment_tokens)
+        if not segments:
+            raise ValueError("Nothing to synthesize")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unsupported encoding '{encoding}'")
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO jobs (engine, text, voice, speed, lang, encoding, priority, total_segments, output_path, "
+                "segment_tokens, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (engine, text, voice, float(speed), lang_code, encoding, int(priority), len(segments), output_path,
+                 int(segment_tokens), now, now))
+            job_id = cursor.lastrowid
+        if output_path is None:
+            self.execute("UPDATE jobs SET output_path = ? WHERE id = ?",
+                         (os.path.join(self.directory, "output", f"job_{job_id:05d}{ENCODINGS[encoding][0]}"), job_id))
+        self.update_depth()
+        return job_id
+
+    def recover(self, stale_seconds=STALE_SECONDS):
+        # Jobs left "running" by a process that died (or stopped heartbeating) go back to the queue;
+        # they keep their finished segments. Jobs another live process is rendering are left alone.
+        now = time.time()
+        recovered = 0
+        for row in self.execute("SELECT id, owner, updated FROM jobs WHERE status = 'running'"):
+            if row["owner"] is not None and process_alive(row["owner"]) and now - row["updated"] < stale_seconds:
+                continue
+            with self.lock:
+                # Only if nobody claimed or touched it since it was read
+                recovered += self.db.execute("UPDATE jobs SET status = 'queued', owner = NULL, updated = ? "
+                                             "WHERE id = ? AND status = 'running' AND updated = ?",
+                                             (now, row["id"], row["updated"])).rowcount
+        if recovered:
+            self.update_depth()
+        return recovered
+
+    def claim(self, engines=None):
+        # Atomically moves the next job (for one of `engines`, if given) to "running" and returns it as a
+        # dict, or None if nothing is queued
+        engines = tuple(engines or ())
+        where = f" AND engine IN ({', '.join('?' * len(engines))})" if engines else ""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(f"SELECT * FROM jobs WHERE status = 'queued'{where} ORDER BY priority DESC, id LIMIT 1",
+                                      engines).fetchone()
+                if row is not None:
+                    self.db.execute("UPDATE jobs SET status = 'running', owner = ?, updated = ? WHERE id = ?",
+                                    (os.getpid(), time.time(), row["id"]))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return dict(row, status="running", owner=os.getpid()) if row is not None else None
+
+    def job(self, job_id):
+        rows = self.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return dict(rows[0]) if rows else None
+
+    def set_status(self, job_id, status, error=None):
+        if status not in JOB_STATES:
+            raise ValueError(f"Unknown job state '{status}'")
+        self.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?", (status, error, time.time(), job_id))
+        if status in ("done", "failed", "cancelled"):
+            JOBS.inc(status=status)
+        self.update_depth()
+
+    def heartbeat(self, job_id):
+        # Tells other processes' recover() that this job's owner is still at work
+        self.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+
+    def status(self, job_id):
+        rows = self.execute("SELECT status FROM jobs WHERE id = ?", (job_id,))
+        return rows[0][0] if rows else None
+
+    def cancel(self, job_id):
+        # Cancels a queued or running job; a running one stops before its next segment, in whichever
+        # process renders it, and that process removes its chunks. Returns False if the job is unknown
+        # or already finished.
+        with self.lock:
+            row = self.db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["status"] not in ("queued", "running"):
+                return False
+            self.db.execute("UPDATE jobs SET status = 'cancelled', updated = ? WHERE id = ?", (time.time(), job_id))
+        JOBS.inc(status="cancelled")
+        if row["status"] == "queued":
+            self.discard_chunks(job_id)
+        self.update_depth()
+        return True
+
+    def set_priority(self, job_id, priority):
+        # Reorders a job that has not started yet; returns False otherwise
+        with self.lock:
+            return self.db.execute("UPDATE jobs SET priority = ?, updated = ? WHERE id = ? AND status = 'queued'",
+                                   (int(priority), time.time(), job_id)).rowcount > 0
+
+    def chunk_path(self, job_id, segment_id):
+        return os.path.join(self.directory, f"job_{job_id:05d}", f"{segment_id:05d}.npy")
+
+    def completed_segments(self, job_id):
+        # {segment_id: chunk path} for every segment already rendered
+        rows = self.execute("SELECT segment_id, path FROM segments WHERE job_id = ?", (job_id,))
+        return {row["segment_id"]: row["path"] for row in rows if os.path.exists(row["path"])}
+
+    def record_segment(self, job_id, segment_id, audio):
+        # The chunk is on disk (and renamed into place) before the row that marks it finished is written
+        audio = np.asarray(audio, dtype=np.float32)
+        path = self.chunk_path(job_id, segment_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, audio)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.execute("INSERT OR REPLACE INTO segments (job_id, segment_id, path, samples) VALUES (?, ?, ?, ?)",
+                     (job_id, segment_id, path, len(audio)))
+        self.heartbeat(job_id)
+
+    def discard_chunks(self, job_id):
+        for path in self.completed_segments(job_id).values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.execute("DELETE FROM segments WHERE job_id = ?", (job_id,))
+        try:
+            os.rmdir(os.path.dirname(self.chunk_path(job_id, 0)))
+        except OSError:
+            pass
+
+    def depth(self):
+        return self.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')")[0][0]
+
+    def update_depth(self):
+        # Only called when a job enters or leaves the queue, never per segment
+        QUEUE_DEPTH.set(self.depth(), queue="jobs")
+
+    def progress(self, job_id):
+        # (finished segments, total segments)
+        rows = self.execute("SELECT total_segments, (SELECT COUNT(*) FROM segments WHERE job_id = jobs.id) "
+                            "FROM jobs WHERE id = ?", (job_id,))
+        return (rows[0][1], rows[0][0]) if rows else (0, 0)
+
+    def finished_outputs(self):
+        # Output paths of finished jobs whose file is still there
+        rows = self.execute("SELECT DISTINCT output_path FROM jobs WHERE status = 'done'")
+        return {row[0] for row in rows if row[0] and os.path.exists(row[0])}
+
+    def pending(self):
+        return [dict(row) for row in self.execute("SELECT * FROM jobs WHERE status IN ('queued', 'running') "
+                                                  "ORDER BY priority DESC, id")]
+
+    def describe(self):
+        counts = dict(self.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return "Job queue: " + ", ".join(f"{counts.get(state, 0)} {state}" for state in JOB_STATES)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def acquire_lock(jobs, job_id, lock, token=None):
+    # Waits for `lock` (an interactive generation may hold it for long), heartbeating on every pass so
+    # no other process recovers the job meanwhile. A cancelled token ends the wait.
+    while not lock.acquire(timeout=HEARTBEAT_SECONDS):
+        jobs.heartbeat(job_id)
+        if token is not None:
+            token.raise_if_cancelled()
+    jobs.heartbeat(job_id)
+
+
+def render_job(jobs, job, backend, output_format=None, token=None, progress=None):
+    # Renders the missing segments of `job` with `backend` (any TTSBackend), then
+    # stitches all chunks into the job's output file and returns its path. Segments were packed to the
+    # job's segment_tokens at submit time, so each is one synthesis call. progress(job, done, total)
+    # is called after each segment. Raises Cancelled (leaving the job resumable) if `token` is cancelled.
+    segments = job_segments(job["text"], job["segment_tokens"])
+    target_tokens = DEFAULT_TARGET_TOKENS if job["segment_tokens"] is None else job["segment_tokens"]
+    completed = jobs.completed_segments(job["id"])
+    for segment_id, segment in enumerate(segments):
+        if segment_id in completed:
+            continue
+        if token is not None:
+            token.raise_if_cancelled()
+        if jobs.status(job["id"]) == "cancelled":
+            raise JobCancelled()
+        acquire_lock(jobs, job["id"], backend.lock, token)
+        try:  # Per segment, so an interactive generation waits at most one segment
+            parts = list(backend.stream(segment, job["voice"], job["speed"], token=token, lang_code=job["lang"],
+                                        target_tokens=target_tokens))
+        finally:
+            backend.lock.release()
+        jobs.record_segment(job["id"], segment_id, np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32))
+        completed[segment_id] = jobs.chunk_path(job["id"], segment_id)
+        if progress is not None:
+            progress(job, len(completed), len(segments))
+
+    if jobs.status(job["id"]) == "cancelled":
+        raise JobCancelled()
+    output_path = job["output_path"]
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = f"{output_path}.part"
+    with StreamingEncoder(tmp_path, backend.sample_rate, output_format or OutputFormat(), job["encoding"]) as encoder:
+        for segment_id in range(len(segments)):
+            encoder.write(np.load(completed[segment_id], mmap_mode="r"))
+    os.replace(tmp_path, output_path)
+    jobs.set_status(job["id"], "done")
+    jobs.discard_chunks(job["id"])
+    return output_path
+
+
+def run_queue(jobs, backend_for, output_format=None, token=None, progress=None, finished=None, engines=None):
+    # Drains the queue (only jobs for `engines`, if given) highest priority first. backend_for(engine)
+    # returns the loaded backend for a job;
+    # finished(job, output_path, error) is called once per job. When `token` is cancelled the job goes
+    # back to "queued" with its finished segments kept, and Cancelled is re-raised; a job cancelled
+    # through JobQueue.cancel() is dropped with its chunks and the queue carries on.
+    rendered = 0
+    while True:
+        if token is not None:
+            token.raise_if_cancelled()
+        job = jobs.claim(engines)
+        if job is None:
+            return rendered
+        try:
+            output_path = render_job(jobs, job, backend_for(job["engine"]), output_format, token, progress)
+        except Cancelled:
+            if jobs.status(job["id"]) == "running":
+                jobs.set_status(job["id"], "queued")
+            raise
+        except JobCancelled:
+            jobs.discard_chunks(job["id"])
+            if finished is not None:
+                finished(job, None, "cancelled")
+            continue
+        except Exception as e:
+            jobs.set_status(job["id"], "failed", str(e))
+            if finished is not None:
+                finished(job, None, str(e))
+            continue
+        rendered += 1
+        if finished is not None:
+            finished(job, output_path, None)
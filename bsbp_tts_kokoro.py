@@ -1,68 +1,248 @@
+import time
+STARTUP_START = time.time()
+
+import importlib
 import sys
 import os
-import numpy as np
+import shutil
+import sqlite3
+import tempfile
 from datetime import datetime
-import time
 from PyQt6.QtWidgets import (QApplication, QMainWindow,QStyle, QWidget, QVBoxLayout, QHBoxLayout,
-                             QTextEdit, QComboBox, QSlider, QPushButton, QLabel, QFileDialog, QStyledItemDelegate, QStyleOptionViewItem)
-from PyQt6.QtCore import Qt, QTimer, QUrl, QThread, pyqtSignal, QSize, QRect
+                             QTextEdit, QComboBox, QSlider, QPushButton, QLabel, QFileDialog, QStyledItemDelegate, QStyleOptionViewItem,
+                             QCheckBox, QSpinBox)
+from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal, QSize, QRect
 from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
 from PyQt6.QtGui import QIcon, QPainter, QBrush, QColor
+from bsbp_tts_playback import StreamingAudioPlayer, buffer_source
+from bsbp_tts_audio import AudioBuffer, OutputFormat, StreamingEncoder, ENCODINGS
+from bsbp_tts_ui import EventLoopMonitor, MIN_OVERLAY_SECONDS
+from bsbp_tts_profile import PROFILE_BY_DEFAULT, StageProfiler, profiling, stage
+from bsbp_tts_cache import SegmentCache, SegmentMemo
+from bsbp_tts_backends import KOKORO_VOICES, Cancelled, CancellationToken, KokoroBackend, SynthesisStats
+from bsbp_tts_jobs import JobQueue, run_queue
+from bsbp_tts_metrics import dump_to_environment, start_from_environment
 
 # Suppress PyTorch deprecation warning
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
-# Import Kokoro TTS
-try:
-    from kokoro import KPipeline
-    import soundfile as sf
-    import torch
-except ImportError:
-    print("Error: Please install the required dependencies: pip install kokoro>=0.9.2 soundfile torch")
-    sys.exit(1)
+REPO_ID = 'hexgrad/Kokoro-82M'
+SAMPLE_RATE = 24000
 
 # Audio Generation Thread
 class AudioGenerationThread(QThread):
     progress = pyqtSignal(str)
     finished = pyqtSignal()
     error = pyqtSignal(str)
+    segment_ready = pyqtSignal(object)
+    cancelled = pyqtSignal(float)
 
-    def __init__(self, pipeline, text, voice, speed):
+    def __init__(self, backend, text, voice, speed, lang_code, use_cache=True, memo=None, encode_path=None, output_format=None,
+                 token=None, profiler=None):
         super().__init__()
-        self.pipeline = pipeline
+        self.backend = backend
         self.text = text
         self.voice = voice
         self.speed = speed
+        self.lang_code = lang_code
+        self.cache = backend.cache if use_cache else None
+        self.memo = memo
+        self.stats = None
+        self.first_segment_time = None
+        self.audio = None
+        self.buffer = AudioBuffer()
+        self.encode_path = encode_path
+        self.output_format = output_format
+        self.encoder = None
+        self.token = token or CancellationToken()
+        self.profiler = profiler
 
     def run(self):
+        # Waits for a queued job's current segment or a warm-up to finish before using the model
+        with profiling(self.profiler), self.backend.lock:
+            self.generate()
+
+    def generate(self):
         try:
             self.progress.emit(f"<span style='color:#F97316'>Starting audio generation...</span>")
             total_start = time.time()
-            generator = self.pipeline(self.text, voice=self.voice, speed=self.speed)
-            audio_segments = []
+            if self.encode_path is not None:
+                self.encoder = StreamingEncoder(self.encode_path, SAMPLE_RATE, self.output_format)
+            generator = self.backend.segments(self.text, self.voice, self.speed, self.lang_code, self.memo, self.token,
+                                              use_cache=self.cache is not None)
+            reused = 0
+            offsets = []
             generation_start = time.time()
-            for i, (gs, ps, audio) in enumerate(generator):
-                self.progress.emit(f"Generated segment {i}: {gs}")
-                audio_segments.append(audio)
+            self.stats = SynthesisStats(self.backend.sample_rate, self.backend.name)
+            for i, (gs, audio, source) in enumerate(generator):
+                self.stats.record(audio)
+                if self.first_segment_time is None:
+                    self.first_segment_time = self.stats.first_chunk_seconds
+                if source == "reused":
+                    reused += 1
+                else:
+                    self.progress.emit(f"{source.capitalize()} segment {i}: {gs}")
+                # Segments go straight into the output buffer; no list to concatenate afterwards
+                offsets.append((len(self.buffer), len(self.buffer) + len(audio)))
+                with stage("buffer"):
+                    self.buffer.append(audio)
+                if self.encoder is not None:
+                    self.encoder.write(audio)  # Encoded as produced, ready to be saved by renaming
+                self.segment_ready.emit(audio)
             generation_time = time.time() - generation_start
+            self.stats.finish()
+            if reused:
+                self.progress.emit(f"Reused {reused} unchanged segments from the previous run.")
+            if self.memo is not None and len(self.memo.audio) == len(offsets):
+                # Point the memo at the buffer instead of keeping a second copy of every segment
+                self.memo.audio = [self.buffer.view(start, end) for start, end in offsets]
 
             combine_start = time.time()
-            if audio_segments:
-                combined_audio = np.concatenate(audio_segments)
-                sf.write("out.wav", combined_audio, 22050)  # Use 22.05 kHz for better compatibility
-                self.progress.emit("Combined all segments into out.wav.")
+            if len(self.buffer):
+                # Kept in memory (or a memory-mapped spill file) for playback; nothing is saved until the user asks
+                self.audio = self.buffer.view()
+                self.progress.emit(self.buffer.describe())
             else:
                 self.progress.emit("No audio segments generated.")
             combine_time = time.time() - combine_start
 
             total_time = time.time() - total_start
+            if self.cache is not None:
+                self.progress.emit(self.cache.stats())
+            self.progress.emit(f"Synthesis: {self.stats.describe()}")
             self.progress.emit(f" Generation time: {generation_time:.2f} seconds")
             self.progress.emit(f"Combine time: {combine_time:.2f} seconds")
             self.progress.emit(f"<span style='color:#F97316'>Total time: {total_time:.2f} seconds</span>")
+            if self.encoder is not None:
+                self.encoder.close()
             self.finished.emit()
+        except Cancelled:
+            self.finish_stats("cancelled")
+            # The pipeline is idle again; report how long that took after the user pressed Cancel
+            self.cancelled.emit(time.time() - self.token.cancelled_at)
         except Exception as e:
+            self.finish_stats("error")
             self.error.emit(f"Error during audio generation: {str(e)}")
+        finally:
+            if self.encoder is not None:
+                self.encoder.close()
+            dump_to_environment()
+
+    def finish_stats(self, outcome):
+        if self.stats is not None:
+            self.stats.finish(outcome)
+
+# Job Queue Thread, renders queued long documents one after another; each finished segment is
+# persisted, so closing the window (or a crash) only loses the segment in progress
+class JobQueueThread(QThread):
+    progress = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, jobs, backend, output_format=None):
+        super().__init__()
+        self.jobs = jobs
+        self.backend = backend
+        self.output_format = output_format
+        self.token = CancellationToken()
+
+    def run(self):
+        try:
+            rendered = run_queue(self.jobs, lambda engine: self.backend, self.output_format, self.token,
+                                 self.report_progress, self.report_finished, engines=("kokoro",))
+            self.progress.emit(f"Job queue idle after {rendered} job(s). {self.jobs.describe()}")
+        except Cancelled:
+            self.progress.emit("Job queue paused; unfinished jobs resume from their last segment next time.")
+        except Exception as e:
+            self.error.emit(f"Job queue error: {str(e)}")
+
+    def report_progress(self, job, done, total):
+        self.progress.emit(f"Job {job['id']}: segment {done}/{total} ({100 * done // total}%), "
+                           f"queue depth {self.jobs.depth()}")
+
+    def report_finished(self, job, output_path, error):
+        if error is None:
+            self.progress.emit(f"<span style='color:#F97316'>Job {job['id']} done: {output_path}</span>")
+        elif error == "cancelled":
+            self.progress.emit(f"Job {job['id']} cancelled")
+        else:
+            self.progress.emit(f"Job {job['id']} failed: {error}")
+
+# Startup Loader Thread, does the heavy imports and the first model load after the window is shown
+class StartupLoaderThread(QThread):
+    progress = pyqtSignal(str)
+    loaded = pyqtSignal(object, object, str, object)
+    error = pyqtSignal(str)
+
+    def __init__(self, lang_code):
+        super().__init__()
+        self.lang_code = lang_code
+
+    def run(self):
+        timings = {}
+        try:
+            start = time.time()
+            self.progress.emit("Importing torch and kokoro...")
+            try:
+                # Loaded only to fail early on a missing dependency and to time the heavy imports
+                importlib.import_module("soundfile")
+                importlib.import_module("torch")
+                from bsbp_tts_pipelines import PipelineRegistry
+            except ImportError:
+                self.error.emit("Error: Please install the required dependencies: pip install kokoro>=0.9.2 soundfile torch")
+                return
+            timings["imports"] = time.time() - start
+
+            start = time.time()
+            self.progress.emit("Loading Kokoro model...")
+            registry = PipelineRegistry(repo_id=REPO_ID)
+            registry.load_model()
+            timings["model load"] = time.time() - start
+
+            start = time.time()
+            self.progress.emit(f"Initializing pipeline with lang_code: {self.lang_code}")
+            pipeline = registry.get(self.lang_code)
+            timings["pipeline"] = time.time() - start
+            self.loaded.emit(registry, pipeline, self.lang_code, timings)
+        except Exception as e:
+            self.error.emit(f"Error initializing pipeline: {str(e)}")
+
+# Warm-up Thread, runs a short utterance per voice so the first real request is at steady-state speed
+class WarmupThread(QThread):
+    warmed = pyqtSignal(object, str)
+    error = pyqtSignal(str)
+
+    def __init__(self, backend, lang_code, voices):
+        super().__init__()
+        self.backend = backend
+        self.lang_code = lang_code
+        self.voices = voices
+
+    def run(self):
+        try:
+            with self.backend.lock:
+                results = self.backend.warm_up(self.voices, self.lang_code)
+            self.warmed.emit(results, self.lang_code)
+        except Exception as e:
+            self.error.emit(f"Warm-up failed: {str(e)}")
+
+# Pipeline Loader Thread, builds (or fetches the warm) pipeline for a language off the GUI thread
+class PipelineLoaderThread(QThread):
+    loaded = pyqtSignal(object, str, float)
+    error = pyqtSignal(str)
+
+    def __init__(self, registry, lang_code):
+        super().__init__()
+        self.registry = registry
+        self.lang_code = lang_code
+
+    def run(self):
+        try:
+            start = time.time()
+            pipeline = self.registry.get(self.lang_code)
+            self.loaded.emit(pipeline, self.lang_code, time.time() - start)
+        except Exception as e:
+            self.error.emit(f"Error initializing pipeline: {str(e)}")
 
 # Circular Progress Indicator for Loading Screen
 class CircularProgressIndicator(QWidget):
@@ -192,6 +372,9 @@ class BSBPTTSWindow(QMainWindow):
             QLabel {
                 color: #D1D5DB;
             }
+            QCheckBox {
+                color: #D1D5DB;
+            }
         """)
         self.setGeometry(100, 100, 800, 600)
 
@@ -243,15 +426,7 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
 
         self.voice_combo = QComboBox()
         self.voice_combo.setItemDelegate(VoiceDelegate())
-        self.all_voices = [
-            "af_alloy", "af_aoede", "af_bella", "af_heart", "af_jessica", "af_kore", "af_nicole", "af_nova", "af_river", "af_sarah", "af_sky",
-            "am_adam", "am_echo", "am_eric", "am_fenrir", "am_liam", "am_michael", "am_onyx", "am_puck", "am_santa",
-            "bf_alice", "bf_emma", "bf_isabella", "bf_lily", "bm_daniel", "bm_fable", "bm_george", "bm_lewis",
-            "ef_dora", "em_alex", "em_santa", "ff_siwis", "hf_alpha", "hf_beta", "hm_omega", "hm_psi",
-            "if_sara", "im_nicola", "jf_alpha", "jf_gongitsune", "jf_nezumi", "jf_tebukuro", "jm_kumo",
-            "pf_dora", "pm_alex", "pm_santa", "zf_xiaobei", "zf_xiaoni", "zf_xiaoxiao", "zf_xiaoyi",
-            "zm_yunjian", "zm_yunxi", "zm_yunxia", "zm_yunyang"
-        ]
+        self.all_voices = list(KOKORO_VOICES)
         self.update_voice_combo()  # Populate voices based on initial language
         self.voice_combo.currentIndexChanged.connect(self.check_voice_availability)
         left_settings.addWidget(QLabel("Voice"))
@@ -268,6 +443,45 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         left_settings.addWidget(QLabel("Speed"))
         left_settings.addLayout(speed_layout)
 
+        self.stream_checkbox = QCheckBox("Stream playback while generating")
+        left_settings.addWidget(self.stream_checkbox)
+
+        cache_layout = QHBoxLayout()
+        self.cache_checkbox = QCheckBox("Use segment cache")
+        self.cache_checkbox.setChecked(True)
+        cache_layout.addWidget(self.cache_checkbox)
+        self.clear_cache_button = QPushButton("Clear Cache")
+        self.clear_cache_button.clicked.connect(self.clear_cache)
+        cache_layout.addWidget(self.clear_cache_button)
+        left_settings.addLayout(cache_layout)
+
+        self.warmup_checkbox = QCheckBox("Warm up voices after loading")
+        self.warmup_checkbox.setChecked(True)
+        self.warmup_checkbox.toggled.connect(self.warm_up_current_voice)
+        left_settings.addWidget(self.warmup_checkbox)
+
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("Save format"))
+        self.format_combo = QComboBox()
+        self.format_combo.addItems(["WAV", "FLAC", "Opus"])
+        format_layout.addWidget(self.format_combo)
+        left_settings.addLayout(format_layout)
+
+        self.profile_checkbox = QCheckBox("Profile stages (Chrome trace)")
+        self.profile_checkbox.setChecked(PROFILE_BY_DEFAULT)
+        left_settings.addWidget(self.profile_checkbox)
+
+        queue_layout = QHBoxLayout()
+        queue_layout.addWidget(QLabel("Priority"))
+        self.priority_spin = QSpinBox()
+        self.priority_spin.setRange(-10, 10)
+        queue_layout.addWidget(self.priority_spin)
+        self.queue_button = QPushButton("Add to Queue")
+        self.queue_button.setEnabled(False)
+        self.queue_button.clicked.connect(self.queue_job)
+        queue_layout.addWidget(self.queue_button)
+        left_settings.addLayout(queue_layout)
+
         settings_layout.addLayout(left_settings)
 
         # Right: Audio Player (hidden initially)
@@ -297,6 +511,11 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.generate_button.clicked.connect(self.generate_audio)
         buttons_layout.addWidget(self.generate_button)
 
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_generation)
+        buttons_layout.addWidget(self.cancel_button)
+
         self.save_button = QPushButton("Save Audio")
         self.save_button.setEnabled(False)
         self.save_button.clicked.connect(self.save_audio)
@@ -312,6 +531,13 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.seek_slider.sliderMoved.connect(self.seek_audio)
         self.player.mediaStatusChanged.connect(self.handle_media_status)
 
+        # Streaming player, fed segment by segment while generation is running
+        self.stream_player = StreamingAudioPlayer(sample_rate=24000, parent=self)
+        self.stream_player.first_audio.connect(self.on_first_audio)
+        self.stream_player.underrun.connect(lambda count: self.logs.append(f"Playback underrun #{count}, re-buffering..."))
+        self.stream_player.finished.connect(lambda underruns: self.logs.append(f"Streaming playback finished with {underruns} underrun(s)."))
+        self.streaming = False
+
         # Loading Screen with Circular Progress Indicator and Timer
         self.loading_overlay = QWidget(self)
         self.loading_overlay.setStyleSheet("background-color: rgba(0, 0, 0, 0.8);")
@@ -322,15 +548,67 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.timer_label = QLabel("Time Elapsed: 00:00")
         self.timer_label.setStyleSheet("color: #D1D5DB; font-size: 16px;")
         loading_layout.addWidget(self.timer_label, alignment=Qt.AlignmentFlag.AlignCenter)
+        # The overlay covers the main buttons, so it carries its own cancel button while generating
+        self.overlay_cancel_button = QPushButton("Cancel")
+        self.overlay_cancel_button.setVisible(False)
+        self.overlay_cancel_button.clicked.connect(self.cancel_generation)
+        loading_layout.addWidget(self.overlay_cancel_button, alignment=Qt.AlignmentFlag.AlignCenter)
 
         # Timer for elapsed time
         self.elapsed_timer = QTimer(self)
         self.elapsed_timer.timeout.connect(self.update_timer_label)
         self.elapsed_time = 0
+        self.loading_shown_at = 0
+        self.loading_id = 0
+        self.pipeline_loading_id = None  # The "Loading pipeline..." overlay, while one is up
+        self.event_loop_monitor = EventLoopMonitor(parent=self)
+        self.event_loop_monitor.start()
+
+        # Per-paragraph audio of the last run, for incremental re-synthesis
+        self.memo = SegmentMemo()
 
-        # Initialize Pipeline
+        # Persistent synthesis cache shared by all generations
+        try:
+            self.cache = SegmentCache()
+        except OSError as e:
+            self.cache = None
+            self.cache_checkbox.setEnabled(False)
+            self.clear_cache_button.setEnabled(False)
+            self.logs.append(f"Segment cache disabled: {str(e)}")
+
+        # Durable queue for long renders; it is started once the model is loaded
+        self.job_thread = None
+        try:
+            self.jobs = JobQueue()
+        except (OSError, sqlite3.Error) as e:
+            self.jobs = None
+            self.logs.append(f"Job queue disabled: {str(e)}")
+        metrics_status = start_from_environment()
+        if metrics_status:
+            self.logs.append(metrics_status)
+
+        # Initialize Pipeline in the background so the window shows right away
+        self.audio = None
+        self.audio_thread = None
+        self.generating = False  # Set from Generate until the thread reports finished, cancelled or error
+        self.encoded_path = None
+        self.saved_path = None
+        self.duration_ms = 0
+        self.output_format = OutputFormat()
+        self.logs.append(f"Output format: {self.output_format.describe()}")
+
+        self.registry = None
+        self.backend = None
         self.pipeline = None
+        self.pipeline_lang = None
+        self.pipeline_loaders = set()
+        self.startup_timings = {}
+        self.first_inference_logged = False
+        self.warmed_voices = set()
+        self.warmup_threads = set()
+        self.voice_combo.currentIndexChanged.connect(self.warm_up_current_voice)
         self.initialize_pipeline()
+        self.startup_timings["window"] = time.time() - STARTUP_START
 
     def resizeEvent(self, event):
         self.loading_overlay.setGeometry(self.rect())
@@ -342,32 +620,143 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         seconds = self.elapsed_time % 60
         self.timer_label.setText(f"Time Elapsed: {minutes:02d}:{seconds:02d}")
 
+    def current_lang_code(self):
+        return self.language_combo.currentText().split('(')[-1].strip(')')
+
     def initialize_pipeline(self):
-        self.show_loading_screen("Initializing pipeline...")
+        self.generate_button.setEnabled(False)
+        self.generate_button.setText("Loading model...")
+        self.startup_loader = StartupLoaderThread(self.current_lang_code())
+        self.startup_loader.progress.connect(self.logs.append)
+        self.startup_loader.loaded.connect(self.on_startup_loaded)
+        self.startup_loader.error.connect(self.on_pipeline_error)
+        self.startup_loader.start()
+
+    def on_startup_loaded(self, registry, pipeline, lang_code, timings):
+        self.registry = registry
+        self.backend = KokoroBackend(REPO_ID, self.cache, registry)
+        self.generate_button.setText("Generate Audio")
+        self.startup_timings.update(timings)
+        self.log_startup_timings()
+        self.resume_jobs()
+        if lang_code != self.current_lang_code():
+            self.load_pipeline(self.current_lang_code())  # Language changed while loading
+            return
+        self.pipeline = pipeline
+        self.pipeline_lang = lang_code
+        self.logs.append("Pipeline initialized successfully.")
+        self.logs.append(registry.voice_packs.describe())
+        self.generate_button.setEnabled(not self.generating)
+        self.warm_up_current_voice()
+
+    def resume_jobs(self):
+        if self.jobs is None:
+            return
+        self.queue_button.setEnabled(True)
+        recovered = self.jobs.recover()
+        if recovered:
+            self.logs.append(f"Resuming {recovered} interrupted job(s) from their last finished segment.")
+        if self.jobs.depth():
+            self.logs.append(self.jobs.describe())
+            self.start_job_queue()
+
+    def queue_job(self):
+        text = self.text_input.toPlainText()
+        voice = self.voice_combo.itemData(self.voice_combo.currentIndex())
         try:
-            lang_code = self.language_combo.currentText().split('(')[-1].strip(')')
-            self.logs.append(f"Initializing pipeline with lang_code: {lang_code}")
-            self.pipeline = KPipeline(lang_code=lang_code, repo_id='hexgrad/Kokoro-82M')
-            self.logs.append("Pipeline initialized successfully.")
-        except Exception as e:
-            self.logs.append(f"Error initializing pipeline: {str(e)}")
-            self.generate_button.setEnabled(False)
-        finally:
-            self.hide_loading_screen()
+            job_id = self.jobs.submit("kokoro", text, voice, self.speed_slider.value() / 10.0, self.current_lang_code(),
+                                      self.priority_spin.value(), self.format_combo.currentText().lower())
+        except ValueError as e:
+            self.logs.append(f"Could not queue job: {str(e)}")
+            return
+        total = self.jobs.progress(job_id)[1]
+        self.logs.append(f"Queued job {job_id} ({total} segments, priority {self.priority_spin.value()}); "
+                         f"queue depth {self.jobs.depth()}")
+        self.start_job_queue()
+
+    def start_job_queue(self):
+        if self.job_thread is not None and self.job_thread.isRunning():
+            return  # The running thread claims the new job when it gets to it
+        self.job_thread = JobQueueThread(self.jobs, self.backend, self.output_format)
+        self.job_thread.progress.connect(self.logs.append)
+        self.job_thread.error.connect(self.logs.append)
+        self.job_thread.start()
+
+    def log_startup_timings(self):
+        breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.startup_timings.items())
+        self.logs.append(f"<span style='color:#F97316'>Startup timing: {breakdown}</span>")
 
     def update_language_and_voices(self):
-        self.show_loading_screen("Updating language and voices...")
-        try:
-            lang_code = self.language_combo.currentText().split('(')[-1].strip(')')
-            self.logs.append(f"Reinitializing pipeline with lang_code: {lang_code}")
-            self.pipeline = KPipeline(lang_code=lang_code, repo_id='hexgrad/Kokoro-82M')
-            self.logs.append("Pipeline reinitialized successfully.")
-            self.update_voice_combo()
-        except Exception as e:
-            self.logs.append(f"Error reinitializing pipeline: {str(e)}")
-            self.generate_button.setEnabled(False)
-        finally:
-            self.hide_loading_screen()
+        lang_code = self.current_lang_code()
+        self.update_voice_combo()
+        if self.registry is None:
+            return  # The startup loader picks up the new language when it finishes
+        pipeline = self.registry.cached(lang_code)
+        if pipeline is not None:
+            self.pipeline = pipeline
+            self.pipeline_lang = lang_code
+            self.logs.append(f"Switched to warm pipeline for lang_code: {lang_code}")
+            self.generate_button.setEnabled(not self.generating)
+            self.hide_pipeline_loading_screen()  # Left up by a load for the language switched away from
+            self.warm_up_current_voice()
+            return
+        self.logs.append(f"Loading pipeline for lang_code: {lang_code}")
+        self.load_pipeline(lang_code)
+
+    def load_pipeline(self, lang_code):
+        self.pipeline = None
+        self.pipeline_lang = None
+        self.generate_button.setEnabled(False)
+        self.show_loading_screen("Loading pipeline...")
+        self.pipeline_loading_id = self.loading_id
+        loader = PipelineLoaderThread(self.registry, lang_code)
+        loader.loaded.connect(self.on_pipeline_loaded)
+        loader.error.connect(self.on_pipeline_error)
+        loader.finished.connect(lambda: self.pipeline_loaders.discard(loader))
+        self.pipeline_loaders.add(loader)
+        loader.start()
+
+    def on_pipeline_loaded(self, pipeline, lang_code, seconds):
+        self.logs.append(f"Pipeline for lang_code {lang_code} ready in {seconds:.2f} seconds.")
+        self.logs.append(self.registry.voice_packs.describe())
+        if lang_code != self.current_lang_code():
+            # The user already switched to another language; a load for that one keeps its own overlay
+            self.hide_pipeline_loading_screen()
+            return
+        self.pipeline = pipeline
+        self.pipeline_lang = lang_code
+        self.generate_button.setEnabled(not self.generating)
+        self.hide_pipeline_loading_screen()
+        self.warm_up_current_voice()
+
+    def on_pipeline_error(self, error_message):
+        self.logs.append(error_message)
+        self.generate_button.setText("Generate Audio")
+        self.generate_button.setEnabled(False)
+        self.hide_loading_screen()
+
+    def warm_up_current_voice(self):
+        # The voice combo also changes during a language switch, before that language's pipeline is in
+        # place (pipeline_lang is None while it loads); on_pipeline_loaded warms up once it is
+        voice = self.voice_combo.itemData(self.voice_combo.currentIndex())
+        lang_code = self.current_lang_code()
+        if not self.warmup_checkbox.isChecked() or self.pipeline is None or voice is None:
+            return
+        if self.pipeline_lang != lang_code:
+            return
+        if (lang_code, voice) in self.warmed_voices:
+            return
+        self.warmed_voices.add((lang_code, voice))
+        thread = WarmupThread(self.backend, lang_code, [voice])
+        thread.warmed.connect(self.on_warmed_up)
+        thread.error.connect(self.logs.append)
+        thread.finished.connect(lambda: self.warmup_threads.discard(thread))
+        self.warmup_threads.add(thread)
+        thread.start()
+
+    def on_warmed_up(self, timings, lang_code):
+        for voice, cold, warm in timings:
+            self.logs.append(f"Warmed up {voice} ({lang_code}): cold {cold:.2f}s, warm {warm:.2f}s")
 
     def update_voice_combo(self):
         self.voice_combo.clear()
@@ -380,6 +769,11 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
             display_text = f"{icon} {name}"
             self.voice_combo.addItem(display_text, voice)
 
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+            self.logs.append("Segment cache cleared.")
+
     def update_speed_label(self):
         speed = self.speed_slider.value() / 10.0
         self.speed_label.setText(f"{speed:.1f}x")
@@ -395,6 +789,7 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
             self.update_voice_combo()
 
     def toggle_play(self):
+        self.stream_player.stop()
         if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
             self.player.pause()
             self.play_button.setText("▶")
@@ -403,13 +798,23 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
             self.play_button.setText("⏸")
 
     def handle_media_status(self, status):
-        if status == QMediaPlayer.MediaStatus.EndOfMedia:
+        if status == QMediaPlayer.MediaStatus.LoadedMedia and not self.player_widget.isVisible():
+            self.update_duration()
+            self.player_widget.setVisible(True)
+            self.save_button.setEnabled(True)
+            self.hide_loading_screen()
+            self.logs.append(self.event_loop_monitor.report())
+        elif status == QMediaPlayer.MediaStatus.InvalidMedia:
+            self.logs.append(f"Error loading audio for playback: {self.player.errorString()}")
+            self.save_button.setEnabled(True)
+            self.hide_loading_screen()
+        elif status == QMediaPlayer.MediaStatus.EndOfMedia:
             self.play_button.setText("▶")
             self.player.setPosition(0)  # Optional: rewind to start
 
     def update_seek_slider(self, position):
         self.seek_slider.setValue(position)
-        duration = self.player.duration()
+        duration = self.duration_ms
         self.seek_slider.setRange(0, duration)
         pos_minutes = position // 60000
         pos_seconds = (position % 60000) // 1000
@@ -418,7 +823,7 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.time_label.setText(f"{pos_minutes:02d}:{pos_seconds:02d} / {dur_minutes:02d}:{dur_seconds:02d}")
 
     def update_duration(self):
-        duration = self.player.duration()
+        duration = self.duration_ms
         self.seek_slider.setRange(0, duration)
         dur_minutes = duration // 60000
         dur_seconds = (duration % 60000) // 1000
@@ -428,26 +833,81 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.player.setPosition(self.seek_slider.value())
 
     def generate_audio(self):
+        if self.generating:
+            return  # A language switch must not let a second click close the buffer the running thread writes to
+        self.generating = True
         self.show_loading_screen("Generating audio...")
         self.player.stop()  # Stop current playback
+        self.stream_player.stop()
         self.play_button.setText("▶")  # Reset button
         self.player_widget.setVisible(False)
         self.save_button.setEnabled(False)
+        self.generate_button.setEnabled(False)
 
         text = self.text_input.toPlainText()
         voice = self.voice_combo.itemData(self.voice_combo.currentIndex())
         speed = self.speed_slider.value() / 10.0
+        lang_code = self.current_lang_code()
 
         self.logs.append(f"Input text length: {len(text)} characters")
+        self.event_loop_monitor.reset()
 
         # Start audio generation in a separate thread
-        self.audio_thread = AudioGenerationThread(self.pipeline, text, voice, speed)
+        if self.audio_thread is not None:
+            self.audio_thread.wait()  # Its terminal signal can arrive before run() has returned
+            self.audio_thread.buffer.close()  # Drops the spill file of the previous run, if any
+        self.discard_encoded_file()
+        encoding = self.format_combo.currentText().lower()
+        fd, self.encoded_path = tempfile.mkstemp(prefix="bsbp_tts_", suffix=ENCODINGS[encoding][0])
+        os.close(fd)
+        self.audio_thread = AudioGenerationThread(self.backend, text, voice, speed, lang_code, self.cache_checkbox.isChecked(),
+                                                  self.memo, self.encoded_path, self.output_format,
+                                                  profiler=StageProfiler() if self.profile_checkbox.isChecked() else None)
         self.audio_thread.progress.connect(self.logs.append)
         self.audio_thread.finished.connect(self.on_audio_generation_finished)
         self.audio_thread.error.connect(self.on_audio_generation_error)
+        self.audio_thread.cancelled.connect(self.on_audio_generation_cancelled)
+        self.set_cancel_enabled(True)
+        self.streaming = self.stream_checkbox.isChecked()
+        if self.streaming:
+            self.stream_player.start(time.time())
+            self.audio_thread.segment_ready.connect(self.stream_player.push_segment)
         self.audio_thread.start()
 
+    def on_first_audio(self, latency):
+        self.logs.append(f"<span style='color:#F97316'>Time to first audio: {latency:.2f} seconds</span>")
+        # Let the user follow the log while the remaining segments are generated
+        self.hide_loading_screen()
+
+    def set_cancel_enabled(self, enabled):
+        self.cancel_button.setEnabled(enabled)
+        self.overlay_cancel_button.setVisible(enabled)
+
+    def cancel_generation(self):
+        if self.audio_thread is not None and self.audio_thread.isRunning():
+            self.logs.append("Cancelling generation...")
+            self.set_cancel_enabled(False)
+            self.audio_thread.token.cancel()
+
+    def on_audio_generation_cancelled(self, release_seconds):
+        self.logs.append(f"<span style='color:#F97316'>Generation cancelled; pipeline released "
+                         f"{release_seconds * 1000:.0f} ms after cancel</span>")
+        self.stream_player.stop()
+        self.generating = False
+        self.generate_button.setEnabled(self.pipeline is not None)
+        self.hide_loading_screen()
+
     def on_audio_generation_finished(self):
+        self.set_cancel_enabled(False)
+        if self.streaming:
+            self.stream_player.end_of_stream()
+        self.generating = False
+        self.generate_button.setEnabled(self.pipeline is not None)
+        if not self.first_inference_logged and self.audio_thread.first_segment_time is not None:
+            self.first_inference_logged = True
+            self.startup_timings["first inference"] = self.audio_thread.first_segment_time
+            self.log_startup_timings()
+        self.report_profile(self.audio_thread.profiler)
         # Reset QMediaPlayer to ensure a clean state
         self.player = QMediaPlayer()
         self.audio_output = QAudioOutput()
@@ -457,52 +917,92 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.seek_slider.sliderMoved.connect(self.seek_audio)
         self.player.mediaStatusChanged.connect(self.handle_media_status)
 
-        self.player.setSource(QUrl.fromLocalFile("out.wav"))
-        # Wait for duration with a longer timeout
-        start_time = time.time()
-        while self.player.duration() == 0 and (time.time() - start_time) < 10:  # 10-second timeout
-            QApplication.processEvents()
-            time.sleep(0.1)
-        duration_ms = self.player.duration()
-        duration_sec = duration_ms / 1000
-        # Verify file duration
-        audio_data, sr = sf.read("out.wav")
-        file_duration_sec = len(audio_data) / sr
-        self.logs.append(f"File duration: {file_duration_sec:.2f} seconds")
-        self.update_duration()
-        self.player_widget.setVisible(True)
-        self.save_button.setEnabled(True)
-        self.hide_loading_screen()
+        self.audio = self.audio_thread.audio
+        if self.audio is None:
+            self.hide_loading_screen()
+            return
+        self.duration_ms = len(self.audio) * 1000 // SAMPLE_RATE
+        buffer_source(self.player, self.audio, SAMPLE_RATE)
+        self.logs.append(f"Audio duration: {self.duration_ms / 1000:.2f} seconds")
+        # The player is revealed from handle_media_status once the media has loaded
+
+    def report_profile(self, profiler):
+        if profiler is None:
+            return
+        self.logs.append(profiler.describe())
+        path = os.path.join(tempfile.gettempdir(), f"bsbp_tts_trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            self.logs.append(f"Stage trace written to {profiler.export(path)} (open in ui.perfetto.dev or chrome://tracing)")
+        except OSError as e:
+            self.logs.append(f"Could not write stage trace: {str(e)}")
 
     def on_audio_generation_error(self, error_message):
+        self.set_cancel_enabled(False)
         self.logs.append(error_message)
+        self.stream_player.stop()
+        self.generating = False
+        self.generate_button.setEnabled(self.pipeline is not None)
         self.hide_loading_screen()
 
     def save_audio(self):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        default_filename = f"bsbp_tts_{timestamp}.wav"
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save Audio File", default_filename, "WAV Files (*.wav);;All Files (*)")
+        extension = os.path.splitext(self.encoded_path)[1]
+        default_filename = f"bsbp_tts_{timestamp}{extension}"
+        file_filter = f"{extension[1:].upper()} Files (*{extension});;All Files (*)"
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Audio File", default_filename, file_filter)
         if file_path:
             try:
-                import shutil
-                shutil.copy("out.wav", file_path)
+                # The file was encoded during generation; saving only moves it (a copy if it is saved again)
+                if self.saved_path is not None:
+                    shutil.copy(self.saved_path, file_path)
+                else:
+                    try:
+                        os.replace(self.encoded_path, file_path)
+                    except OSError:
+                        shutil.move(self.encoded_path, file_path)  # Different filesystem
+                    self.saved_path = file_path
                 self.logs.append(f"Audio saved to {file_path}")
             except Exception as e:
                 self.logs.append(f"Error saving audio: {str(e)}")
 
+    def discard_encoded_file(self):
+        if self.encoded_path is not None and self.saved_path is None and os.path.exists(self.encoded_path):
+            os.remove(self.encoded_path)
+        self.encoded_path = None
+        self.saved_path = None
+
+    def closeEvent(self, event):
+        self.discard_encoded_file()
+        if self.job_thread is not None and self.job_thread.isRunning():
+            # Stops after the current segment; the job stays queued with everything rendered so far
+            self.job_thread.token.cancel()
+            self.job_thread.wait()
+        super().closeEvent(event)
+
     def show_loading_screen(self, message=""):
         self.loading_overlay.setVisible(True)
         self.timer_label.setText(message)
         self.elapsed_time = 0
         self.timer_label.setText(f"{message} Time Elapsed: 00:00")
         self.elapsed_timer.start(1000)
+        self.loading_shown_at = time.time()
+        self.loading_id += 1
         QApplication.processEvents()
 
-    def hide_loading_screen(self):
-        # Ensure the loading screen is visible for at least 1 second
-        elapsed = self.elapsed_time
-        if elapsed < 1:
-            time.sleep(1 - elapsed)
+    def hide_loading_screen(self, loading_id=None):
+        # Keep the loading screen up for at least MIN_OVERLAY_SECONDS, but let the event loop run meanwhile
+        remaining = MIN_OVERLAY_SECONDS - (time.time() - self.loading_shown_at)
+        loading_id = self.loading_id if loading_id is None else loading_id
+        QTimer.singleShot(max(0, int(remaining * 1000)), lambda: self.dismiss_loading_screen(loading_id))
+
+    def hide_pipeline_loading_screen(self):
+        # Only the pipeline overlay: a no-op once a newer one (another load, a generation) replaced it
+        if self.pipeline_loading_id is not None:
+            self.hide_loading_screen(self.pipeline_loading_id)
+
+    def dismiss_loading_screen(self, loading_id):
+        if loading_id != self.loading_id:
+            return  # A newer loading screen was shown since
         self.loading_overlay.setVisible(False)
         self.elapsed_timer.stop()
 
@@ -0,0 +1,212 @@
+import os
+import math
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# BSBP_TTS_METRICS=0 turns every update into a no-op
+ENABLED = os.environ.get("BSBP_TTS_METRICS", "1") not in ("", "0", "false", "no")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; from sub-millisecond stages up to minute-long Orpheus requests
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for name, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+# Metric families keep one value (or bucket array) per label combination. Updates take one dict lookup
+# under a per-metric lock, so they can sit in the segment loop.
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, (), value) for key, value in self.values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{format_labels(self.labelnames, key, extra)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, value=1, **labels):
+        if not ENABLED:
+            return
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if not ENABLED:
+            return
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, value=1, **labels):
+        if not ENABLED:
+            return
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            states = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+        for key, counts, total, count in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", key, (("le", format_value(float(bound))),), cumulative))
+            samples.append((f"{self.name}_sum", key, (), total))
+            samples.append((f"{self.name}_count", key, (), count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics[metric.name] = metric
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def dump(self, path):
+        # Atomic, so a textfile collector never reads half a file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+        return path
+
+
+REGISTRY = Registry()
+
+REQUESTS = Counter("bsbp_tts_requests_total", "Synthesis requests by engine and outcome", ("engine", "outcome"))
+SEGMENTS = Counter("bsbp_tts_segments_total", "Audio chunks produced", ("engine",))
+AUDIO_SECONDS = Counter("bsbp_tts_audio_seconds_total", "Seconds of audio produced", ("engine",))
+SYNTHESIS_SECONDS = Counter("bsbp_tts_synthesis_seconds_total", "Wall-clock seconds spent synthesizing", ("engine",))
+TIME_TO_FIRST_AUDIO = Histogram("bsbp_tts_time_to_first_audio_seconds", "Request start to first audio chunk", ("engine",))
+CHUNK_LATENCY = Histogram("bsbp_tts_chunk_latency_seconds", "Wait between consecutive audio chunks", ("engine",))
+STAGE_SECONDS = Histogram("bsbp_tts_stage_seconds", "Per-stage latency (split, pipeline, encode, ...)", ("stage",))
+CACHE_LOOKUPS = Counter("bsbp_tts_cache_lookups_total", "Kokoro segment lookups: hit, miss or reused (previous run)", ("result",))
+CACHE_BYTES = Gauge("bsbp_tts_cache_bytes", "Size of the segment cache on disk")
+QUEUE_DEPTH = Gauge("bsbp_tts_queue_depth", "Work waiting or running", ("queue",))
+JOBS = Counter("bsbp_tts_jobs_total", "Render jobs finished, by final status", ("status",))
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would drown the log
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    # Serves GET /metrics from a daemon thread; returns the server so callers can shut it down
+    handler = type("BoundMetricsRequestHandler", (MetricsRequestHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="bsbp-metrics", daemon=True).start()
+    return server
+
+
+def start_from_environment():
+    # BSBP_TTS_METRICS_PORT starts the scrape endpoint; returns a status line for the log, or None
+    port = os.environ.get("BSBP_TTS_METRICS_PORT")
+    if not port or not ENABLED:
+        return None
+    try:
+        server = start_http_server(int(port))
+    except (OSError, ValueError) as e:
+        return f"Metrics endpoint not started: {str(e)}"
+    return f"Metrics at http://{server.server_address[0]}:{server.server_address[1]}/metrics"
+
+
+def dump_to_environment():
+    # Writes the registry to BSBP_TTS_METRICS_FILE, if set
+    path = os.environ.get("BSBP_TTS_METRICS_FILE")
+    if path and ENABLED:
+        try:
+            REGISTRY.dump(path)
+        except OSError:
+            pass
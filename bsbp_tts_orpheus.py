@@ -1,79 +1,181 @@
+import time
+STARTUP_START = time.time()
+
 import os
-os.environ["VLLM_CPU_KVCACHE_SPACE"] = "8"
+from bsbp_tts_backends import Cancelled, CancellationToken, OrpheusBackend, OrpheusLimits, OrpheusRun, SynthesisStats
+# Size the CPU KV cache from the configured limits before vLLM reads it at import time
+os.environ.setdefault("VLLM_CPU_KVCACHE_SPACE", str(OrpheusLimits().kv_cache_gib))
 
+import importlib
 import sys
-import vllm
+import sqlite3
+import tempfile
 from datetime import datetime
-import time
 import traceback
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QStyle, QWidget, QVBoxLayout, QHBoxLayout,
-                             QTextEdit, QComboBox, QSlider, QPushButton, QLabel, QFileDialog, QStyledItemDelegate, QStyleOptionViewItem)
-from PyQt6.QtCore import Qt, QTimer, QUrl, QThread, pyqtSignal, QSize, QRect
+                             QTextEdit, QComboBox, QSlider, QPushButton, QLabel, QFileDialog, QStyledItemDelegate, QStyleOptionViewItem,
+                             QCheckBox, QSpinBox)
+from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal, QSize, QRect
 from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
 from PyQt6.QtGui import QIcon, QPainter, QBrush, QColor
+from bsbp_tts_playback import StreamingAudioPlayer, PCMRingBuffer, buffer_source
+from bsbp_tts_audio import AudioBuffer, OutputFormat, StreamingEncoder, float_to_pcm16
+from bsbp_tts_ui import EventLoopMonitor, MIN_OVERLAY_SECONDS
+from bsbp_tts_profile import PROFILE_BY_DEFAULT, StageProfiler, profiling
+from bsbp_tts_jobs import JobQueue, run_queue
+from bsbp_tts_metrics import dump_to_environment, start_from_environment
+
+# Seconds of audio the playback ring buffer holds before generation has to wait for playback
+RING_BUFFER_SECONDS = 30
 
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning)
 
-try:
-    from orpheus_tts import OrpheusModel
-    import wave
-    import torch
-except ImportError:
-    print("Error: Please install the required dependencies: pip install orpheus-speech vllm torch")
-    sys.exit(1)
-
 class AudioGenerationThread(QThread):
     progress = pyqtSignal(str)
     finished = pyqtSignal()
     error = pyqtSignal(str)
+    cancelled = pyqtSignal(float)
 
-    def __init__(self, model, text, voice, speed):
+    def __init__(self, backend, text, voice, speed, batch=True, ring=None, token=None, profiler=None):
         super().__init__()
-        self.model = model
+        self.backend = backend
         self.text = text
         self.voice = voice
         self.speed = speed
+        self.batch = batch
+        self.ring = ring
+        self.first_chunk_time = None
+        self.stats = None
+        self.buffer = AudioBuffer()
+        self.audio = None
+        self.token = token or CancellationToken()
+        self.run_state = OrpheusRun()  # This generation's requests, KV peak and release time
+        self.profiler = profiler
 
     def run(self):
+        # Waits for a queued job's current segment or a warm-up to finish before using the model
+        with profiling(self.profiler), self.backend.lock:
+            self.generate()
+
+    def generate(self):
         try:
             self.progress.emit("Starting audio generation...")
             total_start = time.time()
 
-            prompt = f"{self.voice}: {self.text}"
-            temperature = 0.7 * self.speed
-            repetition_penalty = max(1.1, self.speed)
-            generation_start = time.time()
-            syn_tokens = self.model.generate_speech(
-                prompt=prompt,
-                voice=self.voice,
-                temperature=temperature,
-                repetition_penalty=repetition_penalty
-            )
-            generation_time = time.time() - generation_start
-
-            combine_start = time.time()
-            with wave.open("out.wav", "wb") as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(2)
-                wf.setframerate(24000)
-
-                total_frames = 0
-                for audio_chunk in syn_tokens:
-                    frame_count = len(audio_chunk) // (wf.getsampwidth() * wf.getnchannels())
-                    total_frames += frame_count
-                    wf.writeframes(audio_chunk)
-                duration = total_frames / wf.getframerate()
-
-            combine_time = time.time() - combine_start
+            # Kept in memory for playback; nothing is written to disk until the user saves
+            self.stats = SynthesisStats(self.backend.sample_rate)
+            for audio in self.backend.stream(self.text, self.voice, self.speed, token=self.token, stats=self.stats,
+                                             batch=self.batch, run=self.run_state):
+                if self.first_chunk_time is None:
+                    self.first_chunk_time = self.stats.first_chunk_seconds
+                self.buffer.append(audio)
+                if self.ring is not None:
+                    self.ring.write(float_to_pcm16(audio))
+            if len(self.buffer):
+                self.audio = self.buffer.view()
+
             total_time = time.time() - total_start
-            self.progress.emit("Audio saved to out.wav.")
-            self.progress.emit(f"<span style='color:#F97316'>Generation time: {generation_time:.2f} seconds</span>")
-            self.progress.emit(f"<span style='color:#F97316'>Combine time: {combine_time:.2f} seconds</span>")
+            self.progress.emit(self.backend.memory_report(self.run_state))
+            self.progress.emit(f"<span style='color:#F97316'>Synthesis: {self.stats.describe()}</span>")
             self.progress.emit(f"<span style='color:#F97316'>Total time: {total_time:.2f} seconds</span>")
             self.finished.emit()
+        except Cancelled:
+            # release_seconds: cancel until the last aborted vLLM request (and its KV blocks) was gone
+            release = self.run_state.release_seconds
+            self.cancelled.emit(release if release is not None else time.time() - self.token.cancelled_at)
         except Exception as e:
             self.error.emit(f"Error during audio generation: {str(e)}")
+        finally:
+            if self.ring is not None:
+                self.ring.close()
+            dump_to_environment()
+
+# Job Queue Thread, renders queued long documents one after another; each finished segment is
+# persisted, so closing the window (or a crash) only loses the segment in progress
+class JobQueueThread(QThread):
+    progress = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, jobs, backend, output_format=None):
+        super().__init__()
+        self.jobs = jobs
+        self.backend = backend
+        self.output_format = output_format
+        self.token = CancellationToken()
+
+    def run(self):
+        try:
+            rendered = run_queue(self.jobs, lambda engine: self.backend, self.output_format, self.token,
+                                 self.report_progress, self.report_finished, engines=("orpheus",))
+            self.progress.emit(f"Job queue idle after {rendered} job(s). {self.jobs.describe()}")
+        except Cancelled:
+            self.progress.emit("Job queue paused; unfinished jobs resume from their last segment next time.")
+        except Exception as e:
+            self.error.emit(f"Job queue error: {str(e)}")
+
+    def report_progress(self, job, done, total):
+        self.progress.emit(f"Job {job['id']}: segment {done}/{total} ({100 * done // total}%), "
+                           f"queue depth {self.jobs.depth()}")
+
+    def report_finished(self, job, output_path, error):
+        if error is None:
+            self.progress.emit(f"<span style='color:#F97316'>Job {job['id']} done: {output_path}</span>")
+        elif error == "cancelled":
+            self.progress.emit(f"Job {job['id']} cancelled")
+        else:
+            self.progress.emit(f"Job {job['id']} failed: {error}")
+
+# Model Loader Thread, imports torch/vllm/orpheus_tts and starts the engine after the window is shown
+class ModelLoaderThread(QThread):
+    progress = pyqtSignal(str)
+    loaded = pyqtSignal(object, object)
+    error = pyqtSignal(str)
+
+    def run(self):
+        timings = {}
+        try:
+            start = time.time()
+            self.progress.emit("Importing torch, vLLM and orpheus_tts...")
+            try:
+                import torch
+                import vllm
+                importlib.import_module("orpheus_tts")  # Only checked and timed here; the backend imports it itself
+            except ImportError:
+                self.error.emit("Error: Please install the required dependencies: pip install orpheus-speech vllm torch")
+                return
+            timings["imports"] = time.time() - start
+
+            start = time.time()
+            self.progress.emit("Loading Orpheus-3b-0.1-ft from Hugging Face...")
+            backend = OrpheusBackend()
+            self.progress.emit(f"Detected device: {backend.device}")
+            self.progress.emit(f"PyTorch version: {torch.__version__}")
+            self.progress.emit(f"vLLM version: {vllm.__version__}")
+            self.progress.emit(f"Engine limits: {backend.limits.describe()}")
+            backend.load()
+            timings["model load"] = time.time() - start
+            self.loaded.emit(backend, timings)
+        except Exception as e:
+            self.error.emit(f"Error initializing Orpheus model: {str(e)}\nTraceback: {traceback.format_exc()}")
+
+# Warm-up Thread, sends short requests per voice so the first real request is at steady-state speed
+class WarmupThread(QThread):
+    warmed = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+    def __init__(self, backend, voices):
+        super().__init__()
+        self.backend = backend
+        self.voices = voices
+
+    def run(self):
+        try:
+            with self.backend.lock:
+                results = self.backend.warm_up(self.voices)
+            self.warmed.emit(results)
+        except Exception as e:
+            self.error.emit(f"Warm-up failed: {str(e)}")
 
 class CircularProgressIndicator(QWidget):
     def __init__(self, parent=None):
@@ -136,6 +238,7 @@ class BSBPTTSWindow(QMainWindow):
             QSlider::groove:horizontal { background: #F97316; height: 8px; border-radius: 4px; }
             QSlider::handle:horizontal { background: #FFFFFF; width: 16px; height: 16px; border-radius: 8px; margin: -4px 0; }
             QLabel { color: #D1D5DB; }
+            QCheckBox { color: #D1D5DB; }
         """)
         self.setGeometry(100, 100, 800, 600)
 
@@ -186,6 +289,33 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         left_settings.addWidget(QLabel("Speed"))
         left_settings.addLayout(speed_layout)
 
+        self.batch_checkbox = QCheckBox("Generate sentences in parallel")
+        self.batch_checkbox.setChecked(True)
+        left_settings.addWidget(self.batch_checkbox)
+
+        self.stream_checkbox = QCheckBox("Stream playback while generating")
+        left_settings.addWidget(self.stream_checkbox)
+
+        # Off by default: two short requests for each of the eight voices take a while on CPU/MPS
+        self.warmup_checkbox = QCheckBox("Warm up all voices after loading")
+        self.warmup_checkbox.toggled.connect(self.warm_up_voices)
+        left_settings.addWidget(self.warmup_checkbox)
+
+        self.profile_checkbox = QCheckBox("Profile stages (Chrome trace)")
+        self.profile_checkbox.setChecked(PROFILE_BY_DEFAULT)
+        left_settings.addWidget(self.profile_checkbox)
+
+        queue_layout = QHBoxLayout()
+        queue_layout.addWidget(QLabel("Priority"))
+        self.priority_spin = QSpinBox()
+        self.priority_spin.setRange(-10, 10)
+        queue_layout.addWidget(self.priority_spin)
+        self.queue_button = QPushButton("Add to Queue")
+        self.queue_button.setEnabled(False)
+        self.queue_button.clicked.connect(self.queue_job)
+        queue_layout.addWidget(self.queue_button)
+        left_settings.addLayout(queue_layout)
+
         settings_layout.addLayout(left_settings)
 
         self.player_widget = QWidget()
@@ -213,6 +343,11 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.generate_button.clicked.connect(self.generate_audio)
         buttons_layout.addWidget(self.generate_button)
 
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_generation)
+        buttons_layout.addWidget(self.cancel_button)
+
         self.save_button = QPushButton("Save Audio")
         self.save_button.setEnabled(False)
         self.save_button.clicked.connect(self.save_audio)
@@ -227,6 +362,12 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.seek_slider.sliderMoved.connect(self.seek_audio)
         self.player.mediaStatusChanged.connect(self.handle_media_status)
 
+        self.stream_player = StreamingAudioPlayer(sample_rate=24000, parent=self)
+        self.stream_player.first_audio.connect(self.on_first_audio)
+        self.stream_player.underrun.connect(lambda count: self.logs.append(f"Playback underrun #{count}, re-buffering..."))
+        self.stream_player.finished.connect(self.on_stream_finished)
+        self.stream_start = 0
+
         self.loading_overlay = QWidget(self)
         self.loading_overlay.setStyleSheet("background-color: rgba(0, 0, 0, 0.8);")
         self.loading_overlay.setVisible(False)
@@ -236,13 +377,44 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.timer_label = QLabel("Time Elapsed: 00:00")
         self.timer_label.setStyleSheet("color: #D1D5DB; font-size: 16px;")
         loading_layout.addWidget(self.timer_label, alignment=Qt.AlignmentFlag.AlignCenter)
+        # The overlay covers the main buttons, so it carries its own cancel button while generating
+        self.overlay_cancel_button = QPushButton("Cancel")
+        self.overlay_cancel_button.setVisible(False)
+        self.overlay_cancel_button.clicked.connect(self.cancel_generation)
+        loading_layout.addWidget(self.overlay_cancel_button, alignment=Qt.AlignmentFlag.AlignCenter)
 
         self.elapsed_timer = QTimer(self)
         self.elapsed_timer.timeout.connect(self.update_timer_label)
         self.elapsed_time = 0
+        self.loading_shown_at = 0
+        self.loading_id = 0
+        self.event_loop_monitor = EventLoopMonitor(parent=self)
+        self.event_loop_monitor.start()
 
+        # Durable queue for long renders; it is started once the model is loaded
+        self.job_thread = None
+        try:
+            self.jobs = JobQueue()
+        except (OSError, sqlite3.Error) as e:
+            self.jobs = None
+            self.logs.append(f"Job queue disabled: {str(e)}")
+        metrics_status = start_from_environment()
+        if metrics_status:
+            self.logs.append(metrics_status)
+
+        # Load the model in the background so the window shows right away
+        self.backend = None
         self.model = None
+        self.audio_thread = None
+        self.audio = None
+        self.duration_ms = 0
+        self.output_format = OutputFormat()
+        self.logs.append(f"Output format: {self.output_format.describe()}")
+        self.startup_timings = {}
+        self.first_inference_logged = False
+        self.warmup_thread = None
         self.initialize_model()
+        self.startup_timings["window"] = time.time() - STARTUP_START
 
     def resizeEvent(self, event):
         self.loading_overlay.setGeometry(self.rect())
@@ -255,32 +427,93 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.timer_label.setText(f"Time Elapsed: {minutes:02d}:{seconds:02d}")
 
     def initialize_model(self):
-        self.show_loading_screen("Initializing Orpheus TTS model...")
+        self.generate_button.setEnabled(False)
+        self.generate_button.setText("Loading model...")
+        self.model_loader = ModelLoaderThread()
+        self.model_loader.progress.connect(self.logs.append)
+        self.model_loader.loaded.connect(self.on_model_loaded)
+        self.model_loader.error.connect(self.on_model_error)
+        self.model_loader.start()
+
+    def on_model_loaded(self, backend, timings):
+        self.backend = backend
+        self.model = backend.model
+        self.logs.append(f"Orpheus model initialized successfully on {backend.device}.")
+        self.startup_timings.update(timings)
+        self.log_startup_timings()
+        self.generate_button.setText("Generate Audio")
+        self.generate_button.setEnabled(True)
+        self.warm_up_voices()
+        self.resume_jobs()
+
+    def resume_jobs(self):
+        if self.jobs is None:
+            return
+        self.queue_button.setEnabled(True)
+        recovered = self.jobs.recover()
+        if recovered:
+            self.logs.append(f"Resuming {recovered} interrupted job(s) from their last finished segment.")
+        if self.jobs.depth():
+            self.logs.append(self.jobs.describe())
+            self.start_job_queue()
+
+    def queue_job(self):
+        text = self.text_input.toPlainText()
+        voice = self.voice_combo.currentText()
         try:
-            self.logs.append("Loading Orpheus-3b-0.1-ft from Hugging Face...")
-            device = "mps" if torch.backends.mps.is_available() else "cpu"
-            self.logs.append(f"Detected device: {device}")
-            self.logs.append(f"PyTorch version: {torch.__version__}")
-            self.logs.append(f"vLLM version: {vllm.__version__}")
-            self.model = OrpheusModel(
-                model_name="canopylabs/orpheus-3b-0.1-ft",
-                max_model_len=32768,
-                dtype=torch.float16,  # Use FP16 for MPS compatibility
-                device=device
-            )
-            self.logs.append(f"Orpheus model initialized successfully on {device}.")
-        except Exception as e:
-            self.logs.append(f"Error initializing Orpheus model: {str(e)}")
-            self.logs.append(f"Traceback: {traceback.format_exc()}")
-            self.generate_button.setEnabled(False)
-        finally:
-            self.hide_loading_screen()
+            job_id = self.jobs.submit("orpheus", text, voice, self.speed_slider.value() / 10.0,
+                                      priority=self.priority_spin.value())
+        except ValueError as e:
+            self.logs.append(f"Could not queue job: {str(e)}")
+            return
+        total = self.jobs.progress(job_id)[1]
+        self.logs.append(f"Queued job {job_id} ({total} segments, priority {self.priority_spin.value()}); "
+                         f"queue depth {self.jobs.depth()}")
+        self.start_job_queue()
+
+    def start_job_queue(self):
+        if self.job_thread is not None and self.job_thread.isRunning():
+            return  # The running thread claims the new job when it gets to it
+        self.job_thread = JobQueueThread(self.jobs, self.backend, self.output_format)
+        self.job_thread.progress.connect(self.logs.append)
+        self.job_thread.error.connect(self.logs.append)
+        self.job_thread.start()
+
+    def closeEvent(self, event):
+        if self.job_thread is not None and self.job_thread.isRunning():
+            # Aborts the in-flight requests; the job stays queued with everything rendered so far
+            self.job_thread.token.cancel()
+            self.job_thread.wait()
+        super().closeEvent(event)
+
+    def warm_up_voices(self):
+        if not self.warmup_checkbox.isChecked() or self.backend is None or self.warmup_thread is not None:
+            return
+        self.logs.append(f"Warming up {len(self.all_voices)} voices in the background...")
+        self.warmup_thread = WarmupThread(self.backend, self.all_voices)
+        self.warmup_thread.warmed.connect(self.on_warmed_up)
+        self.warmup_thread.error.connect(self.logs.append)
+        self.warmup_thread.start()
+
+    def on_warmed_up(self, timings):
+        for voice, cold, warm in timings:
+            self.logs.append(f"Warmed up {voice}: cold {cold:.2f}s, warm {warm:.2f}s")
+
+    def on_model_error(self, error_message):
+        self.logs.append(error_message)
+        self.generate_button.setText("Generate Audio")
+        self.generate_button.setEnabled(False)
+
+    def log_startup_timings(self):
+        breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.startup_timings.items())
+        self.logs.append(f"<span style='color:#F97316'>Startup timing: {breakdown}</span>")
 
     def update_speed_label(self):
         speed = self.speed_slider.value() / 10.0
         self.speed_label.setText(f"{speed:.1f}x")
 
     def toggle_play(self):
+        self.stream_player.stop()
         if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
             self.player.pause()
             self.play_button.setText("▶")
@@ -289,13 +522,23 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
             self.play_button.setText("⏸")
 
     def handle_media_status(self, status):
-        if status == QMediaPlayer.MediaStatus.EndOfMedia:
+        if status == QMediaPlayer.MediaStatus.LoadedMedia and not self.player_widget.isVisible():
+            self.update_duration()
+            self.player_widget.setVisible(True)
+            self.save_button.setEnabled(True)
+            self.hide_loading_screen()
+            self.logs.append(self.event_loop_monitor.report())
+        elif status == QMediaPlayer.MediaStatus.InvalidMedia:
+            self.logs.append(f"Error loading audio for playback: {self.player.errorString()}")
+            self.save_button.setEnabled(True)
+            self.hide_loading_screen()
+        elif status == QMediaPlayer.MediaStatus.EndOfMedia:
             self.play_button.setText("▶")
             self.player.setPosition(0)
 
     def update_seek_slider(self, position):
         self.seek_slider.setValue(position)
-        duration = self.player.duration()
+        duration = self.duration_ms
         self.seek_slider.setRange(0, duration)
         pos_minutes = position // 60000
         pos_seconds = (position % 60000) // 1000
@@ -304,7 +547,7 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.time_label.setText(f"{pos_minutes:02d}:{pos_seconds:02d} / {dur_minutes:02d}:{dur_seconds:02d}")
 
     def update_duration(self):
-        duration = self.player.duration()
+        duration = self.duration_ms
         self.seek_slider.setRange(0, duration)
         dur_minutes = duration // 60000
         dur_seconds = (duration % 60000) // 1000
@@ -316,23 +559,71 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
     def generate_audio(self):
         self.show_loading_screen("Generating audio...")
         self.player.stop()
+        self.stream_player.stop()
         self.play_button.setText("▶")
         self.player_widget.setVisible(False)
         self.save_button.setEnabled(False)
+        self.generate_button.setEnabled(False)
 
         text = self.text_input.toPlainText()
         voice = self.voice_combo.currentText()
         speed = self.speed_slider.value() / 10.0
 
         self.logs.append(f"Input text length: {len(text)} characters")
-
-        self.audio_thread = AudioGenerationThread(self.model, text, voice, speed)
+        self.event_loop_monitor.reset()
+
+        ring = None
+        if self.stream_checkbox.isChecked():
+            ring = PCMRingBuffer(RING_BUFFER_SECONDS * 24000 * 2)
+            self.stream_start = time.time()
+            self.stream_player.start(self.stream_start, ring)
+
+        if self.audio_thread is not None:
+            self.audio_thread.buffer.close()  # Drops the spill file of the previous run, if any
+        profiler = StageProfiler() if self.profile_checkbox.isChecked() else None
+        self.audio_thread = AudioGenerationThread(self.backend, text, voice, speed, self.batch_checkbox.isChecked(), ring,
+                                                  profiler=profiler)
         self.audio_thread.progress.connect(self.logs.append)
         self.audio_thread.finished.connect(self.on_audio_generation_finished)
         self.audio_thread.error.connect(self.on_audio_generation_error)
+        self.audio_thread.cancelled.connect(self.on_audio_generation_cancelled)
+        self.set_cancel_enabled(True)
         self.audio_thread.start()
 
+    def on_first_audio(self, latency):
+        self.logs.append(f"<span style='color:#F97316'>Time to first audio: {latency:.2f} seconds "
+                         f"(pre-roll {self.stream_player.preroll_ms} ms)</span>")
+        self.hide_loading_screen()
+
+    def on_stream_finished(self, underruns):
+        self.logs.append(f"Streaming playback finished after {time.time() - self.stream_start:.2f} seconds "
+                         f"with {underruns} underrun(s).")
+
+    def set_cancel_enabled(self, enabled):
+        self.cancel_button.setEnabled(enabled)
+        self.overlay_cancel_button.setVisible(enabled)
+
+    def cancel_generation(self):
+        if self.audio_thread is not None and self.audio_thread.isRunning():
+            self.logs.append("Cancelling generation...")
+            self.set_cancel_enabled(False)
+            self.audio_thread.token.cancel()
+            self.stream_player.stop()  # Also releases a generation thread waiting on a full ring buffer
+
+    def on_audio_generation_cancelled(self, release_seconds):
+        self.logs.append(f"<span style='color:#F97316'>Generation cancelled; vLLM requests aborted and KV cache "
+                         f"released {release_seconds * 1000:.0f} ms after cancel</span>")
+        self.generate_button.setEnabled(self.model is not None)
+        self.hide_loading_screen()
+
     def on_audio_generation_finished(self):
+        self.set_cancel_enabled(False)
+        self.generate_button.setEnabled(self.model is not None)
+        if not self.first_inference_logged and self.audio_thread.first_chunk_time is not None:
+            self.first_inference_logged = True
+            self.startup_timings["first inference"] = self.audio_thread.first_chunk_time
+            self.log_startup_timings()
+        self.report_profile(self.audio_thread.profiler)
         self.player = QMediaPlayer()
         self.audio_output = QAudioOutput()
         self.player.setAudioOutput(self.audio_output)
@@ -341,18 +632,31 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.seek_slider.sliderMoved.connect(self.seek_audio)
         self.player.mediaStatusChanged.connect(self.handle_media_status)
 
-        self.player.setSource(QUrl.fromLocalFile("out.wav"))
-        start_time = time.time()
-        while self.player.duration() == 0 and (time.time() - start_time) < 10:
-            QApplication.processEvents()
-            time.sleep(0.1)
-        self.update_duration()
-        self.player_widget.setVisible(True)
-        self.save_button.setEnabled(True)
-        self.hide_loading_screen()
+        self.audio = self.audio_thread.audio
+        if self.audio is None:
+            self.logs.append("No audio generated.")
+            self.hide_loading_screen()
+            return
+        self.duration_ms = len(self.audio) * 1000 // self.backend.sample_rate
+        buffer_source(self.player, self.audio, self.backend.sample_rate)
+        self.logs.append(f"Audio duration: {self.duration_ms / 1000:.2f} seconds")
+        # The player is revealed from handle_media_status once the media has loaded
+
+    def report_profile(self, profiler):
+        if profiler is None:
+            return
+        self.logs.append(profiler.describe())
+        path = os.path.join(tempfile.gettempdir(), f"bsbp_tts_trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            self.logs.append(f"Stage trace written to {profiler.export(path)} (open in ui.perfetto.dev or chrome://tracing)")
+        except OSError as e:
+            self.logs.append(f"Could not write stage trace: {str(e)}")
 
     def on_audio_generation_error(self, error_message):
+        self.set_cancel_enabled(False)
         self.logs.append(error_message)
+        self.stream_player.stop()
+        self.generate_button.setEnabled(self.model is not None)
         self.hide_loading_screen()
 
     def save_audio(self):
@@ -361,8 +665,10 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         file_path, _ = QFileDialog.getSaveFileName(self, "Save Audio File", default_filename, "WAV Files (*.wav);;All Files (*)")
         if file_path:
             try:
-                import shutil
-                shutil.copy("out.wav", file_path)
+                # Encoded from the generation buffer a minute at a time, in the configured output format
+                with StreamingEncoder(file_path, self.backend.sample_rate, self.output_format, "wav") as encoder:
+                    for chunk in self.audio_thread.buffer.chunks():
+                        encoder.write(chunk)
                 self.logs.append(f"Audio saved to {file_path}")
             except Exception as e:
                 self.logs.append(f"Error saving audio: {str(e)}")
@@ -373,12 +679,19 @@ Or... well, this is interesting. I mean, Keanu Reeves IS kind of there, but why
         self.elapsed_time = 0
         self.timer_label.setText(f"{message} Time Elapsed: 00:00")
         self.elapsed_timer.start(1000)
+        self.loading_shown_at = time.time()
+        self.loading_id += 1
         QApplication.processEvents()
 
     def hide_loading_screen(self):
-        elapsed = self.elapsed_time
-        if elapsed < 1:
-            time.sleep(1 - elapsed)
+        # Keep the loading screen up for at least MIN_OVERLAY_SECONDS, but let the event loop run meanwhile
+        remaining = MIN_OVERLAY_SECONDS - (time.time() - self.loading_shown_at)
+        loading_id = self.loading_id
+        QTimer.singleShot(max(0, int(remaining * 1000)), lambda: self.dismiss_loading_screen(loading_id))
+
+    def dismiss_loading_screen(self, loading_id):
+        if loading_id != self.loading_id:
+            return  # A newer loading screen was shown since
         self.loading_overlay.setVisible(False)
         self.elapsed_timer.stop()
 
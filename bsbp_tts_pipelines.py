@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import torch
+from kokoro import KModel, KPipeline
+from bsbp_tts_backends import KOKORO_VOICES
+
+DEFAULT_MAX_PIPELINES = 4
+# "lang" (every voice of a pipeline's language), "all", "none" or a comma-separated list of voices
+DEFAULT_PRELOAD_VOICES = os.environ.get("BSBP_TTS_PRELOAD_VOICES", "lang")
+# Short utterance per language used to warm G2P, voice packs and the model before the first real request
+WARMUP_TEXTS = {
+    'a': "Hello, this is a warm-up.", 'b': "Hello, this is a warm-up.", 'e': "Hola, esto es una prueba.",
+    'f': "Bonjour, ceci est un essai.", 'h': "नमस्ते, यह एक परीक्षण है।", 'i': "Ciao, questa è una prova.",
+    'j': "こんにちは、これはテストです。", 'p': "Olá, isto é um teste.", 'z': "你好，这是一个测试。",
+}
+
+
+# Voice style tensors shared by every pipeline: each KPipeline's `voices` dict is replaced with this
+# one, so a voice loaded (or preloaded) through any pipeline is never fetched or unpickled again.
+class VoicePackCache:
+    def __init__(self, repo_id='hexgrad/Kokoro-82M'):
+        self.repo_id = repo_id
+        self.packs = {}
+        self.lock = threading.Lock()
+
+    def attach(self, pipeline):
+        pipeline.voices = self.packs
+
+    def load(self, voice):
+        pack = self.packs.get(voice)
+        if pack is None:
+            # Same lookup KPipeline.load_single_voice does, without its language-mismatch warning
+            from huggingface_hub import hf_hub_download
+            path = voice if voice.endswith('.pt') else hf_hub_download(repo_id=self.repo_id, filename=f'voices/{voice}.pt')
+            pack = torch.load(path, weights_only=True)
+            with self.lock:
+                pack = self.packs.setdefault(voice, pack)
+        return pack
+
+    def preload(self, voices):
+        # Returns [(voice, seconds)] for the voices that were not loaded yet
+        timings = []
+        for voice in voices:
+            if voice not in self.packs:
+                start = time.time()
+                self.load(voice)
+                timings.append((voice, time.time() - start))
+        return timings
+
+    def memory(self):
+        # Bytes held per voice. KPipeline adds to the dict without our lock, so iterate over a snapshot.
+        return {voice: pack.numel() * pack.element_size() for voice, pack in list(self.packs.items())}
+
+    def describe(self):
+        memory = self.memory()
+        per_voice = ", ".join(f"{voice} {size / 1024:.0f} KB" for voice, size in sorted(memory.items()))
+        summary = f"Voice packs: {len(memory)} loaded, {sum(memory.values()) / 1024 ** 2:.1f} MB"
+        return f"{summary} ({per_voice})" if per_voice else summary
+
+
+def preload_list(policy, lang_code):
+    if policy == "none":
+        return []
+    if policy == "all":
+        return list(KOKORO_VOICES)
+    if policy == "lang":
+        return [voice for voice in KOKORO_VOICES if voice[0] == lang_code]
+    return [voice.strip() for voice in policy.split(",") if voice.strip()]
+
+
+# Keeps one KModel loaded and hands out per-language KPipelines (G2P front-ends) built on top of it.
+# Pipelines are created lazily and the least recently used one is dropped past max_pipelines;
+# the model itself is never reloaded. Models and pipelines are built outside the lock.
+class PipelineRegistry:
+    def __init__(self, repo_id='hexgrad/Kokoro-82M', max_pipelines=DEFAULT_MAX_PIPELINES, device=None,
+                 preload_voices=DEFAULT_PRELOAD_VOICES):
+        self.repo_id = repo_id
+        self.max_pipelines = max_pipelines
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.preload_voices = preload_voices
+        self.voice_packs = VoicePackCache(repo_id)
+        self.model = None
+        self.pipelines = OrderedDict()
+        self.building = {}
+        self.lock = threading.Lock()
+
+    def load_model(self):
+        model, _ = self.build_once("model", lambda: self.model, self.create_model)
+        return model
+
+    def create_model(self):
+        model = KModel(repo_id=self.repo_id).to(self.device).eval()
+        with self.lock:
+            self.model = model
+        return model
+
+    def build_once(self, key, lookup, create):
+        # Returns (object, created). lookup() runs under self.lock and returns the finished object or
+        # None; create() runs outside it, in one thread per key, while the others wait on an Event.
+        # self.lock is only ever held for dict updates, so cached() never waits for a build.
+        while True:
+            with self.lock:
+                found = lookup()
+                if found is not None:
+                    return found, False
+                event = self.building.get(key)
+                if event is None:
+                    event = self.building[key] = threading.Event()
+                    break
+            event.wait()  # If that build failed, lookup() finds nothing and this thread tries itself
+        try:
+            return create(), True
+        finally:
+            with self.lock:
+                del self.building[key]
+            event.set()
+
+    def cached(self, lang_code):
+        with self.lock:
+            pipeline = self.pipelines.get(lang_code)
+            if pipeline is not None:
+                self.pipelines.move_to_end(lang_code)
+            return pipeline
+
+    def get(self, lang_code):
+        pipeline = self.cached(lang_code)
+        if pipeline is not None:
+            return pipeline
+        model = self.load_model()
+        pipeline, created = self.build_once(("pipeline", lang_code), lambda: self.pipelines.get(lang_code),
+                                            lambda: self.create_pipeline(lang_code, model))
+        if created:
+            self.voice_packs.preload(preload_list(self.preload_voices, lang_code))
+        return pipeline
+
+    def create_pipeline(self, lang_code, model):
+        pipeline = KPipeline(lang_code=lang_code, repo_id=self.repo_id, model=model)
+        self.voice_packs.attach(pipeline)
+        with self.lock:
+            self.pipelines[lang_code] = pipeline
+            while len(self.pipelines) > self.max_pipelines:
+                self.pipelines.popitem(last=False)
+        return pipeline
+
+    def warm_up(self, lang_code, voices, text=None):
+        # Runs a short utterance twice per voice and returns [(voice, cold seconds, warm seconds)].
+        # The cold run pays for lazy voice loading, G2P setup and allocator growth.
+        pipeline = self.get(lang_code)
+        text = text or WARMUP_TEXTS.get(lang_code, WARMUP_TEXTS['a'])
+        timings = []
+        for voice in voices:
+            runs = []
+            for _ in range(2):
+                start = time.time()
+                for result in pipeline(text, voice=voice, speed=1):
+                    pass
+                runs.append(time.time() - start)
+            timings.append((voice, runs[0], runs[1]))
+        return timings
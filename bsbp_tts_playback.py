@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+from PyQt6.QtCore import QIODevice, QObject, QTimer, QUrl, pyqtSignal
+from PyQt6.QtMultimedia import QAudio, QAudioFormat, QAudioSink, QMediaDevices
+
+from bsbp_tts_audio import float_to_pcm16, wav_header, wav_range
+
+DEFAULT_PREROLL_MS = int(os.environ.get("BSBP_TTS_PREROLL_MS", "200"))
+COMPACT_THRESHOLD = 1024 * 1024
+
+
+# Read-only, seekable WAV device over float32 samples (an AudioBuffer view): the header, then 16-bit
+# PCM converted only for the range each read asks for, so playback never holds a second copy of the audio
+class PCMSource(QIODevice):
+    def __init__(self, audio, sample_rate, parent=None):
+        super().__init__(parent)
+        self.audio = audio
+        self.header = wav_header(len(audio), sample_rate)
+
+    def isSequential(self):
+        return False
+
+    def size(self):
+        return len(self.header) + 2 * len(self.audio)
+
+    def readData(self, maxlen):
+        return wav_range(self.header, self.audio, self.pos(), min(self.pos() + maxlen, self.size()))
+
+    def writeData(self, data):
+        return -1
+
+
+def buffer_source(player, audio, sample_rate):
+    # Points a QMediaPlayer at generated audio without building the WAV in memory; the device is
+    # parented to the player so it lives exactly as long as the player does
+    device = PCMSource(audio, sample_rate, player)
+    device.open(QIODevice.OpenModeFlag.ReadOnly)
+    player.setSourceDevice(device, QUrl("memory.wav"))
+    return device
+
+
+# Append-only PCM buffer that the generation side grows while the sink drains it
+class GrowingPCMBuffer:
+    def __init__(self):
+        self.data = bytearray()
+        self.read_pos = 0
+        self.closed = False
+
+    def write(self, chunk):
+        self.data.extend(chunk)
+
+    def peek(self, max_bytes):
+        return bytes(self.data[self.read_pos:self.read_pos + max_bytes])
+
+    def consume(self, count):
+        self.read_pos += count
+        if self.read_pos >= COMPACT_THRESHOLD:
+            del self.data[:self.read_pos]
+            self.read_pos = 0
+
+    def available(self):
+        return len(self.data) - self.read_pos
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.closed = True
+
+
+# Bounded single-producer/single-consumer PCM ring buffer. The producer (a generation thread)
+# blocks while it is full, so memory stays fixed however far generation runs ahead of playback.
+class PCMRingBuffer:
+    def __init__(self, capacity):
+        self.buffer = bytearray(capacity)
+        self.capacity = capacity
+        self.read_pos = 0
+        self.size = 0
+        self.closed = False
+        self.aborted = False
+        self.condition = threading.Condition()
+
+    def write(self, chunk):
+        view = memoryview(chunk)
+        with self.condition:
+            while len(view):
+                while self.size == self.capacity and not self.aborted:
+                    self.condition.wait()
+                if self.aborted:
+                    return
+                write_pos = (self.read_pos + self.size) % self.capacity
+                count = min(len(view), self.capacity - self.size, self.capacity - write_pos)
+                self.buffer[write_pos:write_pos + count] = view[:count]
+                self.size += count
+                view = view[count:]
+
+    def peek(self, max_bytes):
+        with self.condition:
+            count = min(max_bytes, self.size)
+            first = min(count, self.capacity - self.read_pos)
+            return bytes(self.buffer[self.read_pos:self.read_pos + first]) + bytes(self.buffer[:count - first])
+
+    def consume(self, count):
+        with self.condition:
+            self.read_pos = (self.read_pos + count) % self.capacity
+            self.size -= count
+            self.condition.notify_all()
+
+    def available(self):
+        with self.condition:
+            return self.size
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def abort(self):
+        # Playback stopped: drop whatever is still being produced and release a blocked writer
+        with self.condition:
+            self.aborted = True
+            self.closed = True
+            self.condition.notify_all()
+
+
+# Plays PCM as soon as it is written, using a QAudioSink in push mode. Playback starts once
+# preroll_ms of audio is buffered (or the stream ends) and re-buffers the same amount after an underrun.
+class StreamingAudioPlayer(QObject):
+    first_audio = pyqtSignal(float)
+    underrun = pyqtSignal(int)
+    finished = pyqtSignal(int)
+
+    def __init__(self, sample_rate=24000, parent=None, preroll_ms=DEFAULT_PREROLL_MS):
+        super().__init__(parent)
+        audio_format = QAudioFormat()
+        audio_format.setSampleRate(sample_rate)
+        audio_format.setChannelCount(1)
+        audio_format.setSampleFormat(QAudioFormat.SampleFormat.Int16)
+        self.sink = QAudioSink(QMediaDevices.defaultAudioOutput(), audio_format, self)
+        self.sample_rate = sample_rate
+        self.preroll_ms = preroll_ms
+        self.preroll_bytes = int(sample_rate * preroll_ms / 1000) * 2
+        self.buffer = None
+        self.device = None
+        self.start_time = None
+        self.first_audio_sent = False
+        self.waiting_for_preroll = True
+        self.starved = False
+        self.underruns = 0
+        self.feed_timer = QTimer(self)
+        self.feed_timer.timeout.connect(self.feed)
+
+    def start(self, start_time=None, buffer=None):
+        self.stop()
+        self.buffer = buffer if buffer is not None else GrowingPCMBuffer()
+        self.start_time = start_time if start_time is not None else time.time()
+        self.first_audio_sent = False
+        self.waiting_for_preroll = True
+        self.starved = False
+        self.underruns = 0
+        self.device = self.sink.start()
+        self.feed_timer.start(10)
+
+    def push_segment(self, audio):
+        if self.buffer is not None:
+            self.buffer.write(float_to_pcm16(audio))
+
+    def end_of_stream(self):
+        if self.buffer is not None:
+            self.buffer.close()
+
+    def feed(self):
+        if self.buffer is None or self.device is None:
+            return
+        available = self.buffer.available()
+        if self.waiting_for_preroll:
+            if available < self.preroll_bytes and not self.buffer.closed:
+                return
+            self.waiting_for_preroll = False
+        free = self.sink.bytesFree()
+        if free > 0 and available > 0:
+            written = max(self.device.write(self.buffer.peek(min(free, available))), 0)
+            self.buffer.consume(written)
+            if written > 0:
+                self.starved = False
+                if not self.first_audio_sent:
+                    self.first_audio_sent = True
+                    self.first_audio.emit(time.time() - self.start_time)
+        elif available == 0 and self.sink.state() == QAudio.State.IdleState:
+            if self.buffer.closed:
+                underruns = self.underruns
+                self.stop()
+                self.finished.emit(underruns)
+            elif self.first_audio_sent and not self.starved:
+                self.starved = True
+                self.underruns += 1
+                self.waiting_for_preroll = True
+                self.underrun.emit(self.underruns)
+
+    def stop(self):
+        self.feed_timer.stop()
+        if self.buffer is not None:
+            self.buffer.abort()
+        if self.device is not None:
+            self.sink.stop()
+        self.device = None
+        self.buffer = None
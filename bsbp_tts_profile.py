@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from bsbp_tts_metrics import ENABLED as METRICS_ENABLED, STAGE_SECONDS
+
+# BSBP_TTS_PROFILE=1 turns stage profiling on by default in the GUIs
+PROFILE_BY_DEFAULT = os.environ.get("BSBP_TTS_PROFILE", "0") not in ("", "0", "false", "no")
+# Kokoro submodules timed when a pipeline is instrumented; the decoder is the iSTFTNet vocoder
+KOKORO_STAGES = {"bert": "model.bert", "bert_encoder": "model.bert_encoder", "predictor": "model.predictor",
+                 "text_encoder": "model.text_encoder", "decoder": "model.decoder (vocoder)"}
+
+_local = threading.local()
+_null = nullcontext()
+_snac_profiler = [None]
+
+
+# Opt-in per-stage timer. Spans are recorded from any thread and exported as a Chrome trace
+# (chrome://tracing or ui.perfetto.dev) or summarized per stage for the status log. Code paths
+# find the profiler of their thread through current_profiler(); without one, stage() only feeds the
+# bsbp_tts_stage_seconds histogram (and is a no-op with metrics off).
+class StageProfiler:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []  # (name, start, duration, thread id, args)
+        self.thread_names = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, start, end, **args):
+        STAGE_SECONDS.observe(end - start, stage=name)
+        thread = threading.current_thread()
+        with self.lock:
+            self.spans.append((name, start, end - start, thread.ident, args))
+            self.thread_names.setdefault(thread.ident, thread.name)
+
+    @contextmanager
+    def span(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter(), **args)
+
+    def summary(self):
+        # {stage: (calls, total seconds, max seconds)}, plus the wall time covered by all spans
+        stages = {}
+        with self.lock:
+            spans = list(self.spans)
+        for name, start, duration, thread, args in spans:
+            calls, total, longest = stages.get(name, (0, 0.0, 0.0))
+            stages[name] = (calls + 1, total + duration, max(longest, duration))
+        wall = max((start + duration for name, start, duration, thread, args in spans), default=self.origin) - self.origin
+        return stages, wall
+
+    def describe(self):
+        stages, wall = self.summary()
+        if not stages:
+            return "Stage timings: nothing recorded"
+        # Stages nest (the vocoder runs inside the model, which runs inside a pipeline step), so shares do not add up
+        parts = [f"{name} {total:.2f}s ({100 * total / wall if wall else 0:.0f}%, {calls}x, max {longest * 1000:.0f} ms)"
+                 for name, (calls, total, longest) in sorted(stages.items(), key=lambda item: -item[1][1])]
+        return f"Stage timings over {wall:.2f}s: " + ", ".join(parts)
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        with self.lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in thread_names.items()]
+        for name, start, duration, thread, args in spans:
+            events.append({"name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": thread,
+                           "ts": (start - self.origin) * 1e6, "dur": duration * 1e6,
+                           "args": {key: value if isinstance(value, (int, float, str, bool)) else str(value)
+                                    for key, value in args.items()}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+
+def current_profiler():
+    return getattr(_local, "profiler", None)
+
+
+@contextmanager
+def profiling(profiler):
+    # Makes `profiler` the current one for this thread; None leaves profiling off
+    previous = current_profiler()
+    _local.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _local.profiler = previous
+
+
+def stage(name, **args):
+    profiler = current_profiler()
+    if profiler is not None:
+        return profiler.span(name, **args)
+    return _observed(name) if METRICS_ENABLED else _null
+
+
+@contextmanager
+def _observed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+
+
+def timed_iter(iterable, name):
+    # Times every next() of `iterable` as one `name` span; untouched when profiling and metrics are off
+    profiler = current_profiler()
+    if profiler is None and not METRICS_ENABLED:
+        return iterable
+    return _timed_iter(iter(iterable), name, profiler)
+
+
+def _timed_iter(iterator, name, profiler):
+    index = 0
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        if profiler is not None:
+            profiler.add(name, start, time.perf_counter(), index=index)
+        else:
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+        index += 1
+        yield item
+
+
+def instrument_kokoro(pipeline):
+    # Installs (once per pipeline and model) a timing wrapper around G2P and forward hooks on KModel and
+    # its submodules. They record into the current thread's profiler and do nothing when there is none.
+    if getattr(pipeline, "_bsbp_profiled", False):
+        return
+    g2p = getattr(pipeline, "g2p", None)
+    if g2p is not None:
+        def timed_g2p(*args, **kwargs):
+            with stage("g2p"):
+                return g2p(*args, **kwargs)
+        pipeline.g2p = timed_g2p
+    model = getattr(pipeline, "model", None)
+    if model is not None and not getattr(model, "_bsbp_profiled", False):
+        _hook(model, "model")
+        for attribute, name in KOKORO_STAGES.items():
+            module = getattr(model, attribute, None)
+            if module is not None:
+                _hook(module, name)
+        model._bsbp_profiled = True
+    pipeline._bsbp_profiled = True
+
+
+def _hook(module, name):
+    starts = threading.local()
+
+    def before(module, inputs):
+        if current_profiler() is not None:
+            starts.stack = getattr(starts, "stack", [])
+            starts.stack.append(time.perf_counter())
+
+    def after(module, inputs, output):
+        profiler = current_profiler()
+        if profiler is None or not getattr(starts, "stack", None):
+            return
+        device = getattr(next(module.parameters(), None), "device", None)
+        if device is not None and device.type == "cuda":
+            import torch
+            torch.cuda.synchronize(device)  # Kernels run asynchronously; wait so the span covers them
+        profiler.add(name, starts.stack.pop(), time.perf_counter())
+
+    module.register_forward_pre_hook(before)
+    module.register_forward_hook(after)
+
+
+@contextmanager
+def snac_profiling(profiler):
+    # The Orpheus decoder runs SNAC on a thread it starts itself, so a thread's current profiler does not
+    # reach it; while this is active, orpheus_tts.decoder.convert_to_audio records into `profiler` instead.
+    # Meant for one profiled generation at a time.
+    if profiler is None:
+        yield
+        return
+    from orpheus_tts import decoder
+    if not getattr(decoder.convert_to_audio, "_bsbp_profiled", False):
+        convert_to_audio = decoder.convert_to_audio
+
+        def timed_convert_to_audio(*args, **kwargs):
+            target = _snac_profiler[0]
+            if target is None:
+                return convert_to_audio(*args, **kwargs)
+            with target.span("snac"):
+                return convert_to_audio(*args, **kwargs)
+        timed_convert_to_audio._bsbp_profiled = True
+        decoder.convert_to_audio = timed_convert_to_audio
+    _snac_profiler[0] = profiler
+    try:
+        yield
+    finally:
+        _snac_profiler[0] = None
@@ -0,0 +1,193 @@
+import os
+import re
+
+# Estimated phoneme tokens per segment. Kokoro's context is 510 phonemes; shorter segments start
+# playing sooner, longer ones amortize the per-call overhead. 0 keeps the old one-segment-per-line split.
+DEFAULT_TARGET_TOKENS = int(os.environ.get("BSBP_TTS_SEGMENT_TOKENS", "200"))
+# Hard ceiling; sentences longer than this are split at clauses, then at words. Leaves headroom
+# below 510 for the estimate being off.
+DEFAULT_MAX_TOKENS = int(os.environ.get("BSBP_TTS_SEGMENT_MAX_TOKENS", "400"))
+# Unpunctuated lines at least this long are taken as hard-wrapped prose and joined with the next line;
+# shorter ones (headings, verse, captions) stand on their own
+WRAPPED_LINE_CHARS = 50
+
+# Titles and abbreviations a "." after which never ends a sentence. Ones usually followed by a number
+# ("No. 5", "p. 12") need no entry: a sentence never starts with a digit or a lowercase letter.
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "sra", "srta", "dra", "jr", "st", "mt", "ft", "rev", "capt", "lt", "sgt",
+    "gov", "mme", "mlle", "dott", "e.g", "i.e", "cf", "vs", "fig", "figs", "vol", "pp", "approx", "al", "dept",
+    "jan", "feb", "apr", "aug", "sep", "sept", "oct", "nov",
+}
+TERMINATORS = ".!?…。！？"
+CJK_TERMINATORS = "。！？"
+CLOSERS = "\"'”’»)]}」』"
+
+LIST_ITEM = re.compile(r"^\s*(?:[-*•‣◦–]|\d{1,3}[.)]|[a-zA-Z][.)]|\([0-9a-zA-Z]{1,4}\))\s+")
+SENTENCE_END = re.compile(rf"[.!?…]+[{re.escape(CLOSERS)}]*(?:\s+|$)|[{CJK_TERMINATORS}][{re.escape(CLOSERS)}]*\s*")
+LINE_END = re.compile(rf"(?:[.!?…]+|[{CJK_TERMINATORS}])[{re.escape(CLOSERS)}]*$")
+# After ASCII punctuation only with a space, so "1,000" and "10:30" stay whole
+CLAUSE_BREAK = re.compile(r"(?<=[,;:—–])\s+|(?<=[，、；：])")
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+CJK_CHAR = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+DIGIT = re.compile(r"\d")
+
+
+def estimate_tokens(text):
+    # Rough phoneme count without running G2P: about one phoneme per character, but digits are read
+    # out as words ("1999" is ~16 phonemes) and a CJK character is a syllable of 2-3 phonemes
+    return len(text) + 3 * len(DIGIT.findall(text)) + 2 * len(CJK_CHAR.findall(text))
+
+
+def terminated(text):
+    return text.rstrip(CLOSERS).endswith(tuple(TERMINATORS))
+
+
+def ends_sentence(line, following):
+    match = LINE_END.search(line)
+    return is_boundary(f"{line} {following}", match.start(), match.end() + 1)
+
+
+def blocks(text):
+    # Paragraphs, list items and standalone lines, with hard-wrapped lines rejoined. Every break
+    # between blocks is a sentence boundary.
+    current = []
+    for line in text.strip().split("\n"):
+        stripped = line.strip()
+        continuation = current and line[:1].isspace() and LIST_ITEM.match(current[0]) and not LIST_ITEM.match(line)
+        if current and (not stripped or LIST_ITEM.match(line) or not continuation and (
+                ends_sentence(current[-1], stripped) if LINE_END.search(current[-1])
+                else len(current[-1]) < WRAPPED_LINE_CHARS)):
+            yield " ".join(current)
+            current = []
+        if stripped:
+            current.append(stripped)
+    if current:
+        yield " ".join(current)
+
+
+def is_boundary(block, start, end):
+    # Whether the terminator matched at block[start:end] ends a sentence
+    if block[start] in CJK_TERMINATORS or end >= len(block):
+        return True
+    following = block[end]
+    if following.islower() or following.isdigit():
+        return False  # "etc. and", "approx. 5", "... and then"
+    if block[start] != "." or block.startswith("..", start + 1):
+        return True
+    before = block[:start].split()
+    word = before[-1].lstrip("(\"'“‘") if before else ""
+    if word.lower() in ABBREVIATIONS:
+        return False
+    if len(word) == 1 and word.isupper():
+        return False  # Initials: "J. R. R. Tolkien"
+    if "." in word and len(word.replace(".", "")) <= 4 and word.replace(".", "").isalpha():
+        return False  # Dotted acronyms: "U.S.", "a.m."
+    return True
+
+
+def close_sentence(text):
+    # Adds a full stop (。 after CJK) to text with no terminator, so a heading or list item keeps its
+    # pause when packed
+    if terminated(text) or text.endswith((",", ";", ":")):
+        return text
+    return text + ("。" if CJK_CHAR.search(text[-1:]) else ".")
+
+
+def block_sentences(block, close=True):
+    # A list marker ("1.", "a)") is kept with its item and never taken for a sentence end. With `close`
+    # the last sentence is passed through close_sentence.
+    marker = LIST_ITEM.match(block)
+    position = marker.end() if marker else 0
+    start = 0
+    result = []
+    for match in SENTENCE_END.finditer(block, position):
+        if is_boundary(block, match.start(), match.end()):
+            result.append(block[start:match.end()].strip())
+            start = match.end()
+    rest = block[start:].strip()
+    if rest:
+        result.append(close_sentence(rest) if close else rest)
+    return result
+
+
+def sentences(text):
+    # Sentences of `text` in order; abbreviations, initials, decimals and list markers do not split
+    return [sentence for block in blocks(text) for sentence in block_sentences(block)]
+
+
+def split_long(sentence, max_tokens, measure=estimate_tokens):
+    # Splits a sentence above max_tokens at clause punctuation, then between words (or characters,
+    # for text without spaces), packing the pieces back up to max_tokens
+    if measure(sentence) <= max_tokens:
+        return [sentence]
+    separator = " " if " " in sentence else ""
+    pieces = [piece for piece in CLAUSE_BREAK.split(sentence) if piece]
+    if len(pieces) == 1:
+        pieces = sentence.split() if separator else list(sentence)
+    parts = []
+    current = ""
+    for piece in pieces:
+        for part in (split_long(piece, max_tokens, measure) if len(pieces) > 1 else [piece]):
+            candidate = f"{current}{separator}{part}" if current else part
+            if current and measure(candidate) > max_tokens:
+                parts.append(current)
+                candidate = part
+            current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def join(left, right):
+    if not left:
+        return right
+    return left + right if CJK_CHAR.search(left[-2:]) else f"{left} {right}"
+
+
+def pack(pieces, target_tokens, max_tokens, measure=estimate_tokens):
+    # Greedy: pieces are added while the segment stays within target_tokens. A tail shorter than a
+    # quarter of the target is folded into the previous segment if that stays within max_tokens.
+    segments = []
+    current = ""
+    for piece in pieces:
+        candidate = join(current, piece)
+        if current and measure(candidate) > target_tokens:
+            segments.append(current)
+            candidate = piece
+        current = candidate
+    if current:
+        if segments and measure(current) < target_tokens // 4 and measure(join(segments[-1], current)) <= max_tokens:
+            current = join(segments.pop(), current)
+        segments.append(current)
+    return segments
+
+
+def pack_segments(text, target_tokens=DEFAULT_TARGET_TOKENS, max_tokens=DEFAULT_MAX_TOKENS, measure=estimate_tokens):
+    # Text -> synthesis segments of about target_tokens each. Sentences are packed within their block;
+    # neighbouring short blocks (lines, headings, list items) of one paragraph are then merged while they
+    # fit the target. Nothing is packed across a blank line, so paragraph pauses survive and an edit only
+    # moves boundaries within its own paragraph, leaving the segment memo and cache matching elsewhere.
+    # `measure` can be swapped for an exact phoneme count. target_tokens <= 0 gives one segment per line.
+    if target_tokens <= 0:
+        return [line.strip() for line in text.split("\n") if line.strip()]
+    max_tokens = max(max_tokens, target_tokens)
+    segments = []
+    for paragraph in PARAGRAPH_BREAK.split(text.strip()):
+        start = len(segments)
+        for block in blocks(paragraph):
+            # Closed after splitting, so an over-long unterminated run never leaves a lone "." segment
+            pieces = [part for sentence in block_sentences(block, close=False)
+                      for part in split_long(sentence, max_tokens, measure)]
+            pieces[-1] = close_sentence(pieces[-1])
+            packed = pack(pieces, target_tokens, max_tokens, measure)
+            if len(segments) > start and measure(join(segments[-1], packed[0])) <= target_tokens:
+                packed[0] = join(segments.pop(), packed[0])
+            segments.extend(packed)
+    return segments
+
+
+def describe(segments, measure=estimate_tokens):
+    sizes = [measure(segment) for segment in segments]
+    if not sizes:
+        return "Segments: none"
+    return f"Segments: {len(sizes)}, {sum(sizes) / len(sizes):.0f} tokens on average (min {min(sizes)}, max {max(sizes)})"
@@ -0,0 +1,318 @@
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bsbp_tts_audio import OutputFormat, float_to_pcm16
+from bsbp_tts_backends import Cancelled, CancellationToken, KokoroBackend, OrpheusBackend, SynthesisStats
+from bsbp_tts_cache import SegmentCache
+from bsbp_tts_metrics import CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE, QUEUE_DEPTH, REGISTRY, Counter
+
+SERVER_REQUESTS = Counter("bsbp_tts_server_requests_total", "HTTP synthesis requests by outcome", ("outcome",))
+SERVER_OUTCOMES = {"requests_ok": "ok", "requests_rejected": "rejected", "requests_timed_out": "timed_out",
+                   "requests_failed": "failed"}
+
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class QueueFull(Exception):
+    pass
+
+
+class RequestTimeout(Exception):
+    pass
+
+
+# Warm backends plus admission control: at most max_queue requests are admitted (waiting or running),
+# of which at most `concurrency` synthesize at once. Anything beyond that is rejected immediately.
+# Engines that are not concurrent (Kokoro's KPipeline, Orpheus' shared vLLM engine) also hold the
+# backend lock, so requests to one engine still run one at a time whatever the concurrency.
+# The timeout covers waiting and synthesis: at the deadline the request's token is cancelled, which
+# stops Kokoro before its next segment and aborts Orpheus' in-flight engine requests.
+class SynthesisService:
+    def __init__(self, backends, concurrency=1, max_queue=8, timeout=120.0, output_format=None):
+        self.backends = backends
+        self.output_format = output_format or OutputFormat()
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.admission = threading.BoundedSemaphore(max_queue)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stats = {
+            "requests_total": 0, "requests_ok": 0, "requests_rejected": 0, "requests_timed_out": 0,
+            "requests_failed": 0, "queued": 0, "in_flight": 0, "audio_seconds_total": 0.0, "synthesis_seconds_total": 0.0,
+        }
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+        if name in SERVER_OUTCOMES:
+            SERVER_REQUESTS.inc(value, outcome=SERVER_OUTCOMES[name])
+        elif name in ("queued", "in_flight"):
+            QUEUE_DEPTH.inc(value, queue=f"server_{name}")
+
+    def synthesize(self, engine, text, voice, speed, lang_code=None):
+        # Yields 16-bit PCM chunks; raises QueueFull or RequestTimeout
+        self.count("requests_total")
+        backend = self.backends[engine]
+        if not self.admission.acquire(blocking=False):
+            self.count("requests_rejected")
+            raise QueueFull()
+        deadline = time.time() + self.timeout
+        try:
+            self.count("queued")
+            acquired = self.slots.acquire(timeout=self.timeout)
+            exclusive = not backend.capabilities.concurrent
+            if acquired and exclusive and not backend.lock.acquire(timeout=max(0.0, deadline - time.time())):
+                self.slots.release()
+                acquired = False
+            self.count("queued", -1)
+            if not acquired:
+                self.count("requests_timed_out")
+                raise RequestTimeout()
+            self.count("in_flight")
+            stats = SynthesisStats(backend.sample_rate)
+            token = CancellationToken()
+            timer = threading.Timer(max(0.0, deadline - time.time()), token.cancel)
+            timer.daemon = True
+            timer.start()
+            try:
+                for audio in backend.stream(text, voice, speed, token=token, stats=stats, lang_code=lang_code):
+                    yield float_to_pcm16(audio)
+                self.count("requests_ok")
+            except Cancelled:
+                self.count("requests_timed_out")
+                raise RequestTimeout()
+            finally:
+                timer.cancel()
+                self.count("in_flight", -1)
+                self.count("audio_seconds_total", stats.audio_seconds)
+                self.count("synthesis_seconds_total", stats.elapsed)
+                if exclusive:
+                    backend.lock.release()
+                self.slots.release()
+        finally:
+            self.admission.release()
+
+    def health(self):
+        with self.lock:
+            return {
+                "status": "ok",
+                "engines": sorted(self.backends),
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "queued": self.stats["queued"],
+                "in_flight": self.stats["in_flight"],
+            }
+
+    def metrics(self):
+        with self.lock:
+            metrics = dict(self.stats)
+        metrics["concurrency"] = self.concurrency
+        metrics["max_queue"] = self.max_queue
+        if metrics["synthesis_seconds_total"] > 0:
+            metrics["real_time_factor"] = metrics["synthesis_seconds_total"] / max(metrics["audio_seconds_total"], 1e-9)
+        return metrics
+
+
+class SynthesisRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+    def wants_prometheus(self):
+        # Prometheus scrapers ask for text/plain or OpenMetrics; browsers and curl keep getting JSON
+        accept = self.headers.get("Accept", "")
+        return "format=prometheus" in self.path or "text/plain" in accept or "openmetrics" in accept
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, self.service.health())
+        elif self.path.split("?")[0] == "/metrics":
+            if self.wants_prometheus():
+                body = REGISTRY.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_json(200, self.service.metrics())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/synthesize":
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                self.close_connection = True  # The body's extent is unknown, so the connection cannot be reused
+                raise ValueError("negative Content-Length")
+            if length > MAX_BODY_BYTES:
+                self.send_json(413, {"error": "request body too large"})
+                return
+            request = json.loads(self.rfile.read(length) or b"{}")
+            text = request["text"]
+            engine = request.get("engine", "kokoro")
+            voice = request.get("voice", "af_heart" if engine == "kokoro" else "tara")
+            speed = float(request.get("speed", 1.0))
+            lang_code = request.get("lang")
+            output_format = request.get("format", "wav")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {"error": f"invalid request: {str(e)}"})
+            return
+        if engine not in self.service.backends:
+            self.send_json(400, {"error": f"engine '{engine}' is not loaded"})
+            return
+        if output_format not in ("wav", "pcm"):
+            self.send_json(400, {"error": "format must be 'wav' or 'pcm'"})
+            return
+
+        sample_rate = self.service.backends[engine].sample_rate
+        chunks = self.service.synthesize(engine, text, voice, speed, lang_code)
+        if output_format == "wav":
+            try:
+                pcm = b"".join(chunks)
+            except QueueFull:
+                self.send_json(503, {"error": "queue full"}, {"Retry-After": "1"})
+                return
+            except RequestTimeout:
+                self.send_json(504, {"error": "request timed out"})
+                return
+            except Exception as e:
+                self.service.count("requests_failed")
+                self.send_json(500, {"error": str(e)})
+                return
+            body = self.service.output_format.pcm16_wav_bytes(pcm, sample_rate)
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/wav")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # Chunked raw PCM: the first chunk goes out as soon as the first segment is ready
+        try:
+            first = next(chunks, b"")
+        except QueueFull:
+            self.send_json(503, {"error": "queue full"}, {"Retry-After": "1"})
+            return
+        except RequestTimeout:
+            self.send_json(504, {"error": "request timed out"})
+            return
+        except Exception as e:
+            self.service.count("requests_failed")
+            self.send_json(500, {"error": str(e)})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("X-Sample-Format", "s16le")
+        self.send_header("X-Sample-Rate", str(sample_rate))
+        self.send_header("X-Channels", "1")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self.write_chunk(first)
+            for chunk in chunks:
+                self.write_chunk(chunk)
+        except RequestTimeout:
+            self.abort_stream()  # Headers are out; no terminating chunk, so the client sees a truncated body
+            return
+        except (BrokenPipeError, ConnectionResetError):
+            chunks.close()
+            return
+        except Exception as e:
+            self.service.count("requests_failed")
+            logging.error(f"Error while streaming: {str(e)}")
+            self.abort_stream()
+            return
+        self.wfile.write(b"0\r\n\r\n")
+
+    def abort_stream(self):
+        self.close_connection = True
+        self.wfile.flush()
+
+    def write_chunk(self, chunk):
+        if chunk:
+            self.wfile.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+
+
+def warm_up(backends, voices):
+    # Kokoro voices look like af_heart (language prefix first); anything else is taken as an Orpheus voice
+    kokoro_voices = [voice for voice in voices if "_" in voice]
+    orpheus_voices = [voice for voice in voices if "_" not in voice]
+    timings = []
+    for voice in kokoro_voices:
+        timings += backends["kokoro"].warm_up([voice], voice[0])
+    if orpheus_voices and "orpheus" in backends:
+        timings += backends["orpheus"].warm_up(orpheus_voices)
+    for voice, cold, warm in timings:
+        logging.info(f"Warmed up {voice}: cold {cold:.2f}s, warm {warm:.2f}s")
+
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    handler = type("BoundSynthesisRequestHandler", (SynthesisRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP synthesis server for BSBP TTS.")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (localhost only by default)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Requests synthesized at the same time (each engine still runs one request at a time)")
+    parser.add_argument("--max-queue", type=int, default=8, help="Requests admitted (waiting or running) before rejecting with 503")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--lang", default="a", help="Kokoro lang_code to warm up at startup")
+    parser.add_argument("--orpheus", action="store_true", help="Also load the Orpheus model")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the segment cache")
+    parser.add_argument("--warmup-voices", default="af_heart,tara",
+                        help="Comma-separated voices to warm up before accepting requests (empty to skip)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    start = time.time()
+    backends = {"kokoro": KokoroBackend(cache=None if args.no_cache else SegmentCache())}
+    backends["kokoro"].load(args.lang)
+    if args.orpheus:
+        backends["orpheus"] = OrpheusBackend()
+        backends["orpheus"].load()
+    logging.info(f"Loaded {', '.join(sorted(backends))} in {time.time() - start:.2f} seconds")
+    warm_up(backends, [voice for voice in args.warmup_voices.split(",") if voice])
+
+    service = SynthesisService(backends, args.concurrency, max(args.max_queue, args.concurrency), args.timeout)
+    server = make_server(service, args.host, args.port)
+    logging.info(f"WAV responses: {service.output_format.describe()}")
+    logging.info(f"Listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import time
+from PyQt6.QtCore import QObject, Qt, QTimer
+
+MIN_OVERLAY_SECONDS = 1.0
+
+
+# Measures GUI responsiveness: a timer that should fire every interval_ms records how late each tick
+# is. The largest delay is the longest time the event loop was blocked since the last reset.
+class EventLoopMonitor(QObject):
+    def __init__(self, interval_ms=20, parent=None):
+        super().__init__(parent)
+        self.interval_ms = interval_ms
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+        self.reset()
+
+    def start(self):
+        self.reset()
+        self.timer.start(self.interval_ms)
+
+    def stop(self):
+        self.timer.stop()
+
+    def reset(self):
+        self.last_tick = time.perf_counter()
+        self.started = self.last_tick
+        self.max_stall_ms = 0.0
+        self.ticks = 0
+
+    def tick(self):
+        now = time.perf_counter()
+        stall_ms = (now - self.last_tick) * 1000 - self.interval_ms
+        self.max_stall_ms = max(self.max_stall_ms, stall_ms)
+        self.last_tick = now
+        self.ticks += 1
+
+    def report(self):
+        return (f"UI responsiveness: max event-loop stall {self.max_stall_ms:.0f} ms "
+                f"over {time.perf_counter() - self.started:.1f} seconds")
@@ -0,0 +1,87 @@
+import os
+import time
+import multiprocessing
+import numpy as np
+
+from bsbp_tts_backends import KOKORO_REPO_ID, KokoroBackend
+from bsbp_tts_segmenter import DEFAULT_TARGET_TOKENS, pack_segments
+
+# Set in the parent before a fork so every worker maps the same (copy-on-write) weights
+_shared_registry = None
+_worker_backend = None
+
+
+def default_layout():
+    # (workers, threads per worker); two threads per forward pass is usually past the knee for Kokoro on CPU
+    cpus = os.cpu_count() or 1
+    threads = 2 if cpus >= 4 else 1
+    return max(1, cpus // threads), threads
+
+
+def _init_worker(repo_id, threads_per_worker):
+    global _worker_backend
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already set in this process
+    _worker_backend = KokoroBackend(repo_id=repo_id, registry=_shared_registry)
+
+
+def _synthesize(job):
+    index, text, voice, speed, lang_code, target_tokens = job
+    start = time.time()
+    parts = list(_worker_backend.synthesize(text, voice, speed, lang_code=lang_code, target_tokens=target_tokens))
+    audio = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+    return index, audio, time.time() - start
+
+
+# Shards Kokoro work (whole documents or the paragraphs of one document) across worker processes,
+# each with its own model and a fixed torch thread count. Results come back in submission order.
+# target_tokens is the segment packing target, as for KokoroBackend.
+class KokoroWorkerPool:
+    def __init__(self, workers=None, threads_per_worker=None, repo_id=KOKORO_REPO_ID, start_method=None, share_weights=True,
+                 target_tokens=DEFAULT_TARGET_TOKENS):
+        global _shared_registry
+        self.target_tokens = target_tokens
+        default_workers, default_threads = default_layout()
+        self.workers = workers or default_workers
+        self.threads_per_worker = threads_per_worker or default_threads
+        context = multiprocessing.get_context(start_method)
+        self.start_method = context.get_start_method()
+        if share_weights and self.start_method == "fork":
+            from bsbp_tts_pipelines import PipelineRegistry
+            _shared_registry = PipelineRegistry(repo_id=repo_id, device="cpu")
+            _shared_registry.load_model()
+        self.pool = context.Pool(self.workers, initializer=_init_worker, initargs=(repo_id, self.threads_per_worker))
+
+    def map(self, jobs):
+        # jobs: iterable of (text, voice, speed, lang_code); yields (audio, worker seconds) in order
+        indexed = ((index, text, voice, speed, lang_code, self.target_tokens)
+                   for index, (text, voice, speed, lang_code) in enumerate(jobs))
+        for index, audio, seconds in self.pool.imap(_synthesize, indexed):
+            yield audio, seconds
+
+    def synthesize(self, text, voice, speed=1.0, lang_code=None):
+        # Splits one document into packed segments, synthesizes them in parallel and yields them in order
+        jobs = [(segment, voice, speed, lang_code) for segment in pack_segments(text, self.target_tokens)]
+        for audio, seconds in self.map(jobs):
+            yield audio
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bsbp_tts_jobs
+from bsbp_tts_backends import FakeBackend
+from bsbp_tts_jobs import JobQueue, job_segments, run_queue
+
+WRAPPED = """It was the best of times, it was the worst of times, it was the age of
+wisdom, it was the age of foolishness, it was the epoch of belief, it was
+the epoch of incredulity.
+
+It was the season of Light, it was the season of Darkness."""
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    yield queue
+    queue.close()
+
+
+def test_hard_wrapped_lines_are_rejoined():
+    segments = job_segments(WRAPPED, 200)
+    assert segments[0].startswith("It was the best of times") and segments[0].endswith("epoch of incredulity.")
+    assert "age of wisdom" in segments[0]
+    assert segments[1] == "It was the season of Light, it was the season of Darkness."
+
+
+def test_total_segments_counts_packed_segments(jobs):
+    job_id = jobs.submit("fake", WRAPPED, "af_heart", segment_tokens=200)
+    assert jobs.progress(job_id) == (0, len(job_segments(WRAPPED, 200)))
+
+
+def test_render_writes_every_segment(jobs, tmp_path):
+    output_path = str(tmp_path / "out.wav")
+    job_id = jobs.submit("fake", WRAPPED, "af_heart", output_path=output_path, segment_tokens=200)
+    seen = []
+    assert run_queue(jobs, lambda engine: FakeBackend(), progress=lambda job, done, total: seen.append((done, total))) == 1
+    assert seen[-1] == (2, 2)
+    assert jobs.job(job_id)["status"] == "done"
+    assert os.path.getsize(output_path) > 44
+
+
+def test_waiting_for_the_backend_lock_keeps_the_job_owned(jobs, tmp_path, monkeypatch):
+    # A job queued behind a long interactive generation must not look abandoned to another process
+    monkeypatch.setattr(bsbp_tts_jobs, "HEARTBEAT_SECONDS", 0.05)
+    backend = FakeBackend()
+    job_id = jobs.submit("fake", WRAPPED, "af_heart", output_path=str(tmp_path / "out.wav"))
+    backend.lock.acquire()
+    worker = threading.Thread(target=run_queue, args=(jobs, lambda engine: backend))
+    worker.start()
+    try:
+        time.sleep(0.5)
+        other = JobQueue(str(tmp_path))
+        assert other.recover(stale_seconds=0.3) == 0
+        other.close()
+        assert jobs.job(job_id)["status"] == "running"
+    finally:
+        backend.lock.release()
+        worker.join()
+    assert jobs.job(job_id)["status"] == "done"
+
+
+def test_recover_requeues_jobs_of_dead_owners(jobs):
+    job_id = jobs.submit("fake", WRAPPED, "af_heart")
+    jobs.claim()
+    assert jobs.recover() == 0
+    jobs.execute("UPDATE jobs SET owner = ? WHERE id = ?", (2 ** 22 + 12345, job_id))
+    assert jobs.recover() == 1
+    assert jobs.job(job_id)["status"] == "queued"
+
+
+def test_priority_orders_claims_and_only_applies_to_queued_jobs(jobs):
+    first = jobs.submit("fake", "First.", "af_heart")
+    second = jobs.submit("fake", "Second.", "af_heart")
+    assert jobs.set_priority(second, 5)
+    assert jobs.claim()["id"] == second
+    assert not jobs.set_priority(second, 9)
+    assert jobs.claim()["id"] == first
+
+
+def test_cancel_queued_job(jobs):
+    job_id = jobs.submit("fake", WRAPPED, "af_heart")
+    assert jobs.cancel(job_id)
+    assert jobs.job(job_id)["status"] == "cancelled"
+    assert jobs.claim() is None
+    assert not jobs.cancel(job_id)
+
+
+def test_cancel_running_job_stops_it_and_the_queue_goes_on(jobs, tmp_path):
+    cancelled = jobs.submit("fake", WRAPPED, "af_heart", output_path=str(tmp_path / "a.wav"), segment_tokens=50)
+    kept = jobs.submit("fake", "Another job.", "af_heart", output_path=str(tmp_path / "b.wav"))
+    finished = []
+
+    def progress(job, done, total):
+        if job["id"] == cancelled and done == 1:
+            jobs.cancel(cancelled)  # As another process would, between two segments
+
+    run_queue(jobs, lambda engine: FakeBackend(), progress=progress,
+              finished=lambda job, output_path, error: finished.append((job["id"], error)))
+    assert finished == [(cancelled, "cancelled"), (kept, None)]
+    assert jobs.job(cancelled)["status"] == "cancelled"
+    assert jobs.completed_segments(cancelled) == {}
+    assert not os.path.exists(tmp_path / "a.wav")
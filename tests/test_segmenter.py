@@ -0,0 +1,91 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bsbp_tts_segmenter import estimate_tokens, pack_segments, sentences
+
+CHAPTER = """It was the best of times, it was the worst of times, it was the age of
+wisdom, it was the age of foolishness, it was the epoch of belief, it was
+the epoch of incredulity.
+
+It was the season of Light, it was the season of Darkness, it was the spring
+of hope, it was the winter of despair.
+
+We had everything before us, we had nothing before us. We were all going direct
+to Heaven, we were all going direct the other way."""
+
+
+@pytest.mark.parametrize("text", [
+    "Dr. Smith met Mrs. Jones at the station.",
+    "We compared apples vs. oranges, e.g. the red ones.",
+    "Call Prof. Brown before the meeting.",
+])
+def test_abbreviations_do_not_end_sentences(text):
+    assert sentences(text) == [text]
+
+
+def test_initials_and_acronyms_do_not_end_sentences():
+    assert sentences("J. R. R. Tolkien met the U.S. Army at 9 a.m. on Monday. Then he slept.") == [
+        "J. R. R. Tolkien met the U.S. Army at 9 a.m. on Monday.", "Then he slept."]
+
+
+def test_decimals_and_numbers_stay_whole():
+    assert sentences("Pi is about 3.14159 and e is 2.718. Both are irrational.") == [
+        "Pi is about 3.14159 and e is 2.718.", "Both are irrational."]
+
+
+def test_list_markers_are_kept_with_their_item():
+    assert sentences("1. Buy milk\n2. Walk the dog\na) First point") == [
+        "1. Buy milk.", "2. Walk the dog.", "a) First point."]
+
+
+def test_hard_wrapped_lines_are_rejoined():
+    first = sentences(CHAPTER)[0]
+    assert first.startswith("It was the best of times") and first.endswith("the epoch of incredulity.")
+    assert "age of wisdom" in first
+
+
+def test_short_lines_stand_on_their_own():
+    assert sentences("Chapter One\nThe Beginning\nIt was a dark night.") == [
+        "Chapter One.", "The Beginning.", "It was a dark night."]
+
+
+def test_cjk_sentences():
+    assert sentences("今日は晴れです。明日は雨でしょう！本当ですか？") == ["今日は晴れです。", "明日は雨でしょう！", "本当ですか？"]
+    assert pack_segments("你好世界") == ["你好世界。"]
+
+
+def test_segments_stay_near_the_target():
+    text = " ".join(["This is a fairly ordinary sentence that keeps going for a while."] * 40)
+    segments = pack_segments(text, 200, 400)
+    assert len(segments) > 1
+    assert all(estimate_tokens(segment) <= 200 for segment in segments)
+    assert " ".join(segments) == text
+
+
+def test_never_packs_across_paragraphs():
+    assert pack_segments("Hello there. This is paragraph one.\n\nSecond paragraph here. Done.", 200) == [
+        "Hello there. This is paragraph one.", "Second paragraph here. Done."]
+
+
+def test_edit_only_moves_boundaries_in_its_own_paragraph():
+    before = pack_segments(CHAPTER, 60)
+    after = pack_segments(CHAPTER.replace("season of Light", "season of bright Light"), 60)
+    changed = [segment for segment in after if segment not in before]
+    assert changed and all("season of" in segment or "spring" in segment or "winter" in segment for segment in changed)
+    paragraphs = CHAPTER.split("\n\n")
+    first, last = pack_segments(paragraphs[0], 60), pack_segments(paragraphs[2], 60)
+    assert after[:len(first)] == before[:len(first)] == first
+    assert after[-len(last):] == before[-len(last):] == last
+
+
+def test_long_unterminated_run_gets_no_lone_full_stop():
+    segments = pack_segments("a" * 2000, 200, 400)
+    assert all(segment != "." for segment in segments)
+    assert segments[-1].endswith("a.")
+    assert "".join(segments) == "a" * 2000 + "."
+
+
+def test_one_segment_per_line_when_target_is_zero():
+    assert pack_segments("One.\n\nTwo\nThree", 0) == ["One.", "Two", "Three"]
@@ -0,0 +1,191 @@
+import io
+import os
+import sys
+import json
+import time
+import wave
+import threading
+import http.client
+import pytest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bsbp_tts_backends import FakeBackend, KokoroBackend, OrpheusBackend, TTSBackend
+from bsbp_tts_metrics import CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE
+from bsbp_tts_server import SynthesisService, make_server
+
+TEXT = "Hello there. This is a short test of the synthesis server."
+
+
+@pytest.fixture
+def serve():
+    # serve(backend, **service options) -> (service, port); every server is shut down after the test
+    servers = []
+
+    def start(backend=None, **options):
+        service = SynthesisService({"kokoro": backend or FakeBackend()}, **options)
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return service, server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response, data
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+def test_wav_response(serve):
+    service, port = serve()
+    response, data = request(port, "POST", "/synthesize", {"text": TEXT})
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "audio/wav"
+    with wave.open(io.BytesIO(data)) as wf:
+        assert wf.getframerate() == FakeBackend.sample_rate
+        assert wf.getsampwidth() == 2
+        assert wf.getnframes() > 0
+    assert service.metrics()["requests_ok"] == 1
+
+
+def test_chunked_pcm_response(serve):
+    service, port = serve()
+    response, data = request(port, "POST", "/synthesize", {"text": TEXT, "format": "pcm"})
+    assert response.status == 200
+    assert response.getheader("Transfer-Encoding") == "chunked"
+    assert response.getheader("X-Sample-Format") == "s16le"
+    assert response.getheader("X-Sample-Rate") == str(FakeBackend.sample_rate)
+    assert len(data) > 0 and len(data) % 2 == 0
+
+
+def test_rejects_past_max_queue(serve):
+    service, port = serve(FakeBackend(first_chunk_seconds=1.0), concurrency=1, max_queue=1)
+    first = threading.Thread(target=request, args=(port, "POST", "/synthesize", {"text": TEXT}))
+    first.start()
+    wait_for(lambda: service.health()["in_flight"] == 1)
+    response, data = request(port, "POST", "/synthesize", {"text": TEXT})
+    first.join()
+    assert response.status == 503
+    assert response.getheader("Retry-After") == "1"
+    assert service.metrics()["requests_rejected"] == 1
+
+
+def test_times_out_during_synthesis(serve):
+    # The deadline cancels the request's token, so synthesis stops mid-utterance instead of running on
+    backend = FakeBackend(real_time_factor=1.0, chunk_seconds=0.2)
+    service, port = serve(backend, timeout=0.3)
+    start = time.time()
+    response, data = request(port, "POST", "/synthesize", {"text": TEXT * 4})
+    assert response.status == 504
+    assert time.time() - start < 2.0
+    assert service.metrics()["requests_timed_out"] == 1
+    wait_for(lambda: service.health()["in_flight"] == 0)
+
+
+def test_health(serve):
+    service, port = serve()
+    response, data = request(port, "GET", "/health")
+    assert response.status == 200
+    health = json.loads(data)
+    assert health["status"] == "ok"
+    assert health["engines"] == ["kokoro"]
+    assert health["queued"] == 0 and health["in_flight"] == 0
+
+
+def test_metrics_json(serve):
+    service, port = serve()
+    request(port, "POST", "/synthesize", {"text": TEXT})
+    response, data = request(port, "GET", "/metrics")
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "application/json"
+    metrics = json.loads(data)
+    assert metrics["requests_total"] == 1
+    assert metrics["requests_ok"] == 1
+    assert metrics["audio_seconds_total"] > 0
+
+
+@pytest.mark.parametrize("path, headers", [("/metrics?format=prometheus", {}), ("/metrics", {"Accept": "text/plain"})])
+def test_metrics_prometheus(serve, path, headers):
+    service, port = serve()
+    request(port, "POST", "/synthesize", {"text": TEXT})
+    response, data = request(port, "GET", path, headers=headers)
+    assert response.status == 200
+    assert response.getheader("Content-Type") == PROMETHEUS_CONTENT_TYPE
+    text = data.decode("utf-8")
+    assert "# TYPE bsbp_tts_server_requests_total counter" in text
+    assert 'bsbp_tts_server_requests_total{outcome="ok"}' in text
+
+
+def test_rejects_negative_content_length(serve):
+    service, port = serve()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.putrequest("POST", "/synthesize")
+    connection.putheader("Content-Length", "-1")
+    connection.endheaders()
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    assert response.status == 400
+
+
+def test_truncated_pcm_stream_has_no_terminator(serve):
+    # A timeout after the headers are out must not look like a complete chunked body
+    backend = FakeBackend(real_time_factor=1.0, chunk_seconds=0.1)
+    service, port = serve(backend, timeout=0.5)
+    with pytest.raises(http.client.IncompleteRead):
+        request(port, "POST", "/synthesize", {"text": TEXT * 4, "format": "pcm"})
+    assert service.metrics()["requests_timed_out"] == 1
+
+
+# Stands in for a model that breaks when two threads use it at once (KPipeline, the shared vLLM
+# engine): it fails any call that starts while another is still producing audio
+class ThreadUnsafeBackend(TTSBackend):
+    def __init__(self, capabilities):
+        super().__init__()
+        self.capabilities = capabilities
+        self.busy = False
+        self.calls = 0
+
+    def synthesize(self, text, voice, speed=1.0, token=None, **options):
+        if self.busy:
+            raise RuntimeError("entered concurrently")
+        self.busy = True
+        try:
+            for _ in range(3):
+                time.sleep(0.1)
+                yield np.zeros(2400, dtype=np.float32)
+        finally:
+            self.busy = False
+            self.calls += 1
+
+
+@pytest.mark.parametrize("engine_class", [KokoroBackend, OrpheusBackend])
+def test_real_engines_run_one_request_at_a_time(serve, engine_class):
+    backend = ThreadUnsafeBackend(engine_class.capabilities)
+    service, port = serve(backend, concurrency=3)
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(request(port, "POST", "/synthesize", {"text": TEXT})[0].status))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert responses == [200, 200, 200]
+    assert backend.calls == 3
+    assert service.metrics()["requests_ok"] == 3